@@ -10,56 +10,73 @@ shawn.s.murdzek@noaa.gov
 
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import matplotlib.colors as mcolors
 import pandas as pd
 import numpy as np
 import datetime as dt
 import copy
+import os
 
 import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import metplus_OSSE_scripts.plotting.metplus_profile as mprof
+
+
+#---------------------------------------------------------------------------------------------------
+# Output File Names
+#---------------------------------------------------------------------------------------------------
+
+# End of the output file name for each plotting function (the plot_param values are added to the
+# start of the file name by output_fname())
+PLOT_FNAME_FMT = {'plot_sfc_timeseries':'{plot_stat}_{fcst_lead}hr_{out_tag}_timeseries.png',
+                  'plot_sfc_dieoff':'{plot_stat}_{out_tag}_dieoff.png',
+                  'plot_ua_vprof':'{plot_stat}_{fcst_lead}hr_{out_tag}_vprof.png',
+                  'plot_sawtooth':'{plot_stat}_{out_tag}_{verif_type}_sawtooth.png',
+                  'plot_pct_diffs':'{plot_stat}_{out_tag}_pct_diff.png',
+                  'plot_scorecard':'{out_tag}_scorecard.png'}
 
 
 #---------------------------------------------------------------------------------------------------
 # Functions
 #---------------------------------------------------------------------------------------------------
 
-def diff_plot_prep(input_sims, diff_kw, line_type):
+def output_fname(plot_param, suffix, out_dir=None):
     """
-    Determine the name of the ctrl simulation and add line_type to diff_kw
+    Create the output file name for a plot
 
     Parameters
     ----------
-    input_sims : Dictionary
-        METplus output files. Key is simulation name (used in the legend). The value is another
-        dictionary containing 'dir' (METplus output directory), 'color', and 'ctrl'.
-    diff_kw : Dictionary
-        Keyword arguments passed to compute_stats_diff()
-    line_type : String
-        METplus line type
+    plot_param : dictionary
+        Parameters used to select which rows from the MET output to plot. The values are added to 
+        the start of the file name.
+    suffix : String
+        End of the file name (e.g., 'RMSE_6hr_tag_timeseries.png'). See PLOT_FNAME_FMT.
+    out_dir : String, optional
+        Output directory. Set to None to use the current working directory.
 
     Returns
     -------
-    ctrl_name : String
-        Name of the control simulation
-    diff_kw : Dictionary
-        Keyword arguments passed to compute_stats_diff() with line_type added
+    output_file : String
+        Output file name
 
     """
 
-    for sim in input_sims:
-        if input_sims[sim]['ctrl']:
-            ctrl_name = sim
-    if 'compute_kw' not in diff_kw:
-        diff_kw['compute_kw'] = {}
-    diff_kw['compute_kw']['line_type'] = line_type
+    param_str = ''
+    for k in plot_param.keys():
+        param_str = param_str + f'{plot_param[k]}_'
+    output_file = f"{param_str}{suffix}"
+    if out_dir is not None:
+        output_file = os.path.join(out_dir, output_file)
 
-    return ctrl_name, diff_kw
+    return output_file
 
 
+@mprof.timed()
 def plot_sfc_timeseries(input_sims, valid_times, fcst_lead=6, file_prefix='point_stat', 
                         line_type='sl1l2', diffs=False, include_ctrl=True, diff_kw={},
                         plot_param={'FCST_VAR':'TMP', 'FCST_LEV':'Z2', 'OBTYPE':'ADPSFC'},
                         plot_stat='RMSE', toggle_pts=True, out_tag='', verbose=False,
-                        ax=None, include_zero=False, figsize=(8, 6)):
+                        ax=None, include_zero=False, figsize=(8, 6), read_kw={}, session=None,
+                        out_dir=None):
     """
     Plot time series for surface verification
 
@@ -67,7 +84,9 @@ def plot_sfc_timeseries(input_sims, valid_times, fcst_lead=6, file_prefix='point
     ----------
     input_sims : Dictionary
         METplus output files. Key is simulation name (used in the legend). The value is another
-        dictionary containing 'dir' (METplus output directory), 'color', and 'ctrl'.
+        dictionary containing 'dir' (METplus output directory), 'color', and 'ctrl'. Dictionary can
+        also contain 'catalog' (MET output catalog created by mt.build_catalog()), which is used
+        instead of 'dir' to find the MET output files.
     valid_times : List of dt.datetime objects
         Forecast valid times
     fcst_lead : Integer, optional
@@ -99,6 +118,15 @@ def plot_sfc_timeseries(input_sims, valid_times, fcst_lead=6, file_prefix='point
         Option to include and bold the y = 0 line
     figsize : Tuple, optional
         Figure size
+    read_kw : Dictionary, optional
+        Additional keyword arguments passed to mt.read_ascii() (e.g., cache options). By default,
+        rows that do not match plot_param are removed when reading the MET output. Set 
+        read_kw['filters'] to override this behavior.
+    session : mt.VerifSession, optional
+        Shared MET output session. MET output files that have already been read by another plot 
+        are reused. Set to None to read the MET output files in this function.
+    out_dir : String, optional
+        Directory where the plot is saved. Set to None to use the current working directory.
 
     Returns
     -------
@@ -116,31 +144,31 @@ def plot_sfc_timeseries(input_sims, valid_times, fcst_lead=6, file_prefix='point
 
     # If computing differences, determine control simulation name and add line_type to diff_kw
     if diffs:
-        ctrl_name, diff_kw = diff_plot_prep(input_sims, diff_kw, line_type)
+        ctrl_name, diff_kw = mt.diff_plot_prep(input_sims, diff_kw, line_type)
 
-    # Read in data
+    # Read in data. Rows that are not plotted are removed as the MET output is read
+    read_kw_local = mt.read_kw_prep(input_sims, plot_param_local, read_kw, line_type, 
+                                    session=session)
     verif_df = {}
     for key in input_sims.keys():
-        fnames = ['%s/%s_%02d0000L_%sV_%s.txt' %
-                  (input_sims[key]['dir'], file_prefix, fcst_lead, t.strftime('%Y%m%d_%H%M%S'), line_type) for t in
-                  valid_times]
-        verif_df[key] = mt.read_ascii(fnames, verbose=verbose)
+        fnames = mt.met_fnames(input_sims[key], file_prefix, [fcst_lead]*len(valid_times), 
+                               valid_times, line_type)
+        verif_df[key] = mt.read_met_output(fnames, read_kw_local, verbose=verbose, session=session)
 
         # Compute derived statistics
         if diffs and (key != ctrl_name):
             verif_df[key] = mt.compute_stats_diff(verif_df[key], verif_df[ctrl_name], **diff_kw)
         else:
-            verif_df[key] = mt.compute_stats(verif_df[key], line_type=line_type)
+            verif_df[key] = mt.compute_stats(verif_df[key], line_type=line_type, stats=[plot_stat])
 
     # Make plot
     save = False
     if ax == None:
         fig, ax = plt.subplots(nrows=1, ncols=1, figsize=figsize)
         save = True
-        param_str = ''
-        for k in plot_param_local.keys():
-            param_str = param_str + f'{plot_param_local[k]}_'
-        output_file = f"{param_str}{plot_stat}_{fcst_lead}hr_{out_tag}_timeseries.png"
+        suffix = PLOT_FNAME_FMT['plot_sfc_timeseries'].format(plot_stat=plot_stat, 
+                                                              fcst_lead=fcst_lead, out_tag=out_tag)
+        output_file = output_fname(plot_param_local, suffix, out_dir=out_dir)
     for key in input_sims.keys():
         if diffs and not include_ctrl and (key == ctrl_name): continue
         if 'ls' not in input_sims[key].keys(): input_sims[key]['ls'] = '-'
@@ -148,14 +176,20 @@ def plot_sfc_timeseries(input_sims, valid_times, fcst_lead=6, file_prefix='point
         if verbose: print(f"\nin plot_sfc_timeseries(). Sim = {key}")
         if verbose: print(f"len(plot_df) = {len(plot_df)}")
         ylabel = f"{plot_df['FCST_LEV'].values[0]} {plot_df['FCST_VAR'].values[0]} {plot_stat} ({plot_df['FCST_UNITS'].values[0]})"
+
+        # Match each row to its valid time. Valid times without MET output are NaN
+        cube = mt.build_cube(plot_df, dims=['FCST_VALID_BEG'], fields=[plot_stat], 
+                             coords={'FCST_VALID_BEG':[t.strftime('%Y%m%d_%H%M%S') 
+                                                       for t in valid_times]})
+        yplot = cube.fields[plot_stat]
         if toggle_pts:
-            ax.plot(valid_times, plot_df[plot_stat], linestyle=input_sims[key]['ls'], marker='o', 
+            ax.plot(valid_times, yplot, linestyle=input_sims[key]['ls'], marker='o', 
                     c=input_sims[key]['color'], 
-                    label='%s (mean = %.6f)' % (key, np.mean(plot_df[plot_stat])))
+                    label='%s (mean = %.6f)' % (key, np.nanmean(yplot)))
         else:
-            ax.plot(valid_times, plot_df[plot_stat], linestyle=input_sims[key]['ls'], 
+            ax.plot(valid_times, yplot, linestyle=input_sims[key]['ls'], 
                     c=input_sims[key]['color'],
-                    label='%s (mean = %.6f)' % (key, np.mean(plot_df[plot_stat])))
+                    label='%s (mean = %.6f)' % (key, np.nanmean(yplot)))
     if plot_stat == 'TOTAL':
         ax.set_ylabel('number', size=14)
     else:
@@ -174,19 +208,22 @@ def plot_sfc_timeseries(input_sims, valid_times, fcst_lead=6, file_prefix='point
     ax.set_title(f"{fcst_lead}-hr Forecast\n{',  '.join(ttl_list)}", size=18)
 
     if save:
-        plt.savefig(output_file)
+        with mprof.stage('savefig'):
+            plt.savefig(output_file)
         return verif_df
     else:
         return verif_df, ax
 
 
+@mprof.timed()
 def plot_sfc_dieoff(input_sims, valid_times, fcst_lead=[0, 1, 2, 3, 6, 12], 
                     file_prefix='point_stat', line_type='sl1l2', 
                     diffs=False, include_ctrl=True, diff_kw={},
                     plot_param={'FCST_VAR':'TMP', 'FCST_LEV':'Z2', 'OBTYPE':'ADPSFC'}, 
                     plot_stat='RMSE', toggle_pts=True, out_tag='', 
                     verbose=False, ax=None, ci=False, ci_lvl=0.95, ci_opt='t_dist', ci_kw={},
-                    mean_legend=True, include_zero=False, figsize=(8, 6)):
+                    mean_legend=True, include_zero=False, figsize=(8, 6), read_kw={}, session=None,
+                    out_dir=None):
     """
     Plot die-off curves for surface verification
 
@@ -195,8 +232,9 @@ def plot_sfc_dieoff(input_sims, valid_times, fcst_lead=[0, 1, 2, 3, 6, 12],
     input_sims : Dictionary
         METplus output files. Key is simulation name (used in the legend). The value is another
         dictionary containing 'dir' (METplus output directory) and 'color'. Dictionary can also
-        conatin 'subset', which overrides "OBTYPE" in plot_param, and 'prefix', which
-        overrides the "file_prefix" keyword argument.
+        conatin 'subset', which overrides "OBTYPE" in plot_param, 'prefix', which
+        overrides the "file_prefix" keyword argument, and 'catalog' (MET output catalog created by
+        mt.build_catalog()), which is used instead of 'dir' to find the MET output files.
     valid_times : List of dt.datetime objects
         Forecast valid times
     fcst_lead : List, optional
@@ -238,6 +276,15 @@ def plot_sfc_dieoff(input_sims, valid_times, fcst_lead=[0, 1, 2, 3, 6, 12],
         Option to include and bold the y = 0 line
     figsize : Tuple, optional
         Figure size
+    read_kw : Dictionary, optional
+        Additional keyword arguments passed to mt.read_ascii() (e.g., cache options). By default,
+        rows that do not match plot_param are removed when reading the MET output. Set 
+        read_kw['filters'] to override this behavior.
+    session : mt.VerifSession, optional
+        Shared MET output session. MET output files that have already been read by another plot 
+        are reused. Set to None to read the MET output files in this function.
+    out_dir : String, optional
+        Directory where the plot is saved. Set to None to use the current working directory.
 
     Returns
     -------
@@ -251,29 +298,32 @@ def plot_sfc_dieoff(input_sims, valid_times, fcst_lead=[0, 1, 2, 3, 6, 12],
 
     # If computing differences, determine control simulation name and add line_type to diff_kw
     if diffs:
-        ctrl_name, diff_kw = diff_plot_prep(input_sims, diff_kw, line_type)
+        ctrl_name, diff_kw = mt.diff_plot_prep(input_sims, diff_kw, line_type)
+
+    # Use the same bootstrap resample indices for all simulations
+    ci_kw_local = mt.ci_kw_prep(ci_opt, ci_kw)
 
-    # Read in data
+    # Read in data. Rows that are not plotted are removed as the MET output is read
+    read_kw_local = mt.read_kw_prep(input_sims, plot_param_local, read_kw, line_type, 
+                                    session=session)
     verif_df = {}
+    verif_idx = {}
     for key in input_sims.keys():
-        fnames = []
         if 'prefix' in input_sims[key].keys(): 
             file_prefix = input_sims[key]['prefix']
-        for t in valid_times:
-            for l in fcst_lead:
-                fnames.append('%s/%s_%02d0000L_%sV_%s.txt' %
-                              (input_sims[key]['dir'], file_prefix, l, t.strftime('%Y%m%d_%H%M%S'), line_type))
-        verif_df[key] = mt.read_ascii(fnames, verbose=verbose)
+        fnames = mt.met_fnames(input_sims[key], file_prefix, 
+                               [l for t in valid_times for l in fcst_lead],
+                               [t for t in valid_times for l in fcst_lead], line_type)
+        verif_df[key], verif_idx[key] = mt.read_met_output(fnames, read_kw_local, verbose=verbose, 
+                                                           session=session, indexed=True)
 
     # Make plot
     save = False
     if ax == None:
         fig, ax = plt.subplots(nrows=1, ncols=1, figsize=figsize)
         save = True
-        param_str = ''
-        for k in plot_param_local.keys():
-            param_str = param_str + f'{plot_param_local[k]}_'
-        output_file = f"{param_str}{plot_stat}_{out_tag}_dieoff.png"
+        suffix = PLOT_FNAME_FMT['plot_sfc_dieoff'].format(plot_stat=plot_stat, out_tag=out_tag)
+        output_file = output_fname(plot_param_local, suffix, out_dir=out_dir)
     for key in input_sims.keys():
         if diffs and not include_ctrl and (key == ctrl_name): continue
         if 'ls' not in input_sims[key].keys(): input_sims[key]['ls'] = '-'
@@ -284,23 +334,36 @@ def plot_sfc_dieoff(input_sims, valid_times, fcst_lead=[0, 1, 2, 3, 6, 12],
         ci_high = []
         if 'subset' in input_sims[key].keys(): 
             plot_param_local['OBTYPE'] = input_sims[key]['subset']
+
+        # Compute statistics for all forecast lead times at once
+        lead_param = {k:plot_param_local[k] for k in plot_param_local if k != 'FCST_LEAD'}
+        all_lead_df = mt.subset_verif_df(verif_idx[key], lead_param, copy=False)
+        ylabel = f"{all_lead_df['FCST_LEV'].values[0]} {all_lead_df['FCST_VAR'].values[0]} {plot_stat} ({all_lead_df['FCST_UNITS'].values[0]})"
+        if diffs and (key != ctrl_name):
+            all_lead_df_ctrl = mt.subset_verif_df(verif_idx[ctrl_name], lead_param, copy=False)
+            stats_df = mt.compute_stats_by_group(all_lead_df, ['FCST_LEAD'], all_lead_df_ctrl, 
+                                                 line_type=line_type, diff_kw=diff_kw, ci=ci, 
+                                                 ci_lvl=ci_lvl, ci_opt=ci_opt, ci_kw=ci_kw_local,
+                                                 ci_var=[plot_stat], stats=[plot_stat])
+        else:
+            stats_df = mt.compute_stats_by_group(all_lead_df, ['FCST_LEAD'], line_type=line_type, 
+                                                 ci=ci, ci_lvl=ci_lvl, ci_opt=ci_opt, ci_kw=ci_kw_local,
+                                                 ci_var=[plot_stat], stats=[plot_stat])
         for l in fcst_lead:
             plot_param_local['FCST_LEAD'] = l*1e4
-            red_df = mt.subset_verif_df(verif_df[key], plot_param_local)
-            ylabel = f"{red_df['FCST_LEV'].values[0]} {red_df['FCST_VAR'].values[0]} {plot_stat} ({red_df['FCST_UNITS'].values[0]})"
+            red_df = all_lead_df.loc[all_lead_df['FCST_LEAD'].values == l*1e4]
             if verbose: print(f"forecast lead = {l}, len(red_df) = {len(red_df)}")
-            if diffs and (key != ctrl_name):
-                red_df_ctrl = mt.subset_verif_df(verif_df[ctrl_name], plot_param_local)
-                stats_df = mt.compute_stats_entire_df(red_df, red_df_ctrl, line_type=line_type, 
-                                                      diff_kw=diff_kw, ci=ci, ci_lvl=ci_lvl,
-                                                      ci_opt=ci_opt, ci_kw=ci_kw)
-            else:
-                stats_df = mt.compute_stats_entire_df(red_df, line_type=line_type, ci=ci, ci_lvl=ci_lvl,
-                                                      ci_opt=ci_opt, ci_kw=ci_kw)
-            yplot.append(stats_df[plot_stat].values[0])
+            stats_1lead = stats_df.loc[stats_df['FCST_LEAD'].values == l*1e4]
+            if len(stats_1lead) == 0:
+                print(f"Warning: plot_sfc_dieoff: No statistics for forecast lead = {l}")
+                yplot.append(np.nan)
+                ci_low.append(np.nan)
+                ci_high.append(np.nan)
+                continue
+            yplot.append(stats_1lead[plot_stat].values[0])
             if ci:
-                ci_low.append(stats_df['low_%s' % plot_stat].values[0])
-                ci_high.append(stats_df['high_%s' % plot_stat].values[0])
+                ci_low.append(stats_1lead['low_%s' % plot_stat].values[0])
+                ci_high.append(stats_1lead['high_%s' % plot_stat].values[0])
         yplot = np.array(yplot)
         if mean_legend:
             llabel = '%s (mean = %.6f)' % (key, np.mean(yplot))
@@ -334,18 +397,21 @@ def plot_sfc_dieoff(input_sims, valid_times, fcst_lead=[0, 1, 2, 3, 6, 12],
     ax.set_title(f"Die-Off\n{',  '.join(ttl_list)}", size=18)
 
     if save:
-        plt.savefig(output_file)
+        with mprof.stage('savefig'):
+            plt.savefig(output_file)
         return verif_df, red_df
     else:
         return verif_df, ax
 
 
+@mprof.timed()
 def plot_ua_vprof(input_sims, valid_times, fcst_lead=6, file_prefix='point_stat', line_type='sl1l2', 
                   diffs=False, include_ctrl=True, diff_kw={},
                   plot_param={'FCST_VAR':'TMP', 'OBTYPE':'ADPUPA'}, plot_stat='RMSE', 
                   toggle_pts=True, out_tag='', 
                   exclude_plvl=[], verbose=False, ax=None, ci=False, ci_lvl=0.95, ci_opt='t_dist',
-                  ci_kw={}, mean_legend=True, ylim=[1050, 80], include_zero=False, figsize=(7, 7)):
+                  ci_kw={}, mean_legend=True, ylim=[1050, 80], include_zero=False, figsize=(7, 7),
+                  read_kw={}, session=None, out_dir=None):
     """
     Plot vertical profiles for upper-air verification
 
@@ -354,8 +420,9 @@ def plot_ua_vprof(input_sims, valid_times, fcst_lead=6, file_prefix='point_stat'
     input_sims : Dictionary
         METplus output files. Key is simulation name (used in the legend). The value is another
         dictionary containing 'dir' (METplus output directory) and 'color'. Dictionary can also
-        contain 'subset', which overrides "OBTYPE" in plot_param, and 'prefix', which
-        overrides the "file_prefix" keyword argument.
+        contain 'subset', which overrides "OBTYPE" in plot_param, 'prefix', which
+        overrides the "file_prefix" keyword argument, and 'catalog' (MET output catalog created by
+        mt.build_catalog()), which is used instead of 'dir' to find the MET output files.
         Optional keys for each simulation:
             ctrl: Whether this simulation is the control run (needed for differences)
             scale: Scalar that multiplies whatever is being plotted
@@ -404,6 +471,15 @@ def plot_ua_vprof(input_sims, valid_times, fcst_lead=6, file_prefix='point_stat'
         Option to include and bold the x = 0 line
     figsize : Tuple, optional
         Figure size
+    read_kw : Dictionary, optional
+        Additional keyword arguments passed to mt.read_ascii() (e.g., cache options). By default,
+        rows that do not match plot_param are removed when reading the MET output. Set 
+        read_kw['filters'] to override this behavior.
+    session : mt.VerifSession, optional
+        Shared MET output session. MET output files that have already been read by another plot 
+        are reused. Set to None to read the MET output files in this function.
+    out_dir : String, optional
+        Directory where the plot is saved. Set to None to use the current working directory.
 
     Returns
     -------
@@ -417,26 +493,32 @@ def plot_ua_vprof(input_sims, valid_times, fcst_lead=6, file_prefix='point_stat'
 
     # If computing differences, determine control simulation name and add line_type to diff_kw
     if diffs:
-        ctrl_name, diff_kw = diff_plot_prep(input_sims, diff_kw, line_type)
+        ctrl_name, diff_kw = mt.diff_plot_prep(input_sims, diff_kw, line_type)
+
+    # Use the same bootstrap resample indices for all simulations
+    ci_kw_local = mt.ci_kw_prep(ci_opt, ci_kw)
 
-    # Read in data
+    # Read in data. Rows that are not plotted are removed as the MET output is read
+    read_kw_local = mt.read_kw_prep(input_sims, plot_param_local, read_kw, line_type, 
+                                    session=session)
     verif_df = {}
+    verif_idx = {}
     for key in input_sims.keys():
         if 'prefix' in input_sims[key].keys(): 
             file_prefix = input_sims[key]['prefix']
-        fnames = ['%s/%s_%02d0000L_%sV_%s.txt' %
-                  (input_sims[key]['dir'], file_prefix, fcst_lead, t.strftime('%Y%m%d_%H%M%S'), line_type) for t in valid_times]
-        verif_df[key] = mt.read_ascii(fnames, verbose=verbose)
+        fnames = mt.met_fnames(input_sims[key], file_prefix, [fcst_lead]*len(valid_times), 
+                               valid_times, line_type)
+        verif_df[key], verif_idx[key] = mt.read_met_output(fnames, read_kw_local, verbose=verbose, 
+                                                           session=session, indexed=True)
 
     # Make plot
     save = False
     if ax == None:
         fig, ax = plt.subplots(nrows=1, ncols=1, figsize=figsize)
         save = True
-        param_str = ''
-        for k in plot_param_local.keys():
-            param_str = param_str + f'{plot_param_local[k]}_'
-        output_file = f"{param_str}{plot_stat}_{fcst_lead}hr_{out_tag}_vprof.png"
+        suffix = PLOT_FNAME_FMT['plot_ua_vprof'].format(plot_stat=plot_stat, fcst_lead=fcst_lead,
+                                                        out_tag=out_tag)
+        output_file = output_fname(plot_param_local, suffix, out_dir=out_dir)
     for key in input_sims.keys():
         if diffs and not include_ctrl and (key == ctrl_name): continue
 
@@ -446,7 +528,7 @@ def plot_ua_vprof(input_sims, valid_times, fcst_lead=6, file_prefix='point_stat'
         if 'subset' in input_sims[key].keys(): 
             plot_param_local['OBTYPE'] = input_sims[key]['subset']
 
-        red_df = mt.subset_verif_df(verif_df[key], plot_param_local)
+        red_df = mt.subset_verif_df(verif_idx[key], plot_param_local, copy=False)
         xlabel = f"{red_df['FCST_VAR'].values[0]} {plot_stat} ({red_df['FCST_UNITS'].values[0]})"
         prslev = [int(s[1:]) for s in np.unique(red_df['FCST_LEV'].values)]
         if len(exclude_plvl) > 0:
@@ -457,24 +539,27 @@ def plot_ua_vprof(input_sims, valid_times, fcst_lead=6, file_prefix='point_stat'
         xplot = np.zeros(prslev.shape)
         ci_low = np.zeros(prslev.shape)
         ci_high = np.zeros(prslev.shape)
+
+        # Compute statistics for all pressure levels at once
+        if diffs and (key != ctrl_name):
+            red_df_ctrl = mt.subset_verif_df(verif_idx[ctrl_name], plot_param_local, copy=False)
+            stats_df = mt.compute_stats_by_group(red_df, ['FCST_LEV'], red_df_ctrl, 
+                                                 line_type=line_type, diff_kw=diff_kw, ci=ci, 
+                                                 ci_lvl=ci_lvl, ci_opt=ci_opt, ci_kw=ci_kw_local, 
+                                                 ci_var=[plot_stat], stats=[plot_stat])
+        else:
+            stats_df = mt.compute_stats_by_group(red_df, ['FCST_LEV'], line_type=line_type, 
+                                                 ci=ci, ci_lvl=ci_lvl, ci_opt=ci_opt, ci_kw=ci_kw_local,
+                                                 ci_var=[plot_stat], stats=[plot_stat])
+        stats_df.index = stats_df['FCST_LEV'].astype(str).values
         for j, p in enumerate(prslev):
-            prs_df = red_df.loc[red_df['FCST_LEV'] == ('P%d' % p)]
-            if diffs and (key != ctrl_name):
-                prs_df_ctrl = mt.subset_verif_df(verif_df[ctrl_name], plot_param_local)
-                if f"P{p}" not in prs_df_ctrl['FCST_LEV'].unique():
-                    print(f"Skipping P{p}")
-                    continue
-                stats_df = mt.compute_stats_entire_df(prs_df, prs_df_ctrl, line_type=line_type, 
-                                                      diff_kw=diff_kw, ci=ci, ci_lvl=ci_lvl,
-                                                      ci_opt=ci_opt, ci_kw=ci_kw)
-            else:
-                stats_df = mt.compute_stats_entire_df(prs_df, line_type=line_type, ci=ci, 
-                                                      ci_lvl=ci_lvl,
-                                                      ci_opt=ci_opt, ci_kw=ci_kw)
-            xplot[j] = stats_df[plot_stat].values[0] * input_sims[key]['scale']
+            if ('P%d' % p) not in stats_df.index:
+                print(f"Skipping P{p}")
+                continue
+            xplot[j] = stats_df.loc['P%d' % p, plot_stat] * input_sims[key]['scale']
             if ci:
-                ci_low[j] = stats_df['low_%s' % plot_stat].values[0] * input_sims[key]['scale']
-                ci_high[j] = stats_df['high_%s' % plot_stat].values[0] * input_sims[key]['scale']
+                ci_low[j] = stats_df.loc['P%d' % p, 'low_%s' % plot_stat] * input_sims[key]['scale']
+                ci_high[j] = stats_df.loc['P%d' % p, 'high_%s' % plot_stat] * input_sims[key]['scale']
         if mean_legend:
             llabel = '%s (mean = %.6f)' % (key, np.mean(xplot))
         else:
@@ -509,17 +594,20 @@ def plot_ua_vprof(input_sims, valid_times, fcst_lead=6, file_prefix='point_stat'
     ax.set_title(f"{fcst_lead}-hr Forecast\n{',  '.join(ttl_list)}", size=18)
 
     if save:
-        plt.savefig(output_file)
+        with mprof.stage('savefig'):
+            plt.savefig(output_file)
         return verif_df
     else:
         return verif_df, ax
 
 
+@mprof.timed()
 def plot_sawtooth(input_sims, init_times, fcst_lead=[0, 1], verif_type='sfc', 
                   file_prefix='point_stat', line_type='sl1l2', 
                   plot_param={'FCST_VAR':'TMP', 'OBTYPE':'ADPSFC'},
                   plot_lvl1='Z2', plot_lvl2='Z2', plot_stat='RMSE', toggle_pts=True, out_tag='', 
-                  verbose=False, include_zero=False, figsize=(8, 6)):
+                  verbose=False, include_zero=False, figsize=(8, 6), read_kw={}, session=None,
+                  out_dir=None):
     """
     Plot sawtooth diagrams for surface or upper-air verification
 
@@ -527,7 +615,9 @@ def plot_sawtooth(input_sims, init_times, fcst_lead=[0, 1], verif_type='sfc',
     ----------
     input_sims : Dictionary
         METplus output files. Key is simulation name (used in the legend). The value is another
-        dictionary containing 'dir' (METplus output directory) and 'color'.
+        dictionary containing 'dir' (METplus output directory) and 'color'. Dictionary can also
+        contain 'catalog' (MET output catalog created by mt.build_catalog()), which is used
+        instead of 'dir' to find the MET output files.
     init_times : List of dt.datetime objects
         Forecast initialization times
     fcst_lead : List of Integers, optional
@@ -558,6 +648,15 @@ def plot_sawtooth(input_sims, init_times, fcst_lead=[0, 1], verif_type='sfc',
         Option to include and bold the y = 0 line
     figsize : Tuple, optional
         Figure size
+    read_kw : Dictionary, optional
+        Additional keyword arguments passed to mt.read_ascii() (e.g., cache options). By default,
+        rows that do not match plot_param are removed when reading the MET output. Set 
+        read_kw['filters'] to override this behavior.
+    session : mt.VerifSession, optional
+        Shared MET output session. MET output files that have already been read by another plot 
+        are reused. Set to None to read the MET output files in this function.
+    out_dir : String, optional
+        Directory where the plot is saved. Set to None to use the current working directory.
 
     Returns
     -------
@@ -569,24 +668,25 @@ def plot_sawtooth(input_sims, init_times, fcst_lead=[0, 1], verif_type='sfc',
     # Make a copy of plot_param
     plot_param_local = copy.deepcopy(plot_param)
 
-    param_str = ''
-    for k in plot_param_local.keys():
-        param_str = param_str + f'{plot_param_local[k]}_'
-    output_file = f"{param_str}{plot_stat}_{out_tag}_{verif_type}_sawtooth.png"
+    suffix = PLOT_FNAME_FMT['plot_sawtooth'].format(plot_stat=plot_stat, out_tag=out_tag, 
+                                                    verif_type=verif_type)
+    output_file = output_fname(plot_param_local, suffix, out_dir=out_dir)
 
-    # Read in data
+    # Read in data. Rows that are not plotted are removed as the MET output is read
+    read_kw_local = mt.read_kw_prep(input_sims, plot_param_local, read_kw, line_type, 
+                                    session=session)
     verif_df = {}
     for key in input_sims.keys():
         verif_df[key] = {}
         for itime in init_times:
             vtimes = [itime + dt.timedelta(hours=fl) for fl in fcst_lead]
-            fnames = ['%s/%s_%02d0000L_%sV_%s.txt' %
-                      (input_sims[key]['dir'], file_prefix, fl, t.strftime('%Y%m%d_%H%M%S'), line_type)
-                      for t, fl in zip(vtimes, fcst_lead)]
-            verif_df[key][itime] = mt.read_ascii(fnames, verbose=verbose)
+            fnames = mt.met_fnames(input_sims[key], file_prefix, fcst_lead, vtimes, line_type)
+            verif_df[key][itime] = mt.read_met_output(fnames, read_kw_local, verbose=verbose, 
+                                                      session=session)
 
             # Compute derived statistics
-            verif_df[key][itime] = mt.compute_stats(verif_df[key][itime], line_type=line_type)
+            verif_df[key][itime] = mt.compute_stats(verif_df[key][itime], line_type=line_type,
+                                                    stats=[plot_stat])
 
     # Make plot
     fig, ax = plt.subplots(nrows=1, ncols=1, figsize=figsize)
@@ -600,7 +700,7 @@ def plot_sawtooth(input_sims, init_times, fcst_lead=[0, 1], verif_type='sfc',
                 plot_df = mt.compute_stats_vert_avg(tmp_df, vcoord=plot_lvl1[0],
                                                     vmin=float(plot_lvl1[1:]),
                                                     vmax=float(plot_lvl2[1:]),
-                                                    line_type=line_type)
+                                                    line_type=line_type, stats=[plot_stat])
             xplot = [dt.datetime.strptime(t, '%Y%m%d_%H%M%S') for t in plot_df['FCST_VALID_BEG']]
             if toggle_pts:
                 lead = [t for t in plot_df['FCST_LEAD']]
@@ -634,14 +734,17 @@ def plot_sawtooth(input_sims, init_times, fcst_lead=[0, 1], verif_type='sfc',
     ttl_list = [f'{k}: {plot_param_local[k]}' for k in param_key]
     ax.set_title(',  '.join(ttl_list), size=18)
 
-    plt.savefig(output_file)
+    with mprof.stage('savefig'):
+        plt.savefig(output_file)
 
     return verif_df
 
 
+@mprof.timed()
 def plot_pct_diffs(verif_df_list, xvals, xlabel, plot_stat='RMSE', out_tag='', 
                    verbose=False, ax=None, ci=False, ci_lvl=0.95, ci_opt='bootstrap', ci_kw={},
-                   figsize=(8, 6), plot_pct_diff_kw={}, plot_ci_kw={}, include_ctrl=True):
+                   figsize=(8, 6), plot_pct_diff_kw={}, plot_ci_kw={}, include_ctrl=True,
+                   out_dir=None):
     """
     Plot percent differences
 
@@ -679,6 +782,8 @@ def plot_pct_diffs(verif_df_list, xvals, xlabel, plot_stat='RMSE', out_tag='',
         Option to include ctrl run (first DataFrame in verif_df_list) in plot.
         If True, len(xvals) = len(verif_df_list)
         If False, len(xvals) = len(verif_df_list) - 1
+    out_dir : String, optional
+        Directory where the plot is saved. Set to None to use the current working directory.
 
     Returns
     -------
@@ -719,7 +824,8 @@ def plot_pct_diffs(verif_df_list, xvals, xlabel, plot_stat='RMSE', out_tag='',
     if ax == None:
         fig, ax = plt.subplots(nrows=1, ncols=1, figsize=figsize)
         save = True
-        output_file = f"{plot_stat}_{out_tag}_pct_diff.png"
+        suffix = PLOT_FNAME_FMT['plot_pct_diffs'].format(plot_stat=plot_stat, out_tag=out_tag)
+        output_file = output_fname({}, suffix, out_dir=out_dir)
     ax.plot(xvals, pct_diff, **plot_pct_diff_kw)
     if ci:
         for i, x in enumerate(xvals):
@@ -730,7 +836,8 @@ def plot_pct_diffs(verif_df_list, xvals, xlabel, plot_stat='RMSE', out_tag='',
     ax.set_ylabel(f'{plot_stat} % difference', size=14)
 
     if save:
-        plt.savefig(output_file)
+        with mprof.stage('savefig'):
+            plt.savefig(output_file)
     
     if ci:
         return pct_diff, ci_sorted
@@ -738,6 +845,90 @@ def plot_pct_diffs(verif_df_list, xvals, xlabel, plot_stat='RMSE', out_tag='',
         return pct_diff
 
 
+
+@mprof.timed()
+def plot_scorecard(scorecard, row_keys=['FCST_VAR', 'FCST_LEV', 'VX_MASK', 'stat'], 
+                   col_keys=['sim', 'FCST_LEAD'], annotate=True, ctrl_name='ctrl', out_tag='', 
+                   figsize=None, out_dir=None):
+    """
+    Plot a scorecard showing where experiments are significantly better or worse than the control
+
+    Parameters
+    ----------
+    scorecard : pd.DataFrame
+        Scorecard from mt.compute_scorecard()
+    row_keys : list of strings, optional
+        Scorecard columns used to define each row of the table. Keys that are not in scorecard 
+        are ignored.
+    col_keys : list of strings, optional
+        Scorecard columns used to define each column of the table
+    annotate : Boolean, optional
+        Option to print the mean difference in each cell
+    ctrl_name : String, optional
+        Name of the control simulation (used in the title)
+    out_tag : String, optional
+        String to add to the output file
+    figsize : Tuple, optional
+        Figure size. Set to None to scale the figure size with the number of rows and columns.
+    out_dir : String, optional
+        Directory where the plot is saved. Set to None to use the current working directory.
+
+    Returns
+    -------
+    table : pd.DataFrame
+        Score for each cell in the table (1 = significantly better, -1 = significantly worse, 
+        0 = not significant, NaN = missing)
+
+    """
+
+    row_keys = [k for k in row_keys if k in scorecard.columns]
+    table = scorecard.pivot_table(index=row_keys, columns=col_keys, values='score', 
+                                  aggfunc='first', sort=False)
+    diff = scorecard.pivot_table(index=row_keys, columns=col_keys, values='diff', 
+                                 aggfunc='first', sort=False).loc[table.index, table.columns]
+    nrow, ncol = table.shape
+    if figsize is None:
+        figsize = (max(6, 1 + 0.9 * ncol), max(4, 1.5 + 0.3 * nrow))
+
+    suffix = PLOT_FNAME_FMT['plot_scorecard'].format(out_tag=out_tag)
+    output_file = output_fname({}, suffix, out_dir=out_dir)
+
+    # Red = significantly worse, gray = not significant, green = significantly better
+    cmap = mcolors.ListedColormap(['tab:red', 'whitesmoke', 'tab:green'])
+    cmap.set_bad('white')
+    norm = mcolors.BoundaryNorm([-1.5, -0.5, 0.5, 1.5], cmap.N)
+
+    fig, ax = plt.subplots(nrows=1, ncols=1, figsize=figsize)
+    ax.pcolormesh(np.ma.masked_invalid(table.to_numpy(dtype=float)), cmap=cmap, norm=norm, 
+                  edgecolors='k', linewidth=0.5)
+    if annotate:
+        for i in range(nrow):
+            for j in range(ncol):
+                if np.isfinite(diff.iloc[i, j]):
+                    ax.text(j + 0.5, i + 0.5, '%.3g' % diff.iloc[i, j], ha='center', 
+                            va='center', size=7)
+
+    # Forecast lead times are labeled in hours
+    def label(keys, vals):
+        vals = vals if isinstance(vals, tuple) else (vals,)
+        return ' '.join([f'{int(v / 1e4)}hr' if k == 'FCST_LEAD' else str(v) 
+                         for k, v in zip(keys, vals)])
+    ax.set_yticks(np.arange(nrow) + 0.5)
+    ax.set_yticklabels([label(row_keys, v) for v in table.index], size=8)
+    ax.set_xticks(np.arange(ncol) + 0.5)
+    ax.set_xticklabels([label(col_keys, v).replace(' ', '\n', 1) for v in table.columns], 
+                       size=8)
+    ax.invert_yaxis()
+    ax.set_title(f'Scorecard (vs. {ctrl_name})\ngreen = significantly better, '
+                 'red = significantly worse', size=12)
+
+    plt.tight_layout()
+    with mprof.stage('savefig'):
+        plt.savefig(output_file)
+
+    return table
+
+
 """
 End metplus_plots.py 
 """
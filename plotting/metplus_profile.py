@@ -0,0 +1,270 @@
+"""
+Opt-in Timing and Memory Instrumentation for the METplus Plotting Pipeline
+
+Stages are timed using the stage() context manager or the timed() decorator. Nothing is recorded
+(and the overhead is a single dictionary lookup) unless enable() is called first. For each stage,
+the number of calls, total wall time, number of rows processed, and (optionally) the tracemalloc
+peak memory above the memory in use when the stage started are recorded. Results are written
+using write_report().
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import time
+import json
+import os
+import functools
+import contextlib
+import tracemalloc
+import pandas as pd
+
+
+#---------------------------------------------------------------------------------------------------
+# Profiling State
+#---------------------------------------------------------------------------------------------------
+
+# Options and recorded statistics. Key in 'stages' is the stage name
+PROFILE = {'enabled':False, 'memory':False, 'stages':{}, 'stack':[]}
+
+# Columns in the profiling report
+REPORT_COLS = ['stage', 'calls', 'wall_time', 'rows', 'peak_mem']
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def enable(memory=False):
+    """
+    Turn on instrumentation
+
+    Parameters
+    ----------
+    memory : boolean, optional
+        Option to record the peak memory usage of each stage using tracemalloc. This slows down
+        the code, so it is off by default.
+
+    Returns
+    -------
+    None
+
+    """
+
+    PROFILE['enabled'] = True
+    PROFILE['memory'] = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """
+    Turn off instrumentation. Recorded statistics are kept.
+    """
+
+    PROFILE['enabled'] = False
+    if PROFILE['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    PROFILE['memory'] = False
+
+
+def reset():
+    """
+    Remove all recorded statistics
+    """
+
+    PROFILE['stages'] = {}
+    PROFILE['stack'] = []
+
+
+def record(name, wall_time, rows=None, peak_mem=None, calls=1):
+    """
+    Add statistics for a stage
+
+    Parameters
+    ----------
+    name : string
+        Stage name
+    wall_time : float
+        Wall time (s)
+    rows : integer, optional
+        Number of rows processed
+    peak_mem : integer, optional
+        Peak memory above the memory in use at the start of the stage (bytes). The maximum over
+        all calls is kept.
+    calls : integer, optional
+        Number of calls
+
+    Returns
+    -------
+    None
+
+    """
+
+    if name not in PROFILE['stages']:
+        PROFILE['stages'][name] = {'calls':0, 'wall_time':0., 'rows':0, 'peak_mem':None}
+    entry = PROFILE['stages'][name]
+    entry['calls'] = entry['calls'] + calls
+    entry['wall_time'] = entry['wall_time'] + wall_time
+    if rows is not None:
+        entry['rows'] = entry['rows'] + rows
+    if peak_mem is not None:
+        if entry['peak_mem'] is None:
+            entry['peak_mem'] = peak_mem
+        else:
+            entry['peak_mem'] = max(entry['peak_mem'], peak_mem)
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """
+    Context manager that records the wall time (and optionally peak memory) of a stage
+
+    Parameters
+    ----------
+    name : string
+        Stage name
+    rows : integer, optional
+        Number of rows processed in this stage. Can also be set using the 'rows' key in the
+        dictionary returned by the context manager.
+
+    Yields
+    ------
+    info : dictionary
+        Stage information. Set info['rows'] inside the with block to record the number of rows.
+
+    """
+
+    info = {'rows':rows}
+    if not PROFILE['enabled']:
+        yield info
+        return
+
+    # tracemalloc only keeps a single peak, so the peak of the enclosing stage is saved before the
+    # peak is reset for this stage and restored afterwards
+    memory = PROFILE['memory'] and tracemalloc.is_tracing()
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if len(PROFILE['stack']) > 0:
+            PROFILE['stack'][-1]['peak'] = max(PROFILE['stack'][-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        info['start_mem'] = current
+        info['peak'] = current
+    PROFILE['stack'].append(info)
+
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        wall_time = time.perf_counter() - start
+        PROFILE['stack'].pop()
+        peak_mem = None
+        if memory:
+            peak = max(tracemalloc.get_traced_memory()[1], info['peak'])
+            peak_mem = peak - info['start_mem']
+            if len(PROFILE['stack']) > 0:
+                PROFILE['stack'][-1]['peak'] = max(PROFILE['stack'][-1]['peak'], peak)
+        record(name, wall_time, rows=info['rows'], peak_mem=peak_mem)
+
+
+def timed(name=None):
+    """
+    Decorator that records each call to a function as a stage. If the function returns a
+    DataFrame (or a tuple starting with a DataFrame), the number of rows is also recorded.
+
+    Parameters
+    ----------
+    name : string, optional
+        Stage name. Defaults to the function name.
+
+    Returns
+    -------
+    decorator : function
+
+    """
+
+    def decorator(fcn):
+        stage_name = fcn.__name__ if name is None else name
+
+        @functools.wraps(fcn)
+        def wrapper(*args, **kwargs):
+            if not PROFILE['enabled']:
+                return fcn(*args, **kwargs)
+            with stage(stage_name) as info:
+                out = fcn(*args, **kwargs)
+                df = out[0] if isinstance(out, tuple) and len(out) > 0 else out
+                if isinstance(df, pd.DataFrame):
+                    info['rows'] = len(df)
+            return out
+
+        return wrapper
+
+    return decorator
+
+
+def get_stats():
+    """
+    Return a copy of the recorded statistics (e.g., to send them from a worker process to the
+    main process)
+    """
+
+    return {k:dict(v) for k, v in PROFILE['stages'].items()}
+
+
+def merge_stats(stats):
+    """
+    Add statistics from get_stats() (e.g., from a worker process) to the recorded statistics
+    """
+
+    for name, entry in stats.items():
+        record(name, entry['wall_time'], rows=entry['rows'], peak_mem=entry['peak_mem'],
+               calls=entry['calls'])
+
+
+def report_df():
+    """
+    Recorded statistics as a DataFrame (one row per stage, sorted by wall time)
+    """
+
+    rows = [[name] + [entry[c] for c in REPORT_COLS[1:]]
+            for name, entry in PROFILE['stages'].items()]
+    df = pd.DataFrame(rows, columns=REPORT_COLS)
+    df.sort_values('wall_time', ascending=False, inplace=True, ignore_index=True)
+
+    return df
+
+
+def write_report(fname, meta={}):
+    """
+    Write the recorded statistics to a JSON or CSV file
+
+    Parameters
+    ----------
+    fname : string
+        Output file. A CSV file is written if fname ends in .csv, otherwise a JSON file is written.
+    meta : dictionary, optional
+        Additional information about the run (e.g., the input YAML file). Only included in JSON
+        files.
+
+    Returns
+    -------
+    None
+
+    """
+
+    df = report_df()
+    if os.path.splitext(fname)[1] == '.csv':
+        df.to_csv(fname, index=False)
+    else:
+        df = df.astype(object).where(df.notna(), None)
+        out = {'meta':meta, 'stages':df.to_dict(orient='records')}
+        with open(fname, 'w') as fptr:
+            json.dump(out, fptr, indent=1, default=str)
+
+
+"""
+End metplus_profile.py
+"""
@@ -10,209 +10,2650 @@ shawn.s.murdzek@noaa.gov
 
 import pandas as pd
 import numpy as np
-import scipy.stats as ss
+import os
+import copy
+import hashlib
+import tempfile
+import io
+import re
+import json
+import pickle
+import collections
+import weakref
+import concurrent.futures as cf
+
+import metplus_OSSE_scripts.plotting.metplus_profile as mprof
+
+# scipy.stats is slow to import, so it is only imported in the functions that need it
+
+
+#---------------------------------------------------------------------------------------------------
+# MET Output Column Definitions
+#---------------------------------------------------------------------------------------------------
+
+# Header columns shared by all MET .stat line types (MET v11)
+MET_HEADER_COLS = ['VERSION', 'MODEL', 'DESC', 'FCST_LEAD', 'FCST_VALID_BEG', 'FCST_VALID_END',
+                   'OBS_LEAD', 'OBS_VALID_BEG', 'OBS_VALID_END', 'FCST_VAR', 'FCST_UNITS',
+                   'FCST_LEV', 'OBS_VAR', 'OBS_UNITS', 'OBS_LEV', 'OBTYPE', 'VX_MASK',
+                   'INTERP_MTHD', 'INTERP_PNTS', 'FCST_THRESH', 'OBS_THRESH', 'COV_THRESH',
+                   'ALPHA', 'LINE_TYPE']
+
+# Line-type-specific columns that follow the header columns (MET v11.0)
+MET_LINE_TYPE_COLS = {}
+MET_LINE_TYPE_COLS['SL1L2'] = ['TOTAL', 'FBAR', 'OBAR', 'FOBAR', 'FFBAR', 'OOBAR', 'MAE']
+MET_LINE_TYPE_COLS['SAL1L2'] = ['TOTAL', 'FABAR', 'OABAR', 'FOABAR', 'FFABAR', 'OOABAR', 'MAE']
+MET_LINE_TYPE_COLS['VL1L2'] = ['TOTAL', 'UFBAR', 'VFBAR', 'UOBAR', 'VOBAR', 'UVFOBAR', 'UVFFBAR',
+                               'UVOOBAR', 'F_SPEED_BAR', 'O_SPEED_BAR']
+MET_LINE_TYPE_COLS['VAL1L2'] = ['TOTAL', 'UFABAR', 'VFABAR', 'UOABAR', 'VOABAR', 'UVFOABAR',
+                                'UVFFABAR', 'UVOOABAR', 'FA_SPEED_BAR', 'OA_SPEED_BAR']
+MET_LINE_TYPE_COLS['CTC'] = ['TOTAL', 'FY_OY', 'FY_ON', 'FN_OY', 'FN_ON', 'EC_VALUE']
+MET_LINE_TYPE_COLS['CTS'] = (['TOTAL'] +
+                             [f"{s}{c}" for s in ['BASER', 'FMEAN', 'ACC']
+                              for c in ['', '_NCL', '_NCU', '_BCL', '_BCU']] +
+                             ['FBIAS', 'FBIAS_BCL', 'FBIAS_BCU'] +
+                             [f"{s}{c}" for s in ['PODY', 'PODN', 'POFD', 'FAR', 'CSI']
+                              for c in ['', '_NCL', '_NCU', '_BCL', '_BCU']] +
+                             ['GSS', 'GSS_BCL', 'GSS_BCU'] +
+                             [f"{s}{c}" for s in ['HK']
+                              for c in ['', '_NCL', '_NCU', '_BCL', '_BCU']] +
+                             ['HSS', 'HSS_BCL', 'HSS_BCU'] +
+                             [f"{s}{c}" for s in ['ODDS', 'LODDS', 'ORSS', 'EDS', 'SEDS', 'EDI',
+                                                  'SEDI']
+                              for c in ['', '_NCL', '_NCU', '_BCL', '_BCU']] +
+                             ['BAGSS', 'BAGSS_BCL', 'BAGSS_BCU', 'HSS_EC', 'HSS_EC_BCL',
+                              'HSS_EC_BCU', 'EC_VALUE'])
+MET_LINE_TYPE_COLS['NBRCNT'] = ['TOTAL', 'FBS', 'FBS_BCL', 'FBS_BCU', 'FSS', 'FSS_BCL', 'FSS_BCU',
+                                'AFSS', 'AFSS_BCL', 'AFSS_BCU', 'UFSS', 'UFSS_BCL', 'UFSS_BCU',
+                                'F_RATE', 'F_RATE_BCL', 'F_RATE_BCU', 'O_RATE', 'O_RATE_BCL',
+                                'O_RATE_BCU']
+
+
+# Header columns that are stored as categoricals in compact DataFrames (see compact_met_df())
+MET_CATEGORICAL_COLS = ['VERSION', 'MODEL', 'DESC', 'FCST_VALID_BEG', 'FCST_VALID_END',
+                        'OBS_VALID_BEG', 'OBS_VALID_END', 'FCST_VAR', 'FCST_UNITS', 'FCST_LEV',
+                        'OBS_VAR', 'OBS_UNITS', 'OBS_LEV', 'OBTYPE', 'VX_MASK', 'INTERP_MTHD',
+                        'FCST_THRESH', 'OBS_THRESH', 'COV_THRESH', 'ALPHA', 'LINE_TYPE']
+
+
+# MET output file names (e.g., grid_stat_FV3_TMP_vs_NR_TMP_010000L_20220429_220000V_sl1l2.txt)
+MET_FNAME_RE = re.compile(r'^(?P<prefix>.+)_(?P<lead>\d{6,})L_(?P<valid>\d{8}_\d{6})V'
+                          r'(?:_(?P<line_type>[a-z0-9]+))?\.(?P<ext>txt|stat)$')
+
+# Catalogs that have already been loaded by met_fnames(). Key is the catalog file name.
+LOADED_CATALOGS = {}
+
+# Line types that can be aggregated (see register_line_type()). Key is the line type (lowercase)
+LINE_TYPE_REGISTRY = {}
+
+# Derived statistics for each line type (see register_stat()). First key is the line type 
+# (lowercase), second key is the statistic name
+STAT_REGISTRY = {}
+
+# Bootstrap resample counts that have already been drawn by bootstrap_means_chunk()
+BOOTSTRAP_COUNTS = {}
+BOOTSTRAP_COUNTS_MAX = 64
+
+# Statistics for the second (control) DataFrame in compute_stats_diff(), which is usually compared 
+# to several experiments (see control_stats()). Least recently used entries are removed first.
+CTRL_STATS_CACHE = collections.OrderedDict()
+CTRL_STATS_CACHE_MAX = 32
+
+# Default dimensions of a VerifCube (see build_cube())
+CUBE_DIMS = ['FCST_LEAD', 'FCST_VALID_BEG', 'FCST_LEV', 'FCST_VAR']
+
+# Default dimensions of a scorecard (see compute_scorecard())
+SCORECARD_DIMS = CUBE_DIMS + ['VX_MASK']
+
+# Whether lower, higher, or closer to 0 or 1 values are better for each statistic in a scorecard
+SCORECARD_BETTER = {'MSE':'lower', 'RMSE':'lower', 'MAE':'lower', 'ESTDEV':'lower',
+                    'ME':'zero', 'BIAS_DIFF':'zero', 'BIAS_RATIO':'one',
+                    'VECT_MSE':'lower', 'VECT_RMSE':'lower', 'MAG_BIAS_DIFF':'zero',
+                    'MAG_BIAS_RATIO':'one', 'ANOM_MSE':'lower', 'ANOM_RMSE':'lower',
+                    'ANOM_CORR':'higher', 'ANOM_CORR_UNCNTR':'higher', 'VECT_ANOM_MSE':'lower',
+                    'VECT_ANOM_RMSE':'lower', 'VECT_ANOM_CORR':'higher', 'CSI':'higher',
+                    'PODY':'higher', 'FAR':'lower', 'FBIAS':'one', 'ETS':'higher', 'FSS':'higher',
+                    'AFSS':'higher'}
 
 
 #---------------------------------------------------------------------------------------------------
 # Functions
 #---------------------------------------------------------------------------------------------------
 
-def confidence_interval_t_mean(data, level=0.95, acct_lag_corr=False, mats_ste=False):
+def confidence_interval_t_mean(data, level=0.95, acct_lag_corr=False, mats_ste=False):
+    """
+    Compute the confidence interval for the mean of a dataset using a t distribution
+
+    Parameters
+    ----------
+    data : np.array
+        Input data
+    level : Float, optional
+        Confidence level for the confidence interval
+    acct_lag_corr : Boolean, optional
+        Option to account to autocorrelated data by using the lag-1 autocorrelation when computing 
+        the standard error. Method is based on Wilks (2011), eqn 5.12 (note that this is slightly 
+        different from the equation used in MATS at GSL). Note that this assumes that the input 
+        data are "in order" (e.g., each data point is an hour after the previous data point).
+    mats_ste : Boolean, optional
+        Option to use the MATS formulation for standard error when accounting for temporal
+        autocorrelation. For information on the MATS method, see here:
+        https://ruc.noaa.gov/stats/vertical/StdErrorcalculationonEMBverificationpages/StdErrorcalculationonEMBverificationpages.html
+
+    Returns
+    -------
+    ci : Tuple
+        Upper and lower bound of the confidence interval
+
+    """
+
+    import scipy.stats as ss
+
+    n = len(data)
+    avg = np.mean(data)
+    std = np.std(data) 
+    t_low = ss.t.ppf(0.5 * (1 - level), n - 1)
+
+    # Compute standard error
+    if acct_lag_corr:
+        auto_corr = max(np.corrcoef(data[1:], data[:-1])[0, -1], 0)
+    else:
+        auto_corr = 0
+    if mats_ste:
+        ste = std / (np.sqrt((n - 1) * (1 - auto_corr)))
+    else:
+        ste = std / (np.sqrt(n * (1 - auto_corr) / (1 + auto_corr)))
+
+    ci = (avg + (t_low * ste), avg - (t_low * ste))
+
+    return ci
+
+
+def confidence_interval_bootstrap_mean(data, level=0.95, bootstrap_kw={}):
+    """
+    Compute the confidence interval for the mean of a dataset using a bootstrap
+
+    Parameters
+    ----------
+    data : np.array
+        Input data
+    level : Float, optional
+        Confidence level for the confidence interval
+    bootstrap_kw : Dictionary, optional
+        Keyword to pass to bootstrap function
+
+    Returns
+    -------
+    ci : Tuple
+        Upper and lower bound of the confidence interval
+
+    """
+
+    import scipy.stats as ss
+
+    out = ss.bootstrap((data,), np.mean, confidence_level=level, **bootstrap_kw)
+    ci = (out.confidence_interval.high, out.confidence_interval.low)
+
+    return ci
+
+
+def confidence_interval_mean(data, level=0.95, option='t_dist', ci_kw={}):
+    """
+    Compute the confidence interval for the mean of a dataset
+
+    Parameters
+    ----------
+    data : np.array
+        Input data
+    level : Float, optional
+        Confidence level for the confidence interval
+    option : String, optional
+        Method used to compute confidence interval ('t_dist' or 'bootstrap')
+    ci_kw : Dictionary, optional
+        Keywords passed to the confidence interval function
+
+    Returns
+    -------
+    ci : Tuple
+        Upper and lower bound of the confidence interval
+
+    """
+
+    if option == 't_dist':
+        ci = confidence_interval_t_mean(data, level=level, **ci_kw)
+    elif option == 'bootstrap':
+        ci = confidence_interval_bootstrap_mean(data, level=level, **ci_kw)
+    else:
+        print('confidence interval option {option} does not exist'.format(option=option))
+
+    return ci
+
+
+def confidence_interval_t_mean_groups(data, starts=None, level=0.95, acct_lag_corr=False, 
+                                      mats_ste=False):
+    """
+    Compute the confidence interval for the mean of many groups of data at once using a t 
+    distribution. Results are the same as calling confidence_interval_t_mean() for each group.
+
+    Parameters
+    ----------
+    data : np.array
+        Input data. If starts is None, data has dimensions (groups, time), and a confidence 
+        interval is computed for each row. If starts is provided, data has dimensions (time) or 
+        (time, variables), and each group is a contiguous block of rows (ragged layout).
+    starts : np.array, optional
+        Index of the first row in each group (e.g., from sort_groups())
+    level : Float, optional
+        Confidence level for the confidence interval
+    acct_lag_corr : Boolean, optional
+        Option to account to autocorrelated data by using the lag-1 autocorrelation when computing 
+        the standard error (see confidence_interval_t_mean()). Data within each group must be 
+        "in order".
+    mats_ste : Boolean, optional
+        Option to use the MATS formulation for standard error when accounting for temporal
+        autocorrelation
+
+    Returns
+    -------
+    ci : Tuple
+        Lower and upper bound of the confidence interval for each group. Each bound has 
+        dimensions (groups) or (groups, variables).
+
+    """
+
+    import scipy.stats as ss
+
+    # Convert data to the ragged layout with dimensions (time, variables)
+    data = np.asarray(data, dtype=float)
+    if starts is None:
+        data = np.atleast_2d(data)
+        starts = np.arange(0, data.size, data.shape[1])
+        data = data.reshape(-1)
+    squeeze = (data.ndim == 1)
+    if squeeze:
+        data = data[:, np.newaxis]
+    starts = np.asarray(starts, dtype=int)
+    n = np.diff(np.append(starts, data.shape[0]))
+    grp = np.repeat(np.arange(len(starts)), n)
+
+    # Mean and (population) standard deviation of each group
+    avg = np.add.reduceat(data, starts, axis=0) / n[:, np.newaxis]
+    std = np.sqrt(np.add.reduceat((data - avg[grp])**2, starts, axis=0) / n[:, np.newaxis])
+    t_low = ss.t.ppf(0.5 * (1 - level), n - 1)[:, np.newaxis]
+
+    # Lag-1 autocorrelation of each group (same as np.corrcoef(data[1:], data[:-1]))
+    if acct_lag_corr:
+        lead_idx = np.setdiff1d(np.arange(data.shape[0]), starts)
+        pair_grp = grp[lead_idx]
+        x1 = data[lead_idx]
+        x0 = data[lead_idx - 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sums = np.zeros((len(starts), 5, data.shape[1]))
+            for i, vals in enumerate([x1, x0]):
+                np.add.at(sums[:, i], pair_grp, vals)
+            sums[:, :2] = sums[:, :2] / (n - 1)[:, np.newaxis, np.newaxis]
+            dx1 = x1 - sums[pair_grp, 0]
+            dx0 = x0 - sums[pair_grp, 1]
+            for i, vals in enumerate([dx1 * dx0, dx1**2, dx0**2]):
+                np.add.at(sums[:, i+2], pair_grp, vals)
+            auto_corr = np.maximum(sums[:, 2] / np.sqrt(sums[:, 3] * sums[:, 4]), 0)
+    else:
+        auto_corr = np.zeros(avg.shape)
+
+    # Compute standard error
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if mats_ste:
+            ste = std / (np.sqrt((n - 1)[:, np.newaxis] * (1 - auto_corr)))
+        else:
+            ste = std / (np.sqrt(n[:, np.newaxis] * (1 - auto_corr) / (1 + auto_corr)))
+
+    ci = (avg + (t_low * ste), avg - (t_low * ste))
+    if squeeze:
+        ci = (ci[0][:, 0], ci[1][:, 0])
+
+    return ci
+
+
+def block_length_auto(data, n):
+    """
+    Determine the block length for a moving-block bootstrap based on the lag-1 autocorrelation 
+    of the data. Uses the AR(1)-based formula in Wilks (2011), eqn 5.36: 
+    L = (n - L + 1)^[(2/3)(1 - n'/n)], where n' = n(1 - r1)/(1 + r1) is the effective sample size.
+
+    Parameters
+    ----------
+    data : np.array
+        Input data with dimensions (n, columns). The mean lag-1 autocorrelation of all the columns 
+        is used. Data must be "in order".
+    n : integer
+        Number of samples
+
+    Returns
+    -------
+    L : integer
+        Block length
+
+    """
+
+    if n < 3:
+        return 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x1 = data[1:] - np.mean(data[1:], axis=0)
+        x0 = data[:-1] - np.mean(data[:-1], axis=0)
+        r1 = np.sum(x1 * x0, axis=0) / np.sqrt(np.sum(x1**2, axis=0) * np.sum(x0**2, axis=0))
+    r1 = np.nanmean(np.maximum(r1, 0)) if np.any(np.isfinite(r1)) else 0.
+    r1 = min(r1, 0.99)
+    n_eff = n * (1 - r1) / (1 + r1)
+
+    # Solve for L using fixed-point iteration
+    L = 1.
+    for i in range(50):
+        L_new = (n - L + 1)**((2. / 3.) * (1 - n_eff / n))
+        if abs(L_new - L) < 1e-3:
+            break
+        L = L_new
+
+    return int(min(max(round(L_new), 1), n))
+
+
+def resample_indices(n, n_resamples, rng, block=None, block_length=1):
+    """
+    Draw bootstrap resample indices
+
+    Parameters
+    ----------
+    n : integer
+        Number of samples
+    n_resamples : integer
+        Number of resamples
+    rng : np.random.Generator
+        Random number generator
+    block : string, optional
+        Block bootstrap method. Options:
+            None : Samples are drawn independently
+            'moving' : Moving-block bootstrap with blocks of length block_length
+            'stationary' : Stationary bootstrap (Politis and Romano 1994) with random block 
+                lengths that have a mean of block_length. Blocks wrap around the end of the data.
+    block_length : integer, optional
+        (Mean) block length
+
+    Returns
+    -------
+    idx : np.array
+        Resample indices with dimensions (n_resamples, n)
+
+    """
+
+    if (block is None) or (block_length <= 1):
+        idx = rng.integers(0, n, size=(n_resamples, n))
+    elif block == 'moving':
+        nblock = int(np.ceil(n / block_length))
+        block_start = rng.integers(0, n - block_length + 1, size=(n_resamples, nblock))
+        idx = (block_start[:, :, np.newaxis] + np.arange(block_length)).reshape(n_resamples, -1)
+        idx = idx[:, :n]
+    elif block == 'stationary':
+        new_block = rng.random(size=(n_resamples, n)) < (1. / block_length)
+        new_block[:, 0] = True
+        pos = np.arange(n)
+        last_start = np.maximum.accumulate(np.where(new_block, pos, 0), axis=1)
+        block_start = rng.integers(0, n, size=(n_resamples, n))
+        idx = (np.take_along_axis(block_start, last_start, axis=1) + pos - last_start) % n
+    else:
+        raise ValueError(f'block bootstrap method {block} is not supported')
+
+    return idx
+
+
+def bootstrap_means_chunk(blocks, n_resamples, seed, block=None, block_length={}):
+    """
+    Compute bootstrap resampled means for one chunk of resamples. The same resample indices are 
+    applied to every column of a block.
+
+    Resample counts are cached (see BOOTSTRAP_COUNTS), so repeated calls with the same seed 
+    (e.g., for each simulation in a plot) reuse the same resample indices without drawing them 
+    again.
+
+    Parameters
+    ----------
+    blocks : dictionary
+        Data to resample. Key = number of samples (n), value = array with dimensions (n, columns)
+    n_resamples : integer
+        Number of resamples in this chunk
+    seed : np.random.SeedSequence
+        Seed for this chunk. The resample indices for each n are drawn using a separate stream, 
+        so they only depend on the seed and n.
+    block : string, optional
+        Block bootstrap method (see resample_indices())
+    block_length : dictionary, optional
+        Block length for each n
+
+    Returns
+    -------
+    means : dictionary
+        Resampled means. Key = number of samples, value = array with dimensions 
+        (n_resamples, columns)
+
+    """
+
+    means = {}
+    for n in sorted(blocks.keys()):
+        L = block_length[n] if n in block_length else 1
+        cache_key = (n, n_resamples, seed.entropy, seed.spawn_key, block, L)
+        if cache_key in BOOTSTRAP_COUNTS:
+            counts = BOOTSTRAP_COUNTS[cache_key]
+        else:
+            rng = np.random.default_rng(np.random.SeedSequence(entropy=seed.entropy, 
+                                                               spawn_key=seed.spawn_key + (n,)))
+            idx = resample_indices(n, n_resamples, rng, block=block, block_length=L)
+
+            # Convert resample indices to counts so the means can be computed using a matrix 
+            # product
+            idx = idx + n * np.arange(n_resamples)[:, np.newaxis]
+            counts = np.bincount(idx.ravel(), minlength=n_resamples*n).reshape(n_resamples, n)
+            if len(BOOTSTRAP_COUNTS) >= BOOTSTRAP_COUNTS_MAX:
+                del BOOTSTRAP_COUNTS[next(iter(BOOTSTRAP_COUNTS))]
+            BOOTSTRAP_COUNTS[cache_key] = counts
+        means[n] = (counts @ blocks[n]) / n
+
+    return means
+
+
+def confidence_interval_bootstrap_mean_groups(data, starts=None, level=0.95, bootstrap_kw={}, 
+                                              nprocs=1):
+    """
+    Compute the confidence interval for the mean of many groups of data at once using a bootstrap
+
+    One resample index matrix is drawn for each group length and applied to every group and 
+    variable with that length. Resamples are drawn in chunks so that memory usage is bounded, and 
+    each chunk has its own seed (spawned from random_state), so the results do not depend on 
+    the number of processes used.
+
+    Parameters
+    ----------
+    data : np.array
+        Input data. See confidence_interval_t_mean_groups() for the supported layouts.
+    starts : np.array, optional
+        Index of the first row in each group
+    level : Float, optional
+        Confidence level for the confidence interval
+    bootstrap_kw : Dictionary, optional
+        Bootstrap options. Uses the same names as scipy.stats.bootstrap(): 'n_resamples' 
+        (default 9999), 'method' ('BCa' (default), 'percentile', or 'basic'), 'random_state' (or 
+        'rng'), and 'batch' (number of resamples per chunk, default 1000). Autocorrelated data 
+        can be resampled in blocks using 'block' ('moving' or 'stationary', see 
+        resample_indices()) and 'block_length' (integer or 'auto', which uses 
+        block_length_auto()). 'block_lengths' is an optional dictionary of block lengths for 
+        each n that is reused and updated by this function. Using the same integer random_state 
+        and block_lengths dictionary for each simulation ensures that every simulation is 
+        resampled using the same indices.
+    nprocs : integer, optional
+        Number of processes used to compute the resampled means
+
+    Returns
+    -------
+    ci : Tuple
+        Lower and upper bound of the confidence interval for each group. Each bound has 
+        dimensions (groups) or (groups, variables).
+
+    """
+
+    import scipy.stats as ss
+
+    # Bootstrap options
+    n_resamples = bootstrap_kw['n_resamples'] if 'n_resamples' in bootstrap_kw else 9999
+    method = bootstrap_kw['method'] if 'method' in bootstrap_kw else 'BCa'
+    batch = bootstrap_kw['batch'] if ('batch' in bootstrap_kw and bootstrap_kw['batch']) else 1000
+    seed = None
+    for k in ['random_state', 'rng']:
+        if k in bootstrap_kw:
+            seed = bootstrap_kw[k]
+    if isinstance(seed, np.random.Generator):
+        seed = int(seed.integers(2**63))
+    elif isinstance(seed, np.random.RandomState):
+        seed = int(seed.randint(2**31))
+    block = bootstrap_kw['block'] if 'block' in bootstrap_kw else None
+    L = bootstrap_kw['block_length'] if 'block_length' in bootstrap_kw else 'auto'
+    if method.lower() not in ['bca', 'percentile', 'basic']:
+        raise ValueError(f'bootstrap method {method} is not supported')
+
+    # Convert data to the ragged layout with dimensions (time, variables)
+    data = np.asarray(data, dtype=float)
+    if starts is None:
+        data = np.atleast_2d(data)
+        starts = np.arange(0, data.size, data.shape[1])
+        data = data.reshape(-1)
+    squeeze = (data.ndim == 1)
+    if squeeze:
+        data = data[:, np.newaxis]
+    starts = np.asarray(starts, dtype=int)
+    ends = np.append(starts[1:], data.shape[0])
+    n = ends - starts
+    nvar = data.shape[1]
+
+    # Stack groups with the same length so that they share resample indices
+    blocks = {}
+    block_grps = {}
+    for ni in np.unique(n):
+        block_grps[ni] = np.where(n == ni)[0]
+        blocks[ni] = np.hstack([data[starts[g]:ends[g]] for g in block_grps[ni]])
+
+    # Block length for each n. Block lengths in block_lengths are reused, and new block lengths 
+    # are added to block_lengths
+    block_lengths = bootstrap_kw['block_lengths'] if 'block_lengths' in bootstrap_kw else {}
+    block_length = {}
+    if block is not None:
+        for ni in blocks.keys():
+            if ni not in block_lengths:
+                block_lengths[ni] = block_length_auto(blocks[ni], ni) if L == 'auto' else int(L)
+            block_length[ni] = block_lengths[ni]
+
+    # Compute resampled means in chunks
+    chunks = [batch] * (n_resamples // batch)
+    if n_resamples % batch > 0:
+        chunks.append(n_resamples % batch)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    if nprocs > 1:
+        with cf.ProcessPoolExecutor(max_workers=nprocs) as executor:
+            out = list(executor.map(bootstrap_means_chunk, [blocks]*len(chunks), chunks, seeds,
+                                    [block]*len(chunks), [block_length]*len(chunks)))
+    else:
+        out = [bootstrap_means_chunk(blocks, c, sd, block=block, block_length=block_length) 
+               for c, sd in zip(chunks, seeds)]
+
+    # Compute confidence intervals
+    alpha = 0.5 * (1 - level)
+    low = np.zeros((len(starts), nvar))
+    high = np.zeros((len(starts), nvar))
+    for ni in blocks.keys():
+        theta_b = np.sort(np.concatenate([o[ni] for o in out], axis=0), axis=0)
+        theta_hat = np.mean(blocks[ni], axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if method.lower() == 'bca':
+
+                # Bias correction and acceleration (using the jackknife means)
+                z0 = ss.norm.ppf((np.sum(theta_b < theta_hat, axis=0) + 
+                                  np.sum(theta_b <= theta_hat, axis=0)) / (2. * n_resamples))
+                d = (blocks[ni] - theta_hat) / (ni - 1)
+                a = np.sum(d**3, axis=0) / (6 * np.sum(d**2, axis=0)**1.5)
+                q = []
+                for z_alpha in ss.norm.ppf([alpha, 1 - alpha]):
+                    q.append(ss.norm.cdf(z0 + (z0 + z_alpha) / (1 - a * (z0 + z_alpha))))
+            else:
+                q = [np.full(theta_hat.shape, alpha), np.full(theta_hat.shape, 1 - alpha)]
+
+            # Percentiles of the resampled means (linear interpolation)
+            bounds = []
+            for qi in q:
+                pos = qi * (n_resamples - 1)
+                pos_int = np.clip(np.floor(np.nan_to_num(pos)).astype(int), 0, n_resamples - 2)
+                frac = pos - pos_int
+                cols = np.arange(theta_b.shape[1])
+                bounds.append((1 - frac) * theta_b[pos_int, cols] + 
+                              frac * theta_b[pos_int + 1, cols])
+            if method.lower() == 'basic':
+                bounds = [2 * theta_hat - bounds[1], 2 * theta_hat - bounds[0]]
+
+        low[block_grps[ni]] = bounds[0].reshape(len(block_grps[ni]), nvar)
+        high[block_grps[ni]] = bounds[1].reshape(len(block_grps[ni]), nvar)
+
+    ci = (low, high)
+    if squeeze:
+        ci = (low[:, 0], high[:, 0])
+
+    return ci
+
+
+@mprof.timed()
+def confidence_interval_mean_groups(data, starts=None, level=0.95, option='t_dist', ci_kw={}):
+    """
+    Compute the confidence interval for the mean of many groups of data at once
+
+    Parameters
+    ----------
+    data : np.array
+        Input data. See confidence_interval_t_mean_groups() for the supported layouts.
+    starts : np.array, optional
+        Index of the first row in each group
+    level : Float, optional
+        Confidence level for the confidence interval
+    option : String, optional
+        Method used to compute confidence interval ('t_dist' or 'bootstrap')
+    ci_kw : Dictionary, optional
+        Keywords passed to the confidence interval function
+
+    Returns
+    -------
+    ci : Tuple
+        Lower and upper bound of the confidence interval for each group
+
+    """
+
+    if option == 't_dist':
+        ci = confidence_interval_t_mean_groups(data, starts=starts, level=level, **ci_kw)
+    elif option == 'bootstrap':
+        ci = confidence_interval_bootstrap_mean_groups(data, starts=starts, level=level, **ci_kw)
+    else:
+        raise ValueError('confidence interval option {option} does not exist'.format(option=option))
+
+    return ci
+
+
+def compute_stdev(sum_val, sum_sq, n):
+    """
+    Compute the standard deviation from partial sums. Based on calculate_stddev from METcalcpy.
+
+    Parameters
+    ----------
+    sum_val : Float
+        Sum of all the values in the data set
+    sum_sq : Float
+        Sum of all the squared values in the data set
+    n : Integer
+        Number of values in the data set
+
+    Returns
+    -------
+    s : Float
+        Standard deviation
+
+    """
+
+    s = np.sqrt((sum_sq - (sum_val * sum_val) / n) / (n - 1))
+
+    return s
+
+
+def cache_fname(fname, cache_dir=None, fmt='parquet', tag=None):
+    """
+    Determine the name of the on-disk cache file for a MET ASCII output file
+
+    The cache file name contains a hash of the absolute path of the MET output file (so MET output
+    files with the same name in different directories can share a cache directory) and a hash of 
+    the absolute path, size, and modification time of the MET output file (so any change to the 
+    MET output file results in a different cache file name).
+
+    Parameters
+    ----------
+    fname : string
+        MET output file name
+    cache_dir : string, optional
+        Directory containing the cache files. Set to None to use a '.met_cache' directory next to
+        the MET output file.
+    fmt : string, optional
+        Cache file format ('parquet', 'feather', or 'pickle')
+    tag : string, optional
+        Additional tag added to the cache file name (e.g., the line type for .stat files)
+
+    Returns
+    -------
+    cache_name : string
+        Cache file name
+
+    """
+
+    info = os.stat(fname)
+    path_hash = hashlib.sha1(os.path.abspath(fname).encode()).hexdigest()[:8]
+    key = f"{os.path.abspath(fname)}|{info.st_size}|{info.st_mtime_ns}"
+    key_hash = hashlib.sha1(key.encode()).hexdigest()[:16]
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(fname)), '.met_cache')
+    base = os.path.basename(fname)
+    if tag is not None:
+        base = f"{base}.{tag}"
+    cache_name = f"{cache_dir}/{base}.{path_hash}.{key_hash}.{fmt}"
+
+    return cache_name
+
+
+def read_cache(cache_name, fmt='parquet', columns=None):
+    """
+    Read a cached MET output file. Also updates the modification time of the cache file, which is
+    used for LRU eviction.
+
+    Parameters
+    ----------
+    cache_name : string
+        Cache file name
+    fmt : string, optional
+        Cache file format ('parquet', 'feather', or 'pickle')
+    columns : list of strings, optional
+        Columns to read. Columns that are not in the cache file are skipped. Set to None to read 
+        all columns.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Cached MET output
+
+    """
+
+    # Only request columns that are in the cache file, so that a missing column is not mistaken 
+    # for a corrupt cache file (pyarrow raises the same error for both)
+    if (columns is not None) and (fmt in ['parquet', 'feather']):
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            names = pq.read_schema(cache_name).names
+        else:
+            import pyarrow.ipc as ipc
+            names = ipc.open_file(cache_name).schema.names
+        columns = [c for c in columns if c in names]
+
+    if fmt == 'parquet':
+        df = pd.read_parquet(cache_name, columns=columns)
+    elif fmt == 'feather':
+        df = pd.read_feather(cache_name, columns=columns)
+    else:
+        df = pd.read_pickle(cache_name)
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+    try:
+        os.utime(cache_name)
+    except OSError:
+        pass
+
+    return df
+
+
+def write_cache(df, cache_name, fmt='parquet', max_size=None):
+    """
+    Write a MET output DataFrame to the on-disk cache
+
+    The cache file is first written to a temporary file in the cache directory, then renamed, so 
+    concurrent readers never see a partially written cache file. Older cache files for the same
+    MET output file (i.e., cache files with the same path hash but a different content hash) are 
+    removed.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        MET output
+    cache_name : string
+        Cache file name (from cache_fname())
+    fmt : string, optional
+        Cache file format ('parquet', 'feather', or 'pickle')
+    max_size : integer, optional
+        Maximum size of the cache directory (bytes). Least recently used cache files are removed
+        once this size is exceeded. Set to None for no size limit.
+
+    Returns
+    -------
+    None
+
+    """
+
+    cache_dir = os.path.dirname(cache_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    os.close(fd)
+    try:
+        if fmt == 'parquet':
+            df.to_parquet(tmp_name)
+        elif fmt == 'feather':
+            df.to_feather(tmp_name)
+        else:
+            df.to_pickle(tmp_name)
+        os.replace(tmp_name, cache_name)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+    # Remove stale cache files for the same MET output file. The prefix includes the path hash, so
+    # cache files for MET output files with the same name in other directories are kept
+    prefix = os.path.basename(cache_name).rsplit('.', 2)[0]
+    for entry in os.scandir(cache_dir):
+        if ((entry.name != os.path.basename(cache_name)) and 
+            (entry.name.rsplit('.', 2)[0] == prefix) and
+            (not entry.name.endswith('.tmp'))):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    if max_size is not None:
+        evict_cache(cache_dir, max_size)
+
+
+def evict_cache(cache_dir, max_size):
+    """
+    Remove the least recently used files from a cache directory until the directory is smaller 
+    than max_size
+
+    Parameters
+    ----------
+    cache_dir : string
+        Cache directory
+    max_size : integer
+        Maximum size of the cache directory (bytes)
+
+    Returns
+    -------
+    None
+
+    """
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.tmp'):
+            continue
+        try:
+            info = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((info.st_mtime_ns, info.st_size, entry.path))
+
+    total = sum([e[1] for e in entries])
+    for mtime, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total = total - size
+
+
+def read_met_txt(fname, usecols=None, filters=None):
+    """
+    Parse a single ASCII MET output file (e.g., *_sl1l2.txt). Rows that do not match the string-
+    valued conditions in filters are discarded before the file is parsed.
+
+    Parameters
+    ----------
+    fname : string
+        MET output file name
+    usecols : list of strings, optional
+        Columns to parse. Set to None to parse all columns.
+    filters : dictionary, optional
+        Row conditions (same format as the param argument in subset_verif_df()). Only conditions 
+        with string values that do not begin with "not" and columns that are in the file are 
+        applied here. The returned DataFrame should still be passed to subset_verif_df() to apply 
+        the remaining conditions.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        DataFrame containing the MET output
+
+    """
+
+    str_filters = {}
+    if filters is not None:
+        for k in filters.keys():
+            if (k[:3] != 'not') and isinstance(filters[k], str):
+                str_filters[k] = filters[k]
+
+    if len(str_filters) == 0:
+        df = pd.read_csv(fname, sep=r'\s+', usecols=usecols)
+        if len(df) == 0:
+            raise ValueError(f"Empty MET file: {fname}")
+        return df
+
+    with open(fname, 'r') as fptr:
+        header = fptr.readline()
+        header_cols = header.split()
+
+        # Conditions on missing columns are left to subset_verif_df(), which raises a KeyError
+        idx = [(header_cols.index(k), str_filters[k]) for k in str_filters.keys() 
+               if k in header_cols]
+        nrows = 0
+        kept = [header]
+        for line in fptr:
+            tokens = line.split()
+            if len(tokens) == 0:
+                continue
+            nrows = nrows + 1
+            keep = True
+            for i, val in idx:
+                if tokens[i] != val:
+                    keep = False
+                    break
+            if keep:
+                kept.append(line)
+    if nrows == 0:
+        raise ValueError(f"Empty MET file: {fname}")
+    df = pd.read_csv(io.StringIO(''.join(kept)), sep=r'\s+', usecols=usecols)
+
+    return df
+
+
+def read_ascii_file(fname, verbose=True, cache=False, cache_kw={}, line_type=None, compact=False,
+                    float_dtype='float64', usecols=None, filters=None):
+    """
+    Read a single ASCII MET output file. See read_ascii() for a description of the parameters.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        DataFrame containing the MET output. None if the file does not exist.
+
+    """
+
+    cache_dir = cache_kw.get('cache_dir', None)
+    fmt = cache_kw.get('fmt', 'parquet')
+    max_size = cache_kw.get('max_size', None)
+
+    stat_file = fname[-5:] == '.stat'
+    if stat_file and (line_type is None):
+        raise ValueError(f"line_type must be specified to read .stat file: {fname}")
+
+    # Columns needed to apply filters are always retained
+    cols = None
+    if usecols is not None:
+        cols = list(usecols)
+        if filters is not None:
+            for k in filters.keys():
+                c = k[4:] if k[:3] == 'not' else k
+                if c not in cols:
+                    cols.append(c)
+
+    try:
+        df = None
+        if cache:
+            if stat_file:
+                cache_name = cache_fname(fname, cache_dir=cache_dir, fmt=fmt, tag=line_type.lower())
+            else:
+                cache_name = cache_fname(fname, cache_dir=cache_dir, fmt=fmt)
+            try:
+                df = read_cache(cache_name, fmt=fmt, columns=cols)
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                # Cache file does not exist, was removed by another process, or is corrupt
+                df = None
+        if df is None:
+            if stat_file:
+                if not os.path.isfile(fname):
+                    raise FileNotFoundError(fname)
+                if cache:
+                    stat_dfs = read_stat([fname], line_types=[line_type], verbose=verbose)
+                else:
+                    stat_dfs = read_stat([fname], line_types=[line_type], verbose=verbose, 
+                                         filters=filters)
+                if line_type.lower() in stat_dfs:
+                    df = stat_dfs[line_type.lower()]
+                elif (filters is not None) and (not cache):
+                    df = pd.DataFrame(columns=MET_HEADER_COLS + MET_LINE_TYPE_COLS[line_type.upper()])
+                else:
+                    raise ValueError(f"No {line_type} lines in MET file: {fname}")
+            elif cache:
+                df = read_met_txt(fname)
+            else:
+                df = read_met_txt(fname, usecols=cols, filters=filters)
+
+            # The entire file is parsed if the cache is used so the cache can be populated
+            if cache:
+                try:
+                    write_cache(df, cache_name, fmt=fmt, max_size=max_size)
+                except Exception as err:
+                    if verbose: print(f"Unable to cache MET file {fname}: {err}")
+    except FileNotFoundError:
+        if verbose: print(f"MET file not found: {fname}")
+        return None
+
+    if cols is not None:
+        missing = [c for c in cols if c not in df.columns]
+        if len(missing) > 0:
+            raise KeyError(f"Columns {missing} not in MET file: {fname}")
+        df = df[cols]
+    if filters is not None:
+        df = subset_verif_df(df, filters).reset_index(drop=True)
+    if compact:
+        df = compact_met_df(df, float_dtype=float_dtype)
+
+    return df
+
+
+def compact_met_df(df, float_dtype='float64'):
+    """
+    Convert a MET output DataFrame to a more compact set of dtypes. Header columns (see 
+    MET_CATEGORICAL_COLS) are converted to categoricals and floating-point columns (e.g., partial
+    sums) are converted to float_dtype.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        MET output
+    float_dtype : string, optional
+        Dtype for floating-point columns ('float32' or 'float64'). Note that statistics derived 
+        from partial sums (e.g., MSE = FFBAR - 2*FOBAR + OOBAR) can lose a lot of precision when
+        using 'float32' owing to cancellation.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        MET output with compact dtypes
+
+    """
+
+    new_cols = {}
+    for c in df.columns:
+        if c in MET_CATEGORICAL_COLS:
+            # Columns that are entirely 'NA' are parsed as floats and are left unchanged
+            if not (isinstance(df[c].dtype, pd.CategoricalDtype) or 
+                    pd.api.types.is_numeric_dtype(df[c].dtype)):
+                new_cols[c] = df[c].astype('category')
+        elif pd.api.types.is_float_dtype(df[c].dtype) and (df[c].dtype != float_dtype):
+            new_cols[c] = df[c].astype(float_dtype)
+    if len(new_cols) > 0:
+        df = df.assign(**new_cols)
+
+    return df
+
+
+def concat_met_dfs(dfs):
+    """
+    Concatenate MET output DataFrames. Categorical columns are retained as categoricals (rather 
+    than being converted to objects) by first taking the union of all the categories.
+
+    Parameters
+    ----------
+    dfs : list of pd.DataFrame
+        MET output
+
+    Returns
+    -------
+    verif_df : pd.DataFrame
+        Concatenated MET output
+
+    """
+
+    cat_cols = []
+    if len(dfs) > 1:
+        for c in dfs[0].columns:
+            if isinstance(dfs[0][c].dtype, pd.CategoricalDtype):
+                cat_cols.append(c)
+
+    if len(cat_cols) > 0:
+        new_dfs = []
+        categories = {}
+        for c in cat_cols:
+            cats = [df[c].cat.categories for df in dfs 
+                    if (c in df.columns) and isinstance(df[c].dtype, pd.CategoricalDtype)]
+            categories[c] = cats[0].append(cats[1:]).unique()
+        for df in dfs:
+            new_cols = {}
+            for c in cat_cols:
+                if (c in df.columns) and isinstance(df[c].dtype, pd.CategoricalDtype):
+                    new_cols[c] = df[c].cat.set_categories(categories[c])
+            new_dfs.append(df.assign(**new_cols))
+        dfs = new_dfs
+
+    verif_df = pd.concat(dfs)
+
+    return verif_df
+
+
+def read_ascii_chunk(fnames, read_kw={}):
+    """
+    Read a batch of ASCII MET output files. Used by the worker processes in read_ascii().
+
+    Parameters
+    ----------
+    fnames : list of strings
+        List of filenames to read in
+    read_kw : dictionary, optional
+        Keyword arguments passed to read_ascii_file()
+
+    Returns
+    -------
+    dfs : list of pd.DataFrame
+        MET output for each file that exists, in the same order as fnames
+
+    """
+
+    dfs = []
+    for f in fnames:
+        df = read_ascii_file(f, **read_kw)
+        if df is not None:
+            dfs.append(df)
+
+    return dfs
+
+
+@mprof.timed()
+def read_ascii(fnames, verbose=True, cache=False, cache_kw={}, nprocs=1, chunksize=None,
+               line_type=None, compact=False, float_dtype='float64', usecols=None, filters=None):
+    """
+    Read several ASCII MET output files and concatenate into a single DataFrame.
+
+    Parameters
+    ----------
+    fnames : list of strings
+        List of filenames to read in
+    verbose : boolean, optional
+        Option to print warning messages if a file does not exist
+    cache : boolean, optional
+        Option to use an on-disk columnar cache of the MET output files. Files that have not 
+        changed since they were cached (same path, size, and modification time) are read from the
+        cache instead of being parsed again.
+    cache_kw : dictionary, optional
+        Cache options. Possible keys:
+            cache_dir: Cache directory (default is a '.met_cache' directory next to each MET file)
+            fmt: Cache file format ('parquet', 'feather', or 'pickle'; default is 'parquet')
+            max_size: Maximum size of each cache directory in bytes (default is no limit)
+    nprocs : integer, optional
+        Number of worker processes used to read the files. Files are read serially if nprocs = 1.
+    chunksize : integer, optional
+        Number of files read by a worker process in each batch. Set to None to split the files 
+        into roughly 4 batches per worker process. Only used if nprocs > 1.
+    line_type : string, optional
+        Line type to extract from MET .stat files (e.g., 'sl1l2'). Only rows with this line type 
+        are retained from files ending in '.stat'. Not used for other MET output files.
+    compact : boolean, optional
+        Option to use compact dtypes (header columns are categoricals and floating-point columns 
+        use float_dtype). See compact_met_df().
+    float_dtype : string, optional
+        Dtype for floating-point columns if compact = True ('float32' or 'float64')
+    usecols : list of strings, optional
+        Columns to read. Columns needed for filters are always included. Set to None to read all 
+        columns.
+    filters : dictionary, optional
+        Row conditions (same format as the param argument in subset_verif_df()). Rows that do not 
+        meet these conditions are removed as each file is read. When possible (i.e., conditions 
+        with string values), rows are removed before the file is parsed.
+
+    Returns
+    -------
+    verif_df : pd.DataFrame
+        Output DataFrame containing the MET output. Rows are always in the same order as fnames.
+
+    """
+
+    read_kw = {'verbose':verbose, 'cache':cache, 'cache_kw':cache_kw, 'line_type':line_type,
+               'compact':compact, 'float_dtype':float_dtype, 'usecols':usecols, 'filters':filters}
+
+    if nprocs > 1 and len(fnames) > 1:
+        if chunksize is None:
+            chunksize = max(1, int(np.ceil(len(fnames) / (4 * nprocs))))
+        chunks = [fnames[i:(i+chunksize)] for i in range(0, len(fnames), chunksize)]
+        raw_dfs = []
+        with cf.ProcessPoolExecutor(max_workers=nprocs) as executor:
+            for dfs in executor.map(read_ascii_chunk, chunks, [read_kw]*len(chunks)):
+                raw_dfs = raw_dfs + dfs
+    else:
+        raw_dfs = read_ascii_chunk(fnames, read_kw=read_kw)
+
+    # Files without any rows that match the filters are dropped (unless all files are empty)
+    if filters is not None:
+        nonempty_dfs = [df for df in raw_dfs if len(df) > 0]
+        if len(nonempty_dfs) > 0:
+            raw_dfs = nonempty_dfs
+        else:
+            raw_dfs = raw_dfs[:1]
+
+    if compact:
+        verif_df = concat_met_dfs(raw_dfs)
+    else:
+        verif_df = pd.concat(raw_dfs)
+
+    return verif_df
+
+
+@mprof.timed()
+def read_stat(fnames, line_types=None, verbose=True, filters=None):
+    """
+    Read several MET .stat files and split the rows by line type. Each file is only read once.
+
+    Parameters
+    ----------
+    fnames : list of strings
+        List of .stat filenames to read in
+    line_types : list of strings, optional
+        Line types to retain (e.g., ['sl1l2', 'vl1l2']). Set to None to retain all line types in
+        MET_LINE_TYPE_COLS.
+    verbose : boolean, optional
+        Option to print warning messages if a file does not exist or if a line type is not 
+        supported
+    filters : dictionary, optional
+        Row conditions (same format as the param argument in subset_verif_df()). Rows that do not
+        match string-valued conditions on the header columns are discarded before parsing.
+
+    Returns
+    -------
+    verif_dfs : dictionary
+        Output DataFrames containing the MET output. Key is the line type (lowercase, e.g., 'sl1l2')
+        and the value is a DataFrame with the same columns as the corresponding MET ASCII output
+        file (e.g., *_sl1l2.txt).
+
+    """
+
+    if line_types is not None:
+        line_types = [lt.upper() for lt in line_types]
+    lt_idx = MET_HEADER_COLS.index('LINE_TYPE')
+    idx = []
+    if filters is not None:
+        for k in filters.keys():
+            if (k in MET_HEADER_COLS) and isinstance(filters[k], str):
+                idx.append((MET_HEADER_COLS.index(k), filters[k]))
+
+    # Sort the rows from each file into separate buffers for each line type
+    rows = {}
+    skipped = []
+    for f in fnames:
+        try:
+            with open(f, 'r') as fptr:
+                nrows = 0
+                for line in fptr:
+                    tokens = line.split()
+                    if (len(tokens) <= lt_idx) or (tokens[0] == 'VERSION'):
+                        continue
+                    nrows = nrows + 1
+                    lt = tokens[lt_idx]
+                    if (line_types is not None) and (lt not in line_types):
+                        continue
+                    if lt not in MET_LINE_TYPE_COLS:
+                        if lt not in skipped:
+                            skipped.append(lt)
+                        continue
+                    keep = True
+                    for i, val in idx:
+                        if tokens[i] != val:
+                            keep = False
+                            break
+                    if not keep:
+                        continue
+                    ncols = len(MET_HEADER_COLS) + len(MET_LINE_TYPE_COLS[lt])
+                    if lt not in rows:
+                        rows[lt] = []
+                    if len(tokens) > ncols:
+                        rows[lt].append(' '.join(tokens[:ncols]))
+                    else:
+                        rows[lt].append(line.rstrip('\n'))
+            if nrows == 0:
+                raise ValueError(f"Empty MET file: {f}")
+        except FileNotFoundError:
+            if verbose: print(f"MET file not found: {f}")
+            continue
+    if verbose and (len(skipped) > 0):
+        print(f"Skipping unsupported line types: {skipped}")
+
+    # Parse each line type using the appropriate column names
+    verif_dfs = {}
+    for lt in rows.keys():
+        header = ' '.join(MET_HEADER_COLS + MET_LINE_TYPE_COLS[lt])
+        buf = io.StringIO('\n'.join([header] + rows[lt]))
+        verif_dfs[lt.lower()] = pd.read_csv(buf, sep=r'\s+')
+        if filters is not None:
+            verif_dfs[lt.lower()] = subset_verif_df(verif_dfs[lt.lower()], filters)
+
+    return verif_dfs
+
+
+def build_catalog(exp_dir, verbose=False):
+    """
+    Create a catalog of all the MET output files within an experiment directory. The directory 
+    tree is only scanned once, so nested directories (e.g., <init>/output/GridStat/<valid>/) 
+    can be used without needing to symlink the MET output files into a single directory.
+
+    Parameters
+    ----------
+    exp_dir : string
+        Experiment directory containing MET output
+    verbose : boolean, optional
+        Option to print the number of files found
+
+    Returns
+    -------
+    catalog : pd.DataFrame
+        Catalog with one row per MET output file (symlinks are not included). Columns are 
+        'prefix' (e.g., 'grid_stat_FV3_vs_NR'), 'lead' (hrs), 'valid' (YYYYMMDD_HHMMSS), 
+        'line_type' (e.g., 'sl1l2', or 'stat' for .stat files), 'init_dir' (top-level 
+        subdirectory of exp_dir), and 'path'.
+
+    """
+
+    entries = {'prefix':[], 'lead':[], 'valid':[], 'line_type':[], 'init_dir':[], 'path':[]}
+    stack = [(os.path.abspath(exp_dir), '')]
+    while len(stack) > 0:
+        dname, init_dir = stack.pop()
+        try:
+            it = os.scandir(dname)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        with it:
+            for entry in it:
+                # Symlinks (e.g., from link_GridStat_output.sh) are skipped to avoid duplicates
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir():
+                    if entry.name[0] == '.':
+                        continue
+                    stack.append((entry.path, init_dir if init_dir != '' else entry.name))
+                    continue
+                match = MET_FNAME_RE.match(entry.name)
+                if match is None:
+                    continue
+                entries['prefix'].append(match.group('prefix'))
+                entries['lead'].append(int(match.group('lead')[:-4]))
+                entries['valid'].append(match.group('valid'))
+                if match.group('ext') == 'stat':
+                    entries['line_type'].append('stat')
+                else:
+                    entries['line_type'].append(match.group('line_type'))
+                entries['init_dir'].append(init_dir)
+                entries['path'].append(entry.path)
+
+    catalog = pd.DataFrame(entries)
+    for c in ['prefix', 'line_type', 'init_dir']:
+        catalog[c] = catalog[c].astype('category')
+    catalog.sort_values(['prefix', 'line_type', 'valid', 'lead'], inplace=True, 
+                        ignore_index=True)
+    if verbose:
+        print(f"Found {len(catalog)} MET output files in {exp_dir}")
+
+    return catalog
+
+
+def save_catalog(catalog, fname):
+    """
+    Save a catalog created by build_catalog()
+
+    Parameters
+    ----------
+    catalog : pd.DataFrame
+        Catalog of MET output files
+    fname : string
+        Output file name. A Parquet file is written if fname ends in '.parquet', otherwise the 
+        catalog is pickled.
+
+    Returns
+    -------
+    None
+
+    """
+
+    if fname[-8:] == '.parquet':
+        catalog.to_parquet(fname)
+    else:
+        catalog.to_pickle(fname)
+
+
+def load_catalog(fname):
+    """
+    Load a catalog saved by save_catalog()
+
+    Parameters
+    ----------
+    fname : string
+        Catalog file name
+
+    Returns
+    -------
+    catalog : pd.DataFrame
+        Catalog of MET output files
+
+    """
+
+    if fname[-8:] == '.parquet':
+        catalog = pd.read_parquet(fname)
+    else:
+        catalog = pd.read_pickle(fname)
+
+    return catalog
+
+
+def format_sims(sim_dict, verif_type, subtyp):
+    """
+    Fill in the verification type and subtype in the 'dir' and 'catalog' entries of sim_dict
+
+    Parameters
+    ----------
+    sim_dict : Dictionary
+        Simulations from the input YAML file
+    verif_type : String
+        Verification type
+    subtyp : String
+        Verification subtype
+
+    Returns
+    -------
+    input_sims : Dictionary
+        Copy of sim_dict with 'dir' and 'catalog' formatted
+
+    """
+
+    input_sims = copy.deepcopy(sim_dict)
+    for key in input_sims:
+        input_sims[key]['dir'] = input_sims[key]['dir'].format(typ=verif_type, subtyp=subtyp)
+        if 'catalog' in input_sims[key]:
+            input_sims[key]['catalog'] = input_sims[key]['catalog'].format(typ=verif_type,
+                                                                           subtyp=subtyp)
+
+    return input_sims
+
+
+def met_fnames(sim, file_prefix, fcst_lead, valid_times, line_type):
+    """
+    Determine the MET output file names for a simulation
+
+    Parameters
+    ----------
+    sim : dictionary
+        Simulation information. Must contain either 'dir' (directory with MET output files) or 
+        'catalog' (catalog file created by build_catalog() and save_catalog()). If 'catalog' is
+        present, the file names are resolved using the catalog. MET .stat files are used if the
+        line-type-specific file is not in the catalog.
+    file_prefix : string
+        Prefix of METplus output files
+    fcst_lead : list of integers
+        Forecast lead times (hrs). Same length as valid_times.
+    valid_times : list of dt.datetime objects
+        Forecast valid times. Same length as fcst_lead.
+    line_type : string
+        MET output line type
+
+    Returns
+    -------
+    fnames : list of strings
+        MET output file names. File names are still returned for files that do not exist so that
+        read_ascii() can report them as missing.
+
+    """
+
+    default = ['%s/%s_%02d0000L_%sV_%s.txt' %
+               (sim['dir'] if 'dir' in sim else '.', file_prefix, l, t.strftime('%Y%m%d_%H%M%S'), 
+                line_type)
+               for l, t in zip(fcst_lead, valid_times)]
+    if 'catalog' not in sim:
+        return default
+
+    # Load catalog and create a lookup table (only done once per catalog)
+    cat_name = sim['catalog']
+    mtime = os.stat(cat_name).st_mtime_ns
+    if (cat_name not in LOADED_CATALOGS) or (LOADED_CATALOGS[cat_name][0] != mtime):
+        catalog = load_catalog(cat_name)
+        lookup = dict(zip(zip(catalog['prefix'].astype(str), catalog['lead'], catalog['valid'], 
+                              catalog['line_type'].astype(str)), 
+                          catalog['path']))
+        LOADED_CATALOGS[cat_name] = (mtime, lookup)
+    lookup = LOADED_CATALOGS[cat_name][1]
+
+    fnames = []
+    for l, t, d in zip(fcst_lead, valid_times, default):
+        key = (file_prefix, int(l), t.strftime('%Y%m%d_%H%M%S'))
+        if key + (line_type,) in lookup:
+            fnames.append(lookup[key + (line_type,)])
+        elif key + ('stat',) in lookup:
+            fnames.append(lookup[key + ('stat',)])
+        else:
+            fnames.append(d)
+
+    return fnames
+
+
+def subset_verif_df(df, param, copy=True):
+    """
+    Select rows from a verification DataFrame that meet certain conditions
+
+    Parameters
+    ----------
+    df : pd.DataFrame or IndexedVerifDF
+        MET verification output. Use an IndexedVerifDF if the same DataFrame is subset many times.
+    param : dictionary
+        Row conditions. Key = column name (from MET output file), value = column value
+        In addition to being a column name, the key can also be "not_<column name>". In this case, 
+        rows with a column value equal to <column name> are excluded.
+    copy : boolean, optional
+        Option to return a copy of the selected rows. Set to False if the output will not be 
+        modified, which allows an IndexedVerifDF to return a view of the selected rows.
+
+    Returns
+    -------
+    subset_df : pd.DataFrame
+        Input DataFrame with certain rows selected
+
+    """
+
+    if isinstance(df, IndexedVerifDF):
+        return df.subset(param, copy=copy)
+
+    cond = np.ones(len(df), dtype=bool)
+    for k in param.keys():
+        if k[:3] == 'not':
+            cond = cond & (df[k[4:]] != param[k]).values
+        else:
+            cond = cond & (df[k] == param[k]).values
+    subset_df = df.loc[cond, :]
+    if copy:
+        subset_df = subset_df.copy()
+
+    return subset_df
+
+
+class IndexedVerifDF():
+    """
+    Verification DataFrame that is indexed so that it can be subset many times efficiently
+
+    Rows are sorted (stably) by the index keys, so rows that match all of the index keys are 
+    contiguous and can be returned as a view. Lookups that only use some of the index keys still 
+    use the index, but the selected rows are copied so that they retain the original row order.
+
+    Subsets returned with copy=False are cached, so the same DataFrame is returned when a subset is 
+    requested again (e.g., the control simulation subset for each experiment in a difference plot).
+    This allows statistics computed from that subset to be reused (see control_stats()).
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        MET verification output from read_ascii()
+    keys : list of strings, optional
+        Columns used to index the DataFrame. Columns that are not in df are ignored.
+    max_subsets : integer, optional
+        Maximum number of subsets to cache. Least recently used subsets are removed first.
+
+    """
+
+    def __init__(self, df, 
+                 keys=['FCST_VAR', 'FCST_LEV', 'FCST_LEAD', 'OBTYPE', 'VX_MASK'],
+                 max_subsets=32):
+
+        self.df = df
+        self.max_subsets = max_subsets
+        self.subsets = collections.OrderedDict()
+        self.keys = [k for k in keys if k in df.columns]
+        if len(self.keys) > 0:
+            self.index, self.order = pd.MultiIndex.from_frame(df[self.keys]).sortlevel()
+            self.sorted_df = df.iloc[self.order]
+        else:
+            self.order = np.arange(len(df))
+            self.sorted_df = df
+
+    def __len__(self):
+        return len(self.df)
+
+    def subset(self, param, copy=False):
+        """
+        Select rows that meet certain conditions
+
+        Parameters
+        ----------
+        param : dictionary
+            Row conditions (same format as the param argument in subset_verif_df())
+        copy : boolean, optional
+            Option to return a copy of the selected rows. If False, a view of the selected rows 
+            is returned when possible, and the same DataFrame is returned for repeated calls with 
+            the same param (so it should not be modified in place).
+
+        Returns
+        -------
+        subset_df : pd.DataFrame
+            Selected rows (in the same order as in the original DataFrame)
+
+        """
+
+        if copy:
+            return self._subset(param).copy()
+
+        key = repr(sorted(param.items()))
+        if key in self.subsets:
+            self.subsets.move_to_end(key)
+        else:
+            self.subsets[key] = self._subset(param)
+            while len(self.subsets) > self.max_subsets:
+                self.subsets.popitem(last=False)
+
+        return self.subsets[key]
+
+    def _subset(self, param):
+        """
+        Select rows that meet certain conditions without caching or copying (see subset())
+        """
+
+        # Use the index for equality conditions on the index keys
+        idx_param = {k:param[k] for k in self.keys if k in param}
+        other_param = {k:param[k] for k in param if k not in idx_param}
+        if len(idx_param) == 0:
+            return subset_verif_df(self.df, param, copy=False)
+        try:
+            locs = self.index.get_locs([idx_param[k] if k in idx_param else slice(None) 
+                                        for k in self.keys])
+        except (KeyError, TypeError):
+            locs = np.zeros(0, dtype=int)
+
+        # Rows that match all the index keys are contiguous and already in the original order, so 
+        # they can be returned as a view
+        if (len(locs) == 0) or (len(idx_param) == len(self.keys)):
+            start = locs[0] if len(locs) > 0 else 0
+            subset_df = self.sorted_df.iloc[start:(start + len(locs))]
+        else:
+            subset_df = self.df.iloc[np.sort(self.order[locs])]
+
+        if len(other_param) > 0:
+            subset_df = subset_verif_df(subset_df, other_param, copy=False)
+
+        return subset_df
+
+
+class VerifSession():
+    """
+    In-memory store of MET output DataFrames that can be shared by several plots
+
+    Each set of MET output files is only read once (for a given set of read_ascii() keyword 
+    arguments). The least recently used DataFrames are removed once the session holds more than 
+    max_entries DataFrames or more than max_bytes bytes, so memory stays bounded over a long run.
+
+    The same DataFrame is returned each time a set of files is requested, so the DataFrames 
+    returned by read() and indexed() should not be modified in place.
+
+    Parameters
+    ----------
+    max_entries : integer, optional
+        Maximum number of DataFrames to keep
+    max_bytes : float, optional
+        Maximum total memory usage of the DataFrames (bytes). Set to None for no limit.
+    filter_keys : list of strings, optional
+        Row conditions from plot_param that are applied when reading MET output for plots (see 
+        read_kw_prep()). Other conditions (e.g., FCST_LEV) are not applied so that 
+        the same DataFrame can be used for plots of different levels and lead times.
+
+    """
+
+    def __init__(self, max_entries=16, max_bytes=None, 
+                 filter_keys=['FCST_VAR', 'OBTYPE', 'VX_MASK']):
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.filter_keys = filter_keys
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, fnames, read_kw):
+        """
+        Key for a set of MET output files and read_ascii() keyword arguments
+        """
+
+        kw = {k:read_kw[k] for k in read_kw if k != 'verbose'}
+        return (tuple(fnames), json.dumps(kw, sort_keys=True, default=str))
+
+    def read(self, fnames, **read_kw):
+        """
+        Read MET output files, reusing the DataFrame if these files have already been read
+
+        Parameters
+        ----------
+        fnames : list of strings
+            MET output files
+        **read_kw : optional
+            Keyword arguments passed to read_ascii()
+
+        Returns
+        -------
+        verif_df : pd.DataFrame
+            DataFrame with MET output
+
+        """
+
+        return self.get(fnames, read_kw)['df']
+
+    def indexed(self, fnames, **read_kw):
+        """
+        Same as read(), but returns an IndexedVerifDF (which is also reused)
+        """
+
+        entry = self.get(fnames, read_kw)
+        if entry['idx'] is None:
+            entry['idx'] = IndexedVerifDF(entry['df'])
+            nbytes = int(entry['idx'].sorted_df.memory_usage(deep=True).sum())
+            entry['nbytes'] = entry['nbytes'] + nbytes
+            self.nbytes = self.nbytes + nbytes
+            self.evict()
+
+        return entry['idx']
+
+    def get(self, fnames, read_kw):
+        """
+        Return the session entry for a set of MET output files, reading the files if needed
+        """
+
+        k = self.key(fnames, read_kw)
+        if k in self.entries:
+            self.hits = self.hits + 1
+            self.entries.move_to_end(k)
+            return self.entries[k]
+
+        self.misses = self.misses + 1
+        df = read_ascii(fnames, **read_kw)
+        entry = {'df':df, 'idx':None, 'nbytes':int(df.memory_usage(deep=True).sum())}
+        self.entries[k] = entry
+        self.nbytes = self.nbytes + entry['nbytes']
+        self.evict()
+
+        return entry
+
+    def evict(self):
+        """
+        Remove the least recently used DataFrames until the session is within its limits. The most 
+        recently used DataFrame is always kept.
+        """
+
+        while len(self.entries) > 1:
+            if ((len(self.entries) > self.max_entries) or 
+                ((self.max_bytes is not None) and (self.nbytes > self.max_bytes))):
+                _, entry = self.entries.popitem(last=False)
+                self.nbytes = self.nbytes - entry['nbytes']
+            else:
+                break
+
+    def clear(self):
+        """
+        Remove all DataFrames from the session
+        """
+
+        self.entries.clear()
+        self.nbytes = 0
+
+
+class VerifCube():
+    """
+    Dense, labeled N-D array of MET output (usually created by build_cube())
+
+    Each field (e.g., a partial sum or a derived statistic) is a NumPy array with one axis for
+    each dimension. Missing entries are NaN. The plots are then slices and reductions of the
+    cube. For example, if the dimensions are 'sim', 'FCST_LEAD', 'FCST_VALID_BEG', 'FCST_LEV',
+    and 'FCST_VAR':
+
+        Time series : cube.stats(['RMSE']).sel(sim='ctrl', FCST_LEAD=60000, FCST_LEV='P500',
+                                               FCST_VAR='TMP')
+        Die-off : cube.stats(['RMSE']).mean('FCST_VALID_BEG').sel(FCST_LEV='P500', FCST_VAR='TMP')
+        Vertical profile : cube.stats(['RMSE']).mean('FCST_VALID_BEG').sel(FCST_LEAD=60000,
+                                                                           FCST_VAR='TMP')
+        Sawtooth : cube.stats(['RMSE']).sel_points(FCST_LEAD=leads, FCST_VALID_BEG=valid_times)
+
+    Parameters
+    ----------
+    fields : dictionary
+        Arrays for each field. Key is the field name. All arrays have the same shape.
+    dims : list of strings
+        Dimension names (one for each array axis)
+    coords : dictionary
+        Labels for each dimension. Key is the dimension name.
+    line_type : string, optional
+        MET output line type. Needed by stats() and aggregate().
+
+    """
+
+    def __init__(self, fields, dims, coords, line_type=None):
+
+        self.fields = fields
+        self.dims = list(dims)
+        self.coords = {d:np.asarray(coords[d]) for d in self.dims}
+        self.line_type = line_type
+
+    @property
+    def shape(self):
+        return tuple(len(self.coords[d]) for d in self.dims)
+
+    def sel(self, **labels):
+        """
+        Select entries using coordinate labels. A scalar label removes the dimension and a list
+        of labels keeps the dimension. A KeyError is raised if a label is not in the cube.
+        """
+
+        fields = self.fields
+        dims = list(self.dims)
+        coords = dict(self.coords)
+        for d, lab in labels.items():
+            ax = dims.index(d)
+            index = pd.Index(coords[d])
+            if np.ndim(lab) == 0:
+                i = index.get_loc(lab)
+                dims.pop(ax)
+                del coords[d]
+            else:
+                i = index.get_indexer(lab)
+                if np.any(i < 0):
+                    raise KeyError(f'labels not in {d}: {list(np.asarray(lab)[i < 0])}')
+                coords[d] = coords[d][i]
+            fields = {f:np.take(v, i, axis=ax) for f, v in fields.items()}
+
+        return VerifCube(fields, dims, coords, line_type=self.line_type)
+
+    def sel_points(self, dim='point', **labels):
+        """
+        Select individual points using lists of labels that have the same length (e.g., the
+        forecast lead and valid times along one forecast for a sawtooth diagram). The selected
+        dimensions are replaced by a single dimension (dim) with one entry for each point, which
+        is the first dimension in the new cube. Missing points are NaN.
+        """
+
+        sel_dims = list(labels.keys())
+        idx = [pd.Index(self.coords[d]).get_indexer(labels[d]) for d in sel_dims]
+        missing = np.any(np.array(idx) < 0, axis=0)
+        idx = tuple(np.where(missing, 0, i) for i in idx)
+        axes = [self.dims.index(d) for d in sel_dims]
+
+        fields = {}
+        for f, v in self.fields.items():
+            v = np.moveaxis(v, axes, list(range(len(axes))))[idx]
+            v[missing] = np.nan
+            fields[f] = v
+        dims = [dim] + [d for d in self.dims if d not in sel_dims]
+        coords = {d:self.coords[d] for d in dims[1:]}
+        coords[dim] = np.arange(len(missing))
+
+        return VerifCube(fields, dims, coords, line_type=self.line_type)
+
+    def stats(self, stats):
+        """
+        Return a copy of the cube with derived statistics (from STAT_REGISTRY) added as fields
+        """
+
+        order = resolve_stats(self.line_type, stats, list(self.fields.keys()))
+        vals = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name in order:
+                entry = STAT_REGISTRY[self.line_type][name]
+                args = [vals[d] if d in vals else self.fields[d] for d in entry['deps']]
+                vals[name] = entry['fcn'](*args)
+
+        fields = dict(self.fields)
+        for name in stats:
+            if name in vals:
+                fields[name] = vals[name]
+
+        return VerifCube(fields, self.dims, self.coords, line_type=self.line_type)
+
+    def reduce(self, dims, fcn):
+        """
+        Apply fcn(array, axes) to each field to remove certain dimensions
+        """
+
+        if isinstance(dims, str):
+            dims = [dims]
+        axes = tuple(self.dims.index(d) for d in dims)
+        fields = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for f, v in self.fields.items():
+                fields[f] = fcn(f, v, axes)
+        new_dims = [d for d in self.dims if d not in dims]
+
+        return VerifCube(fields, new_dims, {d:self.coords[d] for d in new_dims},
+                         line_type=self.line_type)
+
+    def mean(self, dims):
+        """
+        Average each field over certain dimensions, ignoring missing entries. TOTAL is summed.
+        This matches compute_stats_by_group() with agg = False.
+        """
+
+        def fcn(f, v, axes):
+            n = np.sum(np.isfinite(v), axis=axes)
+            s = np.nansum(v, axis=axes)
+            if f == 'TOTAL':
+                return np.where(n > 0, s, np.nan)
+            return safe_divide(s, n)
+
+        return self.reduce(dims, fcn)
+
+    def aggregate(self, dims):
+        """
+        Aggregate the partial sums over certain dimensions, ignoring missing entries. This matches
+        aggregate_line_type(). Fields that are not in LINE_TYPE_REGISTRY are removed.
+        """
+
+        reg = LINE_TYPE_REGISTRY[self.line_type]
+        wgt = self.fields['TOTAL']
+
+        def fcn(f, v, axes):
+            valid = np.isfinite(v) & np.isfinite(wgt)
+            if f in reg['sum']:
+                return np.where(np.any(valid, axis=axes), np.sum(np.where(valid, v, 0), axis=axes),
+                                np.nan)
+            return safe_divide(np.sum(np.where(valid, v * wgt, 0), axis=axes),
+                               np.sum(np.where(valid, wgt, 0), axis=axes))
+
+        cube = VerifCube({f:self.fields[f] for f in self.fields
+                          if (f in reg['sum']) or (f in reg['mean'])},
+                         self.dims, self.coords, line_type=self.line_type)
+
+        return cube.reduce(dims, fcn)
+
+    def to_dataframe(self):
+        """
+        Convert to a DataFrame with one column for each dimension and field. Entries that are
+        missing for all fields are removed.
+        """
+
+        mesh = np.meshgrid(*[self.coords[d] for d in self.dims], indexing='ij')
+        df = pd.DataFrame({d:m.ravel() for d, m in zip(self.dims, mesh)})
+        for f, v in self.fields.items():
+            df[f] = v.ravel()
+        keep = np.any(np.isfinite(df[list(self.fields.keys())].to_numpy(dtype=float)), axis=1)
+
+        return df.loc[keep].reset_index(drop=True)
+
+    def to_xarray(self):
+        """
+        Convert to an xarray.Dataset (requires xarray)
+        """
+
+        import xarray as xr
+
+        attrs = {} if self.line_type is None else {'line_type':self.line_type}
+        return xr.Dataset({f:(self.dims, v) for f, v in self.fields.items()},
+                          coords=self.coords, attrs=attrs)
+
+
+@mprof.timed()
+def build_cube(verif_df, dims=CUBE_DIMS, fields=None, coords={}, line_type='sl1l2'):
+    """
+    Create a dense, labeled N-D array (VerifCube) from MET output
+
+    Parameters
+    ----------
+    verif_df : pd.DataFrame or dictionary
+        MET output from read_ascii(). If a dictionary (key = simulation name, value = MET output),
+        a 'sim' dimension is added as the first dimension.
+    dims : list of strings, optional
+        Columns used as the cube dimensions. Each row should have a unique combination of these
+        columns (e.g., subset by VX_MASK first or include VX_MASK in dims). If several rows map to
+        the same entry, the last row is used and a warning is printed.
+    fields : list of strings, optional
+        Columns stored in the cube. Set to None to use the columns in LINE_TYPE_REGISTRY (i.e.,
+        the partial sums) for line_type, or all numeric columns if line_type is not registered.
+    coords : dictionary, optional
+        Labels for each dimension (e.g., all valid times, including those without MET output).
+        Rows with labels that are not in coords are not used. Dimensions that are not in coords
+        use the sorted unique values in verif_df.
+    line_type : string, optional
+        MET output line type
+
+    Returns
+    -------
+    cube : VerifCube
+        MET output as a labeled N-D array. Missing entries are NaN.
+
+    """
+
+    if isinstance(verif_df, dict):
+        dfs = verif_df
+        all_dims = ['sim'] + list(dims)
+        coords = {'sim':list(verif_df.keys()), **coords}
+    else:
+        dfs = {None:verif_df}
+        all_dims = list(dims)
+
+    # Add the columns needed to aggregate some line types (e.g., FSS_DEN for NBRCNT)
+    reg = LINE_TYPE_REGISTRY.get(line_type, None)
+    if (reg is not None) and (reg['prep'] is not None):
+        dfs = {k:df.assign(**reg['prep'](df)) for k, df in dfs.items()}
+    if fields is None:
+        if reg is not None:
+            fields = [c for c in reg['sum'] + reg['mean']
+                      if np.any([c in df.columns for df in dfs.values()])]
+        else:
+            fields = [c for df in dfs.values() for c in df.columns
+                      if (c not in MET_HEADER_COLS) and pd.api.types.is_numeric_dtype(df[c])]
+            fields = list(dict.fromkeys(fields))
+
+    cube_coords = {}
+    for d in all_dims:
+        if d in coords:
+            cube_coords[d] = np.asarray(coords[d])
+        else:
+            cube_coords[d] = np.unique(np.concatenate([df[d].to_numpy() for df in dfs.values()]))
+    shape = tuple(len(cube_coords[d]) for d in all_dims)
+
+    # Place each row in the cube
+    out = {f:np.full(shape, np.nan) for f in fields}
+    for key, df in dfs.items():
+        keep = np.ones(len(df), dtype=bool)
+        idx = []
+        for d in all_dims:
+            if (d == 'sim') and (key is not None):
+                i = pd.Index(cube_coords[d]).get_indexer([key])[0]
+                code = np.full(len(df), i)
+            else:
+                code = pd.Index(cube_coords[d]).get_indexer(df[d].to_numpy())
+            keep = keep & (code >= 0)
+            idx.append(code)
+        flat = np.ravel_multi_index(tuple(code[keep] for code in idx), shape)
+        if len(np.unique(flat)) < len(flat):
+            print(f"Warning: build_cube: {len(flat) - len(np.unique(flat))} rows map to the same "
+                  f"entry as another row (sim = {key}). The last row is used.")
+        for f in fields:
+            if f in df.columns:
+                out[f].flat[flat] = df[f].to_numpy(dtype=float)[keep]
+
+    return VerifCube(out, all_dims, cube_coords, line_type=line_type)
+
+
+def save_cube(cube, fname):
+    """
+    Save a VerifCube
+
+    Parameters
+    ----------
+    cube : VerifCube
+        Cube to save
+    fname : string
+        Output file name. A NetCDF file is written if fname ends in '.nc' and a Zarr store is
+        written if fname ends in '.zarr' (both require xarray). Otherwise, a NumPy .npz file is
+        written.
+
+    Returns
+    -------
+    None
+
+    """
+
+    if fname[-3:] == '.nc':
+        cube.to_xarray().to_netcdf(fname)
+    elif fname[-5:] == '.zarr':
+        cube.to_xarray().to_zarr(fname, mode='w')
+    else:
+        arrays = {'dims':np.array(cube.dims, dtype=str),
+                  'line_type':np.array('' if cube.line_type is None else cube.line_type)}
+        for d in cube.dims:
+            c = cube.coords[d]
+            arrays[f'coord_{d}'] = c.astype(str) if c.dtype == object else c
+        for f, v in cube.fields.items():
+            arrays[f'field_{f}'] = v
+        with open(fname, 'wb') as fptr:
+            np.savez(fptr, **arrays)
+
+
+def load_cube(fname):
+    """
+    Load a VerifCube saved by save_cube()
+
+    Parameters
+    ----------
+    fname : string
+        Cube file name
+
+    Returns
+    -------
+    cube : VerifCube
+        Cube read from fname
+
+    """
+
+    if fname[-3:] == '.nc' or fname[-5:] == '.zarr':
+        import xarray as xr
+        if fname[-3:] == '.nc':
+            ds = xr.open_dataset(fname).load()
+        else:
+            ds = xr.open_zarr(fname).load()
+        dims = list(ds[list(ds.data_vars)[0]].dims)
+        return VerifCube({f:ds[f].values for f in ds.data_vars}, dims,
+                         {d:ds[d].values for d in dims},
+                         line_type=ds.attrs['line_type'] if 'line_type' in ds.attrs else None)
+
+    with np.load(fname, allow_pickle=False) as data:
+        dims = [str(d) for d in data['dims']]
+        line_type = str(data['line_type'])
+        fields = {k[6:]:data[k] for k in data.files if k[:6] == 'field_'}
+        coords = {d:data[f'coord_{d}'] for d in dims}
+
+    return VerifCube(fields, dims, coords, line_type=line_type if line_type != '' else None)
+
+
+@mprof.timed()
+def compute_scorecard(verif_df, ctrl, stats=['RMSE'], dims=SCORECARD_DIMS, line_type='sl1l2',
+                      pct=False, ci_lvl=0.95, ci_opt='t_dist', ci_kw={}, coords={}):
+    """
+    Compute paired differences between several experiments and a control simulation, along with
+    their significance, for every cell of a scorecard at once
+
+    Statistics are computed for each valid time in a VerifCube (the control statistics are only
+    computed once and are shared by all experiments), then the paired differences are averaged
+    over the valid times. A difference is significant if its confidence interval does not
+    include 0.
+
+    Parameters
+    ----------
+    verif_df : dictionary or VerifCube
+        MET output from read_ascii() for each simulation (key = simulation name, value = MET
+        output), or a VerifCube with a 'sim' dimension created by build_cube()
+    ctrl : string
+        Name of the control simulation
+    stats : list of strings, optional
+        Statistics to compare
+    dims : list of strings, optional
+        Cube dimensions (see build_cube()). Must include 'FCST_VALID_BEG', which is the dimension
+        the paired differences are averaged over. Not used if verif_df is a VerifCube.
+    line_type : string, optional
+        MET output line type. Not used if verif_df is a VerifCube.
+    pct : boolean, optional
+        Option to compute percent differences relative to the control
+    ci_lvl : float, optional
+        Confidence interval level as a fraction
+    ci_opt : string, optional
+        Method used to create confidence intervals ('t_dist' or 'bootstrap')
+    ci_kw : dictionary, optional
+        Additional keyword arguments passed to the confidence interval function
+    coords : dictionary, optional
+        Labels for each dimension (passed to build_cube())
+
+    Returns
+    -------
+    scorecard : pd.DataFrame
+        One row for each experiment, cell (i.e., combination of dims other than FCST_VALID_BEG),
+        and statistic. Columns are 'sim', the cell dimensions, 'stat', 'ctrl' and 'exp' (mean
+        statistics for the paired valid times), 'diff' (mean paired difference), 'ci_low',
+        'ci_high', 'N' (number of paired valid times), and 'score' (1 if the experiment is
+        significantly better than the control, -1 if significantly worse, 0 otherwise).
+        SCORECARD_BETTER defines whether lower or higher values are better. For statistics not
+        in SCORECARD_BETTER, 'score' is the sign of the significant differences. Cells without
+        any paired valid times are not included.
+
+    """
+
+    if isinstance(verif_df, VerifCube):
+        cube = verif_df
+    else:
+        cube = build_cube(verif_df, dims=dims, line_type=line_type, coords=coords)
+    cube = cube.stats(stats)
+    exp_names = [s for s in cube.coords['sim'] if s != ctrl]
+    exp_cube = cube.sel(sim=exp_names)
+    ctrl_cube = cube.sel(sim=ctrl)
+
+    # Cells are all dimensions except the sample dimension (FCST_VALID_BEG), which is last
+    t_ax = exp_cube.dims.index('FCST_VALID_BEG')
+    cell_dims = [d for d in exp_cube.dims if d != 'FCST_VALID_BEG']
+    mesh = np.meshgrid(*[exp_cube.coords[d] for d in cell_dims], indexing='ij')
+
+    out = []
+    for s in stats:
+        if s not in cube.fields:
+            print(f'Warning: compute_scorecard: Cannot compute {s} for line type {cube.line_type}')
+            continue
+        e = np.moveaxis(exp_cube.fields[s], t_ax, -1)
+        c = np.expand_dims(ctrl_cube.fields[s], exp_cube.dims.index('sim'))
+        c = np.broadcast_to(np.moveaxis(c, t_ax, -1), e.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = e - c
+            if pct:
+                d = 1e2 * d / c
+
+        # Means over the valid times where both the experiment and control have statistics
+        valid = np.isfinite(d)
+        n = np.sum(valid, axis=-1)
+        means = {k:safe_divide(np.sum(np.where(valid, v, 0), axis=-1), n)
+                 for k, v in zip(['exp', 'ctrl', 'diff'], [e, c, d])}
+
+        # Confidence intervals for all cells with at least 2 paired valid times at once. Values
+        # for each cell are contiguous and in temporal order
+        use = (n >= 2).ravel()
+        flat_valid = valid.reshape(-1, valid.shape[-1]) & use[:, np.newaxis]
+        counts = np.sum(flat_valid, axis=1)[use]
+        ci_low = np.full(use.size, np.nan)
+        ci_high = np.full(use.size, np.nan)
+        if len(counts) > 0:
+            starts = np.append(0, np.cumsum(counts)[:-1])
+            low, high = confidence_interval_mean_groups(d.reshape(-1, d.shape[-1])[flat_valid],
+                                                        starts=starts, level=ci_lvl,
+                                                        option=ci_opt, ci_kw=ci_kw)
+            ci_low[use] = low
+            ci_high[use] = high
+
+        # Score each cell
+        sig = (ci_low > 0) | (ci_high < 0)
+        diff = means['diff'].ravel()
+        better = SCORECARD_BETTER.get(s, None)
+        if better == 'lower':
+            improve = diff < 0
+        elif better == 'higher':
+            improve = diff > 0
+        elif better in ['zero', 'one']:
+            target = 0. if better == 'zero' else 1.
+            improve = (np.abs(means['exp'].ravel() - target) <
+                       np.abs(means['ctrl'].ravel() - target))
+        else:
+            improve = diff > 0
+        score = np.where(sig, np.where(improve, 1, -1), 0)
+
+        s_df = pd.DataFrame({dim:m.ravel() for dim, m in zip(cell_dims, mesh)})
+        s_df['stat'] = s
+        s_df['ctrl'] = means['ctrl'].ravel()
+        s_df['exp'] = means['exp'].ravel()
+        s_df['diff'] = diff
+        s_df['ci_low'] = ci_low
+        s_df['ci_high'] = ci_high
+        s_df['N'] = n.ravel()
+        s_df['score'] = score
+        out.append(s_df.loc[s_df['N'].values > 0])
+
+    if len(out) == 0:
+        return pd.DataFrame(columns=cell_dims + ['stat', 'ctrl', 'exp', 'diff', 'ci_low',
+                                                 'ci_high', 'N', 'score'])
+    return pd.concat(out, ignore_index=True)
+
+
+def diff_plot_prep(input_sims, diff_kw, line_type):
+    """
+    Determine the name of the ctrl simulation and add line_type to diff_kw
+
+    Parameters
+    ----------
+    input_sims : Dictionary
+        METplus output files. Key is simulation name (used in the legend). The value is another
+        dictionary containing 'dir' (METplus output directory), 'color', and 'ctrl'.
+    diff_kw : Dictionary
+        Keyword arguments passed to compute_stats_diff()
+    line_type : String
+        METplus line type
+
+    Returns
+    -------
+    ctrl_name : String
+        Name of the control simulation
+    diff_kw : Dictionary
+        Keyword arguments passed to compute_stats_diff() with line_type added
+
+    """
+
+    for sim in input_sims:
+        if input_sims[sim]['ctrl']:
+            ctrl_name = sim
+    if 'compute_kw' not in diff_kw:
+        diff_kw['compute_kw'] = {}
+    diff_kw['compute_kw']['line_type'] = line_type
+
+    return ctrl_name, diff_kw
+
+
+def ci_kw_prep(ci_opt, ci_kw):
+    """
+    Ensure that bootstrap confidence intervals for every simulation in a plot are computed using 
+    the same resample indices (and block lengths, if using a block bootstrap)
+
+    Parameters
+    ----------
+    ci_opt : String
+        Method used to create confidence intervals
+    ci_kw : Dictionary
+        Additional keyword arguments passed to the confidence interval function
+
+    Returns
+    -------
+    ci_kw_local : Dictionary
+        Copy of ci_kw. If ci_opt is 'bootstrap', an integer random_state and a block_lengths 
+        dictionary are added to ci_kw_local['bootstrap_kw'] (if not already present).
+
+    """
+
+    ci_kw_local = copy.deepcopy(ci_kw)
+    if ci_opt == 'bootstrap':
+        if 'bootstrap_kw' not in ci_kw_local:
+            ci_kw_local['bootstrap_kw'] = {}
+        bootstrap_kw = ci_kw_local['bootstrap_kw']
+        if 'rng' in bootstrap_kw:
+            bootstrap_kw['random_state'] = bootstrap_kw.pop('rng')
+        if 'random_state' not in bootstrap_kw or bootstrap_kw['random_state'] is None:
+            bootstrap_kw['random_state'] = int(np.random.SeedSequence().generate_state(1)[0])
+        elif isinstance(bootstrap_kw['random_state'], np.random.Generator):
+            bootstrap_kw['random_state'] = int(bootstrap_kw['random_state'].integers(2**63))
+        if 'block_lengths' not in bootstrap_kw:
+            bootstrap_kw['block_lengths'] = {}
+
+    return ci_kw_local
+
+
+def read_kw_prep(input_sims, plot_param, read_kw, line_type, session=None):
     """
-    Compute the confidence interval for the mean of a dataset using a t distribution
+    Add row conditions from plot_param to the keyword arguments passed to read_ascii() so that
+    rows that are not plotted are removed as the MET output is read. line_type is also added so
+    that MET .stat files can be read.
 
     Parameters
     ----------
-    data : np.array
-        Input data
-    level : Float, optional
-        Confidence level for the confidence interval
-    acct_lag_corr : Boolean, optional
-        Option to account to autocorrelated data by using the lag-1 autocorrelation when computing 
-        the standard error. Method is based on Wilks (2011), eqn 5.12 (note that this is slightly 
-        different from the equation used in MATS at GSL). Note that this assumes that the input 
-        data are "in order" (e.g., each data point is an hour after the previous data point).
-    mats_ste : Boolean, optional
-        Option to use the MATS formulation for standard error when accounting for temporal
-        autocorrelation. For information on the MATS method, see here:
-        https://ruc.noaa.gov/stats/vertical/StdErrorcalculationonEMBverificationpages/StdErrorcalculationonEMBverificationpages.html
+    input_sims : Dictionary
+        METplus output files. Key is simulation name (used in the legend). The value is another
+        dictionary containing 'dir' (METplus output directory), 'color', and 'ctrl'.
+    plot_param : dictionary
+        Parameters used to select which rows from the MET output to plot
+    read_kw : Dictionary
+        Keyword arguments passed to read_ascii()
+    line_type : String
+        METplus line type
+    session : VerifSession, optional
+        Shared MET output session. If provided, only the row conditions in session.filter_keys 
+        are used so that the MET output can be shared with other plots.
 
     Returns
     -------
-    ci : Tuple
-        Upper and lower bound of the confidence interval
+    read_kw_local : Dictionary
+        Keyword arguments passed to read_ascii() with 'filters' and 'line_type' added
 
     """
 
-    n = len(data)
-    avg = np.mean(data)
-    std = np.std(data) 
-    t_low = ss.t.ppf(0.5 * (1 - level), n - 1)
-
-    # Compute standard error
-    if acct_lag_corr:
-        auto_corr = max(np.corrcoef(data[1:], data[:-1])[0, -1], 0)
-    else:
-        auto_corr = 0
-    if mats_ste:
-        ste = std / (np.sqrt((n - 1) * (1 - auto_corr)))
-    else:
-        ste = std / (np.sqrt(n * (1 - auto_corr) / (1 + auto_corr)))
+    read_kw_local = copy.deepcopy(read_kw)
+    if 'filters' not in read_kw_local:
+        filters = copy.deepcopy(plot_param)
+        if session is not None:
+            filters = {k:filters[k] for k in filters if k in session.filter_keys}
 
-    ci = (avg + (t_low * ste), avg - (t_low * ste))
+        # 'subset' overrides OBTYPE for some simulations, so OBTYPE cannot be used as a filter
+        for key in input_sims.keys():
+            if ('subset' in input_sims[key].keys()) and ('OBTYPE' in filters):
+                del filters['OBTYPE']
+        read_kw_local['filters'] = filters
+    read_kw_local['line_type'] = line_type
 
-    return ci
+    return read_kw_local
 
 
-def confidence_interval_bootstrap_mean(data, level=0.95, bootstrap_kw={}):
+def read_met_output(fnames, read_kw, verbose=False, session=None, indexed=False):
     """
-    Compute the confidence interval for the mean of a dataset using a bootstrap
+    Read MET output files using read_ascii() or a shared VerifSession
 
     Parameters
     ----------
-    data : np.array
-        Input data
-    level : Float, optional
-        Confidence level for the confidence interval
-    bootstrap_kw : Dictionary, optional
-        Keyword to pass to bootstrap function
+    fnames : List of strings
+        MET output files
+    read_kw : Dictionary
+        Keyword arguments passed to read_ascii() (from read_kw_prep())
+    verbose : Boolean, optional
+        Option to have verbose output from read_ascii()
+    session : VerifSession, optional
+        Shared MET output session. Set to None to always read the MET output files.
+    indexed : Boolean, optional
+        Option to also return a IndexedVerifDF
 
     Returns
     -------
-    ci : Tuple
-        Upper and lower bound of the confidence interval
+    verif_df : pd.DataFrame
+        DataFrame containing METplus output. Should not be modified in place if session is not 
+        None.
+    verif_idx : IndexedVerifDF
+        Indexed version of verif_df (only returned if indexed = True)
 
     """
 
-    out = ss.bootstrap((data,), np.mean, confidence_level=level, **bootstrap_kw)
-    ci = (out.confidence_interval.high, out.confidence_interval.low)
+    if session is None:
+        verif_df = read_ascii(fnames, verbose=verbose, **read_kw)
+        if indexed:
+            return verif_df, IndexedVerifDF(verif_df)
+    else:
+        verif_df = session.read(fnames, verbose=verbose, **read_kw)
+        if indexed:
+            return verif_df, session.indexed(fnames, verbose=verbose, **read_kw)
 
-    return ci
+    return verif_df
 
 
-def confidence_interval_mean(data, level=0.95, option='t_dist', ci_kw={}):
+def sort_groups(df, keys, sort_by=[]):
     """
-    Compute the confidence interval for the mean of a dataset
+    Sort a DataFrame so that rows with the same values for certain columns are contiguous
 
     Parameters
     ----------
-    data : np.array
-        Input data
-    level : Float, optional
-        Confidence level for the confidence interval
-    option : String, optional
-        Method used to compute confidence interval ('t_dist' or 'bootstrap')
-    ci_kw : Dictionary, optional
-        Keywords passed to the confidence interval function
+    df : pd.DataFrame
+        Input DataFrame
+    keys : list of strings
+        Columns used to define each group. Groups are sorted in ascending order (categorical 
+        columns are sorted using the category names)
+    sort_by : list of strings, optional
+        Additional columns used to sort the rows within each group
 
     Returns
     -------
-    ci : Tuple
-        Upper and lower bound of the confidence interval
+    sorted_df : pd.DataFrame
+        Sorted DataFrame. The original row order is retained within each group (unless sort_by 
+        is used).
+    starts : array
+        Index of the first row in each group
 
     """
 
-    if option == 't_dist':
-        ci = confidence_interval_t_mean(data, level=level, **ci_kw)
-    elif option == 'bootstrap':
-        ci = confidence_interval_bootstrap_mean(data, level=level, **ci_kw)
-    else:
-        print('confidence interval option {option} does not exist'.format(option=option))
+    def sort_key(col):
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            return col.astype(str)
+        return col
 
-    return ci
+    sorted_df = df.sort_values(keys + sort_by, kind='stable', key=sort_key)
+    if len(sorted_df) == 0:
+        return sorted_df, np.zeros(0, dtype=int)
+    new_group = np.zeros(len(sorted_df), dtype=bool)
+    new_group[0] = True
+    for k in keys:
+        vals = sorted_df[k].values
+        new_group[1:] = new_group[1:] | (vals[1:] != vals[:-1])
+    starts = np.flatnonzero(new_group)
 
+    return sorted_df, starts
 
-def compute_stdev(sum_val, sum_sq, n):
+
+def reduce_groups(vals, starts):
     """
-    Compute the standard deviation from partial sums. Based on calculate_stddev from METcalcpy.
+    Sum the values in each group of a DataFrame sorted using sort_groups()
 
     Parameters
     ----------
-    sum_val : Float
-        Sum of all the values in the data set
-    sum_sq : Float
-        Sum of all the squared values in the data set
-    n : Integer
-        Number of values in the data set
+    vals : array
+        Values to sum (one per row)
+    starts : array
+        Index of the first row in each group from sort_groups()
 
     Returns
     -------
-    s : Float
-        Standard deviation
+    sums : array
+        Sum of the values in each group. Unlike pd.DataFrame.groupby().sum(), NaNs are not 
+        skipped. Groups that start past the end of vals (e.g., starts = [0] for an empty 
+        DataFrame) are empty and have a sum of 0.
 
     """
 
-    s = np.sqrt((sum_sq - (sum_val * sum_val) / n) / (n - 1))
+    vals = np.asarray(vals, dtype=float)
+    starts = np.asarray(starts, dtype=int)
+    sums = np.zeros(len(starts))
+    nonempty = starts < len(vals)
+    if np.any(nonempty):
+        sums[nonempty] = np.add.reduceat(vals, starts[nonempty])
 
-    return s
+    return sums
 
 
-def read_ascii(fnames, verbose=True):
+def register_line_type(line_type, sum_cols=None, mean_cols=None, prep=None):
     """
-    Read several ASCII MET output files and concatenate into a single DataFrame.
+    Add a MET line type to LINE_TYPE_REGISTRY so that its partial sums can be aggregated with 
+    aggregate_line_type()
 
     Parameters
     ----------
-    fnames : list of strings
-        List of filenames to read in
-    verbose : boolean, optional
-        Option to print warning messages if a file does not exist
+    line_type : string
+        MET output line type
+    sum_cols : list of strings, optional
+        Columns that are summed when aggregating (e.g., counts). Set to None to only sum TOTAL.
+    mean_cols : list of strings, optional
+        Columns that are averaged (weighted by TOTAL) when aggregating (e.g., partial sums). Set 
+        to None for no averaged columns.
+    prep : function, optional
+        Function that takes a DataFrame with MET output and returns a dictionary of additional 
+        columns that are needed for aggregation. These columns should be in sum_cols or mean_cols.
 
     Returns
     -------
-    verif_df : pd.DataFrame
-        Output DataFrame containing the MET output
+    None
 
     """
 
-    raw_dfs = []
-    for f in fnames:
-        try:
-            df = pd.read_csv(f, sep='\s+')
-            if len(df) > 0:
-                raw_dfs.append(df)
-            else:
-                raise ValueError(f"Empty MET file: {f}")
-        except FileNotFoundError:
-            if verbose: print(f"MET file not found: {f}")
-            continue
-    verif_df = pd.concat(raw_dfs)
+    sum_cols = ['TOTAL'] if sum_cols is None else list(sum_cols)
+    mean_cols = [] if mean_cols is None else list(mean_cols)
+    LINE_TYPE_REGISTRY[line_type.lower()] = {'sum':sum_cols, 'mean':mean_cols, 'prep':prep}
 
-    return verif_df
 
+def register_stat(line_type, name, fcn, deps):
+    """
+    Add a derived statistic to STAT_REGISTRY so that it can be computed with compute_stats()
+
+    Parameters
+    ----------
+    line_type : string
+        MET output line type
+    name : string
+        Name of the derived statistic (this is the column name in the compute_stats() output)
+    fcn : function
+        Function that computes the statistic. The arguments are arrays for each dependency (in 
+        the same order as deps).
+    deps : list of strings
+        Columns needed to compute the statistic. These can be MET output columns or other 
+        derived statistics for the same line type.
+
+    Returns
+    -------
+    None
 
-def subset_verif_df(df, param):
     """
-    Select rows from a verification DataFrame that meet certain conditions
+
+    if line_type.lower() not in STAT_REGISTRY:
+        STAT_REGISTRY[line_type.lower()] = {}
+    STAT_REGISTRY[line_type.lower()][name] = {'fcn':fcn, 'deps':deps}
+
+
+def safe_divide(num, den):
+    """
+    Divide two arrays, setting the result to NaN where the denominator is 0 (this matches the NA 
+    values in MET output)
+    """
+
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    out = np.full(np.broadcast(num, den).shape, np.nan)
+    np.divide(num, den, out=out, where=(den != 0))
+
+    return out
+
+
+def prep_nbrcnt(df):
+    """
+    Additional columns needed to aggregate the NBRCNT line type. FSS_DEN is the denominator of 
+    the FSS (i.e., the FBS of a reference forecast with no overlap), which can be aggregated.
+    """
+
+    fss = df['FSS'].values.astype(float)
+    fss_den = safe_divide(df['FBS'].values, 1. - fss)
+
+    # FBS / (1 - FSS) is undefined for a perfect score (FSS = 1). The mean squared fractions are 
+    # not in the NBRCNT line, so the squared mean fractions are used instead
+    perfect = (fss == 1)
+    fss_den[perfect] = (df['F_RATE'].values[perfect].astype(float)**2 + 
+                        df['O_RATE'].values[perfect].astype(float)**2)
+
+    return {'FSS_DEN':fss_den}
+
+
+register_line_type('sl1l2', mean_cols=['FBAR', 'OBAR', 'FOBAR', 'FFBAR', 'OOBAR', 'MAE'])
+register_line_type('vl1l2', mean_cols=['UFBAR', 'VFBAR', 'UOBAR', 'VOBAR', 'UVFOBAR', 'UVFFBAR', 
+                                       'UVOOBAR', 'F_SPEED_BAR', 'O_SPEED_BAR'])
+register_line_type('sal1l2', mean_cols=['FABAR', 'OABAR', 'FOABAR', 'FFABAR', 'OOABAR', 'MAE'])
+register_line_type('val1l2', mean_cols=['UFABAR', 'VFABAR', 'UOABAR', 'VOABAR', 'UVFOABAR', 
+                                        'UVFFABAR', 'UVOOABAR', 'FA_SPEED_BAR', 'OA_SPEED_BAR'])
+register_line_type('ctc', sum_cols=['TOTAL', 'FY_OY', 'FY_ON', 'FN_OY', 'FN_ON'])
+register_line_type('nbrcnt', mean_cols=['FBS', 'FSS_DEN', 'F_RATE', 'O_RATE'], prep=prep_nbrcnt)
+
+# SL1L2 statistics. Some of these calculations come from METcalcpy. See 
+# https://github.com/dtcenter/METcalcpy/blob/main_v2.1/metcalcpy/util/sl1l2_statistics.py
+register_stat('sl1l2', 'MSE', lambda ff, fo, oo: ff - 2.*fo + oo, ['FFBAR', 'FOBAR', 'OOBAR'])
+register_stat('sl1l2', 'RMSE', np.sqrt, ['MSE'])
+register_stat('sl1l2', 'ME', lambda f, o: f - o, ['FBAR', 'OBAR'])
+register_stat('sl1l2', 'ESTDEV', lambda mse, me, n: np.sqrt((mse - me**2) * safe_divide(n, n - 1)),
+              ['MSE', 'ME', 'TOTAL'])
+register_stat('sl1l2', 'BIAS_RATIO', lambda f, o: f / o, ['FBAR', 'OBAR'])
+register_stat('sl1l2', 'BIAS_DIFF', lambda f, o: f - o, ['FBAR', 'OBAR'])
+
+# VL1L2 statistics
+register_stat('vl1l2', 'VECT_MSE', lambda ff, fo, oo: ff - 2.*fo + oo, 
+              ['UVFFBAR', 'UVFOBAR', 'UVOOBAR'])
+register_stat('vl1l2', 'VECT_RMSE', np.sqrt, ['VECT_MSE'])
+register_stat('vl1l2', 'MAG_BIAS_RATIO', lambda f, o: f / o, ['F_SPEED_BAR', 'O_SPEED_BAR'])
+register_stat('vl1l2', 'MAG_BIAS_DIFF', lambda f, o: f - o, ['F_SPEED_BAR', 'O_SPEED_BAR'])
+
+# SAL1L2 statistics (anomaly partial sums). See 
+# https://github.com/dtcenter/METcalcpy/blob/main_v2.1/metcalcpy/util/sal1l2_statistics.py
+register_stat('sal1l2', 'ANOM_MSE', lambda ff, fo, oo: ff - 2.*fo + oo, 
+              ['FFABAR', 'FOABAR', 'OOABAR'])
+register_stat('sal1l2', 'ANOM_RMSE', np.sqrt, ['ANOM_MSE'])
+register_stat('sal1l2', 'ANOM_CORR', 
+              lambda f, o, fo, ff, oo: (fo - f*o) / np.sqrt((ff - f**2) * (oo - o**2)),
+              ['FABAR', 'OABAR', 'FOABAR', 'FFABAR', 'OOABAR'])
+register_stat('sal1l2', 'ANOM_CORR_UNCNTR', lambda fo, ff, oo: fo / np.sqrt(ff * oo), 
+              ['FOABAR', 'FFABAR', 'OOABAR'])
+register_stat('sal1l2', 'RMSFA', np.sqrt, ['FFABAR'])
+register_stat('sal1l2', 'RMSOA', np.sqrt, ['OOABAR'])
+
+# VAL1L2 statistics (vector anomaly partial sums)
+register_stat('val1l2', 'VECT_ANOM_MSE', lambda ff, fo, oo: ff - 2.*fo + oo, 
+              ['UVFFABAR', 'UVFOABAR', 'UVOOABAR'])
+register_stat('val1l2', 'VECT_ANOM_RMSE', np.sqrt, ['VECT_ANOM_MSE'])
+register_stat('val1l2', 'VECT_ANOM_CORR', lambda fo, ff, oo: fo / np.sqrt(ff * oo), 
+              ['UVFOABAR', 'UVFFABAR', 'UVOOABAR'])
+register_stat('val1l2', 'RMSFA', np.sqrt, ['UVFFABAR'])
+register_stat('val1l2', 'RMSOA', np.sqrt, ['UVOOABAR'])
+
+# CTC statistics. Names match those in the MET CTS line type (ETS is called GSS in MET)
+register_stat('ctc', 'CSI', lambda h, f, m: safe_divide(h, h + f + m), ['FY_OY', 'FY_ON', 'FN_OY'])
+register_stat('ctc', 'PODY', lambda h, m: safe_divide(h, h + m), ['FY_OY', 'FN_OY'])
+register_stat('ctc', 'FAR', lambda h, f: safe_divide(f, h + f), ['FY_OY', 'FY_ON'])
+register_stat('ctc', 'FBIAS', lambda h, f, m: safe_divide(h + f, h + m), 
+              ['FY_OY', 'FY_ON', 'FN_OY'])
+register_stat('ctc', 'HITS_RANDOM', lambda h, f, m, n: safe_divide((h + f) * (h + m), n), 
+              ['FY_OY', 'FY_ON', 'FN_OY', 'TOTAL'])
+register_stat('ctc', 'ETS', lambda h, f, m, hr: safe_divide(h - hr, h + f + m - hr), 
+              ['FY_OY', 'FY_ON', 'FN_OY', 'HITS_RANDOM'])
+
+# NBRCNT statistics. See 
+# https://github.com/dtcenter/METcalcpy/blob/main_v2.1/metcalcpy/util/nbrcnt_statistics.py
+register_stat('nbrcnt', 'FSS', lambda fbs, den: 1. - fbs / den, ['FBS', 'FSS_DEN'])
+register_stat('nbrcnt', 'AFSS', lambda f, o: (2. * f * o) / (f**2 + o**2), ['F_RATE', 'O_RATE'])
+register_stat('nbrcnt', 'UFSS', lambda o: 0.5 + 0.5 * o, ['O_RATE'])
+
+
+def resolve_stats(line_type, stats, columns):
+    """
+    Determine which derived statistics to evaluate (and in which order) for compute_stats()
 
     Parameters
     ----------
-    df : pd.DataFrame
-        MET verification output
-    param : dictionary
-        Row conditions. Key = column name (from MET output file), value = column value
-        In addition to being a column name, the key can also be "not_<column name>". In this case, 
-        rows with a column value equal to <column name> are excluded.
+    line_type : string
+        MET output line type
+    stats : list of strings
+        Requested statistics
+    columns : list of strings
+        Columns in the MET output DataFrame
 
     Returns
     -------
-    subset_df : pd.DataFrame
-        Copy of the input DataFrame with certain rows selected
+    order : list of strings
+        Statistics to evaluate. Dependencies come before the statistics that use them. Requested 
+        statistics that are not in STAT_REGISTRY or that have dependencies that are not available 
+        are not included.
 
     """
 
-    cond = np.ones(len(df), dtype=bool)
-    for k in param.keys():
-        if k[:3] == 'not':
-            cond = cond * (df[k[4:]] != param[k])
+    registry = STAT_REGISTRY.get(line_type, {})
+    order = []
+    available = {}
+
+    def check(name, visiting):
+        if name in available:
+            return available[name]
+        if (name not in registry) or (name in visiting):
+            available[name] = name in columns
+            return available[name]
+        ok = True
+        for d in registry[name]['deps']:
+            ok = check(d, visiting + [name]) and ok
+        if ok:
+            order.append(name)
+            available[name] = True
         else:
-            cond = cond * (df[k] == param[k])
-    subset_df = df.loc[cond, :].copy()
+            available[name] = name in columns
+        return available[name]
 
-    return subset_df
+    for name in stats:
+        check(name, [])
 
+    return order
 
-def compute_stats(verif_df, line_type='sl1l2'):
+
+@mprof.timed()
+def compute_stats(verif_df, line_type='sl1l2', stats=None):
     """
     Compute additional statistics for MET output.
 
@@ -221,37 +2662,138 @@ def compute_stats(verif_df, line_type='sl1l2'):
     verif_df : pd.DataFrame
         DataFrame with MET output from read_ascii()
     line_type : string, optional
-        MET output line type
+        MET output line type. Statistics are defined in STAT_REGISTRY.
+    stats : list of strings, optional
+        Statistics to compute. Only these statistics (and their dependencies) are evaluated. Set 
+        to None to compute all statistics in STAT_REGISTRY for this line type.
 
     Returns
     -------
     new_df : pd.DataFrame
-        DataFrame with additional statistics
+        DataFrame with additional statistics. Only the requested statistics are added. The 
+        columns from verif_df are not copied.
+
+    """
+
+    if stats is None:
+        stats = list(STAT_REGISTRY.get(line_type, {}).keys())
+    order = resolve_stats(line_type, stats, verif_df.columns)
+
+    # Evaluate statistics using NumPy arrays, keeping intermediate statistics separate from 
+    # verif_df
+    vals = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in order:
+            entry = STAT_REGISTRY[line_type][name]
+            args = [vals[d] if d in vals else verif_df[d].to_numpy(dtype=float) 
+                    for d in entry['deps']]
+            vals[name] = entry['fcn'](*args)
+
+    new_df = verif_df.copy(deep=False)
+    for name in stats:
+        if name in vals:
+            new_df[name] = vals[name]
+
+    return new_df
+
+
+@mprof.timed()
+def aggregate_line_type(verif_df, line_type, starts=None, weights=None):
+    """
+    Aggregate the partial sums (or counts) in a MET output DataFrame
+
+    Parameters
+    ----------
+    verif_df : pd.DataFrame
+        DataFrame with MET output from read_ascii()
+    line_type : string
+        MET output line type. Must be in LINE_TYPE_REGISTRY.
+    starts : array, optional
+        Index of the first row in each group from sort_groups(). Set to None to aggregate all 
+        rows into a single group.
+    weights : array, optional
+        Additional weight for each row. Partial sums are always weighted by TOTAL. Counts are not 
+        weighted.
 
-    Notes
-    -----
-    Some of these calculations come from METcalcpy. See 
-    https://github.com/dtcenter/METcalcpy/blob/main_v2.1/metcalcpy/util/sl1l2_statistics.py
+    Returns
+    -------
+    agg_df : pd.DataFrame
+        Aggregated partial sums (one row per group). Partial sums are NaN for empty groups.
 
     """
 
-    new_df = verif_df.copy()
+    reg = LINE_TYPE_REGISTRY[line_type]
+    if reg['prep'] is not None:
+        verif_df = verif_df.assign(**reg['prep'](verif_df))
+    if starts is None:
+        starts = np.zeros(min(len(verif_df), 1), dtype=int)
+    wgt = verif_df['TOTAL'].values.astype(float)
+    if weights is not None:
+        wgt = wgt * weights
 
-    if line_type == 'sl1l2':
-        new_df['MSE'] = verif_df['FFBAR'] - 2.*verif_df['FOBAR'] + verif_df['OOBAR']
-        new_df['RMSE'] = np.sqrt(new_df['MSE'])
-        new_df['BIAS_RATIO'] = verif_df['FBAR'] / verif_df['OBAR']
-        new_df['BIAS_DIFF'] = verif_df['FBAR'] - verif_df['OBAR']
+    agg = {}
+    for c in reg['sum']:
+        agg[c] = reduce_groups(verif_df[c].values, starts)
+    wgt_sum = reduce_groups(wgt, starts)
+    for c in reg['mean']:
+        if c in verif_df.columns:
+            agg[c] = safe_divide(reduce_groups(verif_df[c].values * wgt, starts), wgt_sum)
+    agg_df = pd.DataFrame(agg)
 
-    elif line_type == 'vl1l2':
-        new_df['VECT_MSE'] = verif_df['UVFFBAR'] - 2.*verif_df['UVFOBAR'] + verif_df['UVOOBAR']
-        new_df['VECT_RMSE'] = np.sqrt(new_df['VECT_MSE'])
-        new_df['MAG_BIAS_RATIO'] = verif_df['F_SPEED_BAR'] / verif_df['O_SPEED_BAR']
-        new_df['MAG_BIAS_DIFF'] = verif_df['F_SPEED_BAR'] - verif_df['O_SPEED_BAR']
+    return agg_df
 
-    return new_df
 
+def control_stats(verif_df, var, match, compute_kw):
+    """
+    Compute the statistics for the second DataFrame in compute_stats_diff()
+
+    Rows with missing match fields or with match fields that are not unique can never be an exact 
+    match, so they are removed. Results are cached (see CTRL_STATS_CACHE) using the identity of 
+    verif_df, so the control statistics are only computed once when several experiments are 
+    compared to the same control DataFrame. verif_df should therefore not be modified in place 
+    after it is passed to compute_stats_diff().
+
+    Parameters
+    ----------
+    verif_df : pd.DataFrame
+        DataFrame with MET output from read_ascii()
+    var : list of strings
+        Variables to take differences of
+    match : list of strings
+        Fields that must match to perform a pairwise difference
+    compute_kw : dictionary
+        Keyword arguments passed to compute_stats()
+
+    Returns
+    -------
+    ctrl_df : pd.DataFrame
+        DESC, var, and match columns for rows that can be paired. Should not be modified in place.
+
+    """
+
+    key = (id(verif_df), len(verif_df), tuple(var), tuple(match), 
+           repr(sorted(compute_kw.items())))
+    if key in CTRL_STATS_CACHE:
+        ref, ctrl_df = CTRL_STATS_CACHE[key]
+
+        # The weak reference ensures that the id was not reused by a new DataFrame
+        if ref() is verif_df:
+            CTRL_STATS_CACHE.move_to_end(key)
+            return ctrl_df
+
+    ctrl_df = compute_stats(verif_df, **compute_kw)[['DESC'] + var + match]
+    ctrl_df = ctrl_df.loc[ctrl_df[match].notna().all(axis=1).values]
+    ctrl_df = ctrl_df.loc[~ctrl_df.duplicated(subset=match, keep=False).values]
+
+    CTRL_STATS_CACHE[key] = (weakref.ref(verif_df), ctrl_df)
+    CTRL_STATS_CACHE.move_to_end(key)
+    while len(CTRL_STATS_CACHE) > CTRL_STATS_CACHE_MAX:
+        CTRL_STATS_CACHE.popitem(last=False)
 
+    return ctrl_df
+
+
+@mprof.timed()
 def compute_stats_diff(verif_df1, verif_df2, var=['RMSE'], compute_kw={}, pct=False,
                        match=['FCST_LEAD', 'FCST_VAR', 'FCST_VALID_BEG', 'FCST_LEV', 'FCST_UNITS', 'VX_MASK']):
     """
@@ -266,7 +2808,8 @@ def compute_stats_diff(verif_df1, verif_df2, var=['RMSE'], compute_kw={}, pct=Fa
     var : list of strings, optional
         Variables to take differences of
     compute_kw : dictionary, optional
-        Keyword arguments passed to mt.compute_stats
+        Keyword arguments passed to mt.compute_stats. If 'stats' is not included, only the 
+        statistics in var are computed.
     pct : Boolean, optional
         Option to compute percent differences
     match : list of strings, optional
@@ -280,37 +2823,33 @@ def compute_stats_diff(verif_df1, verif_df2, var=['RMSE'], compute_kw={}, pct=Fa
     """
 
     # Compute additional statistics for each line
-    verif_df1_stats = compute_stats(verif_df1, **compute_kw)
-    verif_df2_stats = compute_stats(verif_df2, **compute_kw)
+    compute_kw_local = {'stats':var}
+    compute_kw_local.update(compute_kw)
+    verif_df1_stats = compute_stats(verif_df1, **compute_kw_local)
+    df2 = control_stats(verif_df2, var, match, compute_kw_local)
 
-    # Create dictionary to save differences in
-    diff_dict = {'DESC':[]}
+    # Pair rows using a keyed merge on the match fields
+    df1 = verif_df1_stats[['DESC'] + var + match].reset_index(drop=True)
+    df1['_row'] = np.arange(len(df1))
+    pairs = pd.merge(df1, df2, how='inner', on=match, suffixes=('_1', '_2'))
+    pairs.sort_values('_row', inplace=True)
+
+    # Compute differences
+    diff_dict = {'DESC':(pairs['DESC_1'].astype(str) + ' - ' + pairs['DESC_2'].astype(str)).values}
     for v in var:
-        diff_dict[v] = []
+        if pct:
+            diff_dict[v] = 1e2 * (pairs[f'{v}_1'].values - pairs[f'{v}_2'].values) / pairs[f'{v}_2'].values
+        else:
+            diff_dict[v] = pairs[f'{v}_1'].values - pairs[f'{v}_2'].values
     for m in match:
-        diff_dict[m] = []
-    
-    # Compute differences
-    for i in range(len(verif_df1_stats)):
-        cond = {}
-        for m in match:
-            cond[m] = verif_df1_stats.iloc[i][m]
-        subset2 = subset_verif_df(verif_df2_stats, cond)
-        if len(subset2) == 1:
-            diff_dict['DESC'].append(f"{verif_df1_stats.iloc[i]['DESC']} - {subset2['DESC'].values[0]}")
-            for m in match:
-                diff_dict[m].append(cond[m])
-            for v in var:
-                if pct:
-                    diff_dict[v].append(1e2 * (verif_df1_stats.iloc[i][v] - subset2[v].values[0]) / subset2[v].values[0])
-                else:
-                    diff_dict[v].append(verif_df1_stats.iloc[i][v] - subset2[v].values[0])
+        diff_dict[m] = df1[m].values[pairs['_row'].values]
 
-    diff_df = pd.DataFrame.from_dict(diff_dict)
+    diff_df = pd.DataFrame(diff_dict)
 
     return diff_df
 
 
+@mprof.timed()
 def compute_stats_entire_df(verif_df, verif_df2=None, line_type='sl1l2', agg=False, 
                             diff_kw={'var':['RMSE'], 'pct':False},
                             ci=False, ci_lvl=0.95, ci_opt='t_dist', ci_kw={}):
@@ -329,8 +2868,8 @@ def compute_stats_entire_df(verif_df, verif_df2=None, line_type='sl1l2', agg=Fal
         MET output line type
     agg : Boolean, optional
         Option to compute statistics by aggregating the partial sums. This is the more "correct"
-        method, but is not compatible with confidence intervals. Currently only available for
-        'sl1l2' and 'vl1l2' line_type.
+        method, but is not compatible with confidence intervals. Available for any line_type in
+        LINE_TYPE_REGISTRY (see register_line_type()).
     diff_kw : Dictionary, optional
         If agg == False:
             Keyword arguments passed to compute_stats_diff()
@@ -358,7 +2897,7 @@ def compute_stats_entire_df(verif_df, verif_df2=None, line_type='sl1l2', agg=Fal
     if 'pct' not in diff_kw:
         diff_kw['pct'] = False
 
-    if (agg and not ci) and (line_type in ['sl1l2', 'vl1l2']):
+    if (agg and not ci) and (line_type in LINE_TYPE_REGISTRY):
 
         # Loop over one df (if no diffs) or two dfs (if diffs)
         df_list = [verif_df]
@@ -368,27 +2907,13 @@ def compute_stats_entire_df(verif_df, verif_df2=None, line_type='sl1l2', agg=Fal
 
         for df in df_list:
 
-            # Update means to include all lines in the input DataFrame
-            cols = []
-            for c in df.columns:
-                if c[-3:] == 'BAR':
-                    cols.append(c)
-
-            new_means = {}
-            new_means['TOTAL'] = np.sum(df['TOTAL'].values)
-
             # Check to ensure that length of df is not 0
             if len(df) == 0:
                 print('Warning: mt.compute_stats_entire_df: Length of df = 0')
 
-            for c in cols:
-                new_means[c] = np.zeros(1)
-                new_means[c][0] = (np.sum(df[c].values * df['TOTAL'].values) /
-                                   new_means['TOTAL'])
-
-            combined_df = pd.DataFrame(new_means)
-
-            # Compute statistics
+            # Update partial sums to include all lines in the input DataFrame, then compute 
+            # statistics. Partial sums are NaN if df is empty
+            combined_df = aggregate_line_type(df, line_type, starts=[0])
             df_out.append(compute_stats(combined_df, line_type=line_type))
 
         if len(df_out) == 1:
@@ -412,6 +2937,22 @@ def compute_stats_entire_df(verif_df, verif_df2=None, line_type='sl1l2', agg=Fal
                 diff_kw['compute_kw'] = {}
             diff_kw['compute_kw']['line_type'] = line_type
             verif_df = compute_stats_diff(verif_df, verif_df2, **diff_kw)
+
+        # Empty DataFrames (e.g., a missing lead time) give a single line of NaNs
+        if len(verif_df) == 0:
+            print('Warning: mt.compute_stats_entire_df: Length of df = 0')
+            num_col = [c for c in verif_df.columns if (c not in MET_HEADER_COLS) and 
+                       pd.api.types.is_numeric_dtype(verif_df[c])]
+            new_means = {c:np.full(1, np.nan) for c in num_col}
+            if 'TOTAL' in new_means:
+                new_means['TOTAL'] = np.zeros(1)
+            if ci:
+                for c in num_col:
+                    if c != 'TOTAL':
+                        new_means['low_%s' % c] = np.full(1, np.nan)
+                        new_means['high_%s' % c] = np.full(1, np.nan)
+            return pd.DataFrame(new_means)
+
         new_means = {}
         avg_col = []
         for c in verif_df.columns:
@@ -453,19 +2994,162 @@ def compute_stats_entire_df(verif_df, verif_df2=None, line_type='sl1l2', agg=Fal
         if ci:
             # If accounting for temporal autocorrelation, ensure that values are in temporal order
             verif_df.sort_values('FCST_VALID_BEG', axis=0, inplace=True)
-            for c in avg_col:
-                ci_vals = confidence_interval_mean(verif_df[c].values, level=ci_lvl, 
-                                                   option=ci_opt, ci_kw=ci_kw)
-                new_means['low_%s' % c] = np.array([ci_vals[0]])
-                new_means['high_%s' % c] = np.array([ci_vals[1]])
+            ci_vals = confidence_interval_mean_groups(verif_df[avg_col].to_numpy(dtype=float), 
+                                                      starts=[0], level=ci_lvl, option=ci_opt, 
+                                                      ci_kw=ci_kw)
+            for j, c in enumerate(avg_col):
+                new_means['low_%s' % c] = ci_vals[0][:, j]
+                new_means['high_%s' % c] = ci_vals[1][:, j]
+
+        new_df = pd.DataFrame(new_means)
+
+    return new_df
+
+
+@mprof.timed()
+def compute_stats_by_group(verif_df, keys, verif_df2=None, line_type='sl1l2', agg=False, 
+                           diff_kw={'var':['RMSE'], 'pct':False}, ci=False, ci_lvl=0.95, 
+                           ci_opt='t_dist', ci_kw={}, ci_var=None, stats=None):
+    """
+    Compute statistics for each group of lines in a MET output DataFrame. This is equivalent to 
+    calling compute_stats_entire_df() once for each group, but is much faster when there are 
+    many groups (e.g., all pressure levels in a vertical profile).
+
+    Parameters
+    ----------
+    verif_df : pd.DataFrame
+        DataFrame with MET output from read_ascii()
+    keys : list of strings
+        Columns used to define each group (e.g., ['FCST_LEV'] or ['FCST_LEAD'])
+    verif_df2 : pd.DataFrame, optional
+        DataFrame with MET output from read_ascii() that is used to compute pairwise differences 
+        with verif_df. Set to None to not use pairwise differences.
+    line_type : string, optional
+        MET output line type
+    agg : Boolean, optional
+        Option to compute statistics by aggregating the partial sums. Not compatible with 
+        confidence intervals. Available for any line_type in LINE_TYPE_REGISTRY (see 
+        register_line_type()).
+    diff_kw : Dictionary, optional
+        If agg == False:
+            Keyword arguments passed to compute_stats_diff(). The group keys are added to the 
+            match fields.
+        If agg == True:
+            Should contain two keys: 
+                'var': List of variables to take differences of
+                'pct': Option to compute percent diffs
+    ci : Boolean, optional
+        Option to draw confidence intervals
+    ci_lvl : Float, optional
+        Confidence interval level as a fraction
+    ci_opt : String, optional
+        Method used to create confidence intervals
+    ci_kw : Dictionary, optional
+        Additional keywords passed to confidence interval function
+    ci_var : list of strings, optional
+        Statistics to compute confidence intervals for. Set to None to compute confidence 
+        intervals for all averaged statistics.
+    stats : list of strings, optional
+        Derived statistics to compute (passed to compute_stats()). Set to None to compute all 
+        derived statistics (or only the statistics in diff_kw['var'] if verif_df2 is not None).
+        The statistics in diff_kw['var'] are always computed if verif_df2 is not None.
+
+    Returns
+    -------
+    new_df : pd.DataFrame
+        DataFrame with one line of statistics for each group. Groups are sorted by the key 
+        columns, which are included in new_df.
+
+    """
+
+    diff_kw_local = copy.deepcopy(diff_kw)
+    if 'pct' not in diff_kw_local:
+        diff_kw_local['pct'] = False
+
+    # Differences are taken for the statistics in diff_kw['var'], so these are always computed
+    if verif_df2 is not None:
+        if stats is None:
+            stats = diff_kw_local['var']
+        else:
+            stats = stats + [v for v in diff_kw_local['var'] if v not in stats]
+
+    if (agg and not ci) and (line_type in LINE_TYPE_REGISTRY):
+
+        # Aggregate the partial sums in each group for one df (if no diffs) or two dfs (if diffs)
+        df_list = [verif_df]
+        if verif_df2 is not None:
+            df_list.append(verif_df2)
+        df_out = []
+        for df in df_list:
+            df, starts = sort_groups(df, keys)
+            new_df = compute_stats(aggregate_line_type(df, line_type, starts=starts), 
+                                   line_type=line_type, stats=stats)
+            for k in keys:
+                new_df[k] = df[k].values[starts]
+            df_out.append(new_df)
+
+        if len(df_out) == 2:
+            paired = pd.merge(df_out[0], df_out[1], how='left', on=keys, suffixes=('', '_2'))
+            new_df = pd.DataFrame({'TOTAL':paired['TOTAL'].values})
+            for v in diff_kw_local['var']:
+                new_df[v] = paired[v].values - paired[f'{v}_2'].values
+                if diff_kw_local['pct']:
+                    new_df[v] = 1e2 * new_df[v] / paired[f'{v}_2'].values
+            for k in keys:
+                new_df[k] = paired[k].values
+
+    else:
+
+        # Compute statistics first, then average
+        if verif_df2 is None:
+            stats_df = compute_stats(verif_df, line_type=line_type, stats=stats)
+        else:
+            diff_kw_local['compute_kw'] = {'line_type':line_type, 'stats':stats}
+            if 'match' not in diff_kw_local:
+                diff_kw_local['match'] = ['FCST_LEAD', 'FCST_VAR', 'FCST_VALID_BEG', 'FCST_LEV', 
+                                          'FCST_UNITS', 'VX_MASK']
+            for k in keys:
+                if k not in diff_kw_local['match']:
+                    diff_kw_local['match'].append(k)
+            stats_df = compute_stats_diff(verif_df, verif_df2, **diff_kw_local)
+
+        # If accounting for temporal autocorrelation, ensure that values are in temporal order
+        if ci:
+            stats_df, starts = sort_groups(stats_df, keys, sort_by=['FCST_VALID_BEG'])
+        else:
+            stats_df, starts = sort_groups(stats_df, keys)
+        ends = np.append(starts[1:], len(stats_df))
+        avg_col = [c for c in stats_df.columns if (c not in MET_HEADER_COLS + ['TOTAL']) and 
+                   pd.api.types.is_numeric_dtype(stats_df[c])]
+
+        new_means = {}
+        if 'TOTAL' in stats_df.columns:
+            new_means['TOTAL'] = reduce_groups(stats_df['TOTAL'].values, starts)
+        for c in avg_col:
+            new_means[c] = reduce_groups(stats_df[c].values, starts) / (ends - starts)
+
+        # Compute confidence intervals
+        if ci:
+            if ci_var is None:
+                ci_var = avg_col
+            ci_vals = confidence_interval_mean_groups(stats_df[ci_var].to_numpy(dtype=float), 
+                                                      starts=starts, level=ci_lvl, option=ci_opt,
+                                                      ci_kw=ci_kw)
+            for j, c in enumerate(ci_var):
+                new_means['low_%s' % c] = ci_vals[0][:, j]
+                new_means['high_%s' % c] = ci_vals[1][:, j]
 
         new_df = pd.DataFrame(new_means)
+        for k in keys:
+            new_df[k] = stats_df[k].values[starts]
 
     return new_df
 
 
+@mprof.timed()
 def compute_stats_vert_avg(verif_df, verif_df2=None, diff_kw={'var':['RMSE']}, vcoord='P', 
-                           vmin=100, vmax=1000, line_type='sl1l2', stats_kw={}):
+                           vmin=100, vmax=1000, line_type='sl1l2', stats_kw={}, 
+                           thickness_weight=False, stats=None):
     """
     Compute vertically aggregated statistics from a MET output DataFrame.
 
@@ -478,7 +3162,7 @@ def compute_stats_vert_avg(verif_df, verif_df2=None, diff_kw={'var':['RMSE']}, v
         with verif_df. If verif_df2 is not None, all stats will be computed using the differences
         between verif_df and verif_df2. Set to None to not use pairwise differences.
     diff_kw : Dictionary, optional
-        Keyword arguments passed to compute_stats_diff()
+        Keyword arguments passed to compute_stats_diff(). OBTYPE is added to the match fields.
     vcoord : string, optional
         Vertical coordinate. This is the first character in the FCST_LEV entries (usually 'P' or 
         'Z')
@@ -490,48 +3174,129 @@ def compute_stats_vert_avg(verif_df, verif_df2=None, diff_kw={'var':['RMSE']}, v
         MET output line type
     stats_kw : dictionary, optional
         Keyword arguments passed to compute_stats_entire_df()
+    thickness_weight : boolean, optional
+        Option to weight each level by the thickness of the layer it represents (i.e., half the 
+        distance to the levels above and below). If False, all levels are weighted equally. Not 
+        used if confidence intervals are requested in stats_kw.
+    stats : list of strings, optional
+        Derived statistics to compute (passed to compute_stats()). Set to None to compute all 
+        derived statistics. The statistics in diff_kw['var'] are always computed if verif_df2 is 
+        not None. Not used if confidence intervals are requested in stats_kw.
 
     Returns
     -------
     new_df : pd.DataFrame
-        DataFrame with statistics aggregated over vertical levels.
+        DataFrame with statistics aggregated over vertical levels. There is one row for each 
+        combination of FCST_LEAD, FCST_VALID_BEG, FCST_VAR, and OBTYPE in verif_df.
 
     """
 
+    keys = ['OBTYPE', 'FCST_VAR', 'FCST_LEAD', 'FCST_VALID_BEG']
+    out_keys = ['FCST_LEAD', 'FCST_VALID_BEG', 'FCST_VAR', 'OBTYPE']
+    diff_kw_local = copy.deepcopy(diff_kw)
+    if 'pct' not in diff_kw_local:
+        diff_kw_local['pct'] = False
+
     # Only retain rows within our vertical averaging column
     df_list = [verif_df]
     if verif_df2 is not None:
         df_list.append(verif_df2)
     red_df = []
     for df in df_list:
-        fcst_lev_num = np.array([float(s[1:]) for s in df['FCST_LEV'].values])
-        fcst_lev_type = np.array([s[0] for s in df['FCST_LEV'].values])
-        red_df.append(df.loc[(fcst_lev_type == vcoord) & (fcst_lev_num >= vmin) & (fcst_lev_num <= vmax)].copy())
-
-    # Loop over each unique combo of FCST_LEAD, FCST_VALID_BEG, FCST_VAR, and OBTYPE
-    dfs = []
-    combos = np.array(np.meshgrid(np.unique(red_df[0]['FCST_LEAD'].values),
-                                  np.unique(red_df[0]['FCST_VALID_BEG'].values),
-                                  np.unique(red_df[0]['FCST_VAR'].values),
-                                  np.unique(red_df[0]['OBTYPE'].values))).T.reshape(-1, 4)
-    for i in range(combos.shape[0]):
-        subset = red_df[0].loc[(red_df[0]['FCST_LEAD'] == combos[i, 0]) &
-                                (red_df[0]['FCST_VALID_BEG'] == combos[i, 1]) &
-                                (red_df[0]['FCST_VAR'] == combos[i, 2]) &
-                                (red_df[0]['OBTYPE'] == combos[i, 3])].copy()
+        fcst_lev = df['FCST_LEV'].astype(str)
+        fcst_lev_num = pd.to_numeric(fcst_lev.str[1:], errors='coerce').values
+        fcst_lev_type = fcst_lev.str[0].values
+        red_df.append(df.loc[(fcst_lev_type == vcoord) & (fcst_lev_num >= vmin) & 
+                             (fcst_lev_num <= vmax)])
+
+    # Confidence intervals are computed separately for each combination of FCST_LEAD, 
+    # FCST_VALID_BEG, FCST_VAR, and OBTYPE
+    if ('ci' in stats_kw) and stats_kw['ci']:
+        red_df[0], starts = sort_groups(red_df[0], keys)
         if len(red_df) == 2:
-            subset2 = red_df[1].loc[(red_df[1]['FCST_LEAD'] == combos[i, 0]) &
-                                    (red_df[1]['FCST_VALID_BEG'] == combos[i, 1]) &
-                                    (red_df[1]['FCST_VAR'] == combos[i, 2]) &
-                                    (red_df[1]['OBTYPE'] == combos[i, 3])].copy()
+            groups2 = red_df[1].groupby(keys, observed=True).indices
+        dfs = []
+        for i1, i2 in zip(starts, np.append(starts[1:], len(red_df[0]))):
+            subset = red_df[0].iloc[i1:i2]
+            if len(red_df) == 2:
+                g = tuple(subset[keys].iloc[0])
+                subset2 = red_df[1].iloc[groups2[g] if g in groups2 else []]
+            else:
+                subset2 = None
+            dfs.append(compute_stats_entire_df(subset, subset2, diff_kw=diff_kw_local, 
+                                               line_type=line_type, **stats_kw))
+        new_df = pd.concat(dfs, ignore_index=True)
+        for k in out_keys:
+            new_df[k] = red_df[0][k].values[starts]
+        return new_df
+
+    agg = ('agg' in stats_kw) and stats_kw['agg'] and (line_type in LINE_TYPE_REGISTRY)
+    if (verif_df2 is not None) and (stats is not None):
+        stats = stats + [v for v in diff_kw_local['var'] if v not in stats]
+    if (verif_df2 is not None) and not agg:
+        diff_kw_local['compute_kw'] = {'line_type':line_type}
+        if 'match' not in diff_kw_local:
+            diff_kw_local['match'] = ['FCST_LEAD', 'FCST_VAR', 'FCST_VALID_BEG', 'FCST_LEV', 
+                                      'FCST_UNITS', 'VX_MASK']
+        for k in keys:
+            if k not in diff_kw_local['match']:
+                diff_kw_local['match'].append(k)
+        red_df = [compute_stats_diff(red_df[0], red_df[1], **diff_kw_local)]
+    elif not agg:
+        red_df = [compute_stats(red_df[0], line_type=line_type, stats=stats)]
+
+    # Compute the weighted average for each combination of FCST_LEAD, FCST_VALID_BEG, FCST_VAR, 
+    # and OBTYPE using a single pass over the DataFrame (sorted by the vertical coordinate within 
+    # each combination)
+    out = []
+    for df in red_df:
+        df = df.assign(VCOORD_NUM=pd.to_numeric(df['FCST_LEV'].astype(str).str[1:], 
+                                                errors='coerce').values)
+        df, starts = sort_groups(df, keys, sort_by=['VCOORD_NUM'])
+        ends = np.append(starts[1:], len(df))
+        if thickness_weight:
+            lev = df['VCOORD_NUM'].values
+            first = np.zeros(len(df), dtype=bool)
+            first[starts] = True
+            last = np.zeros(len(df), dtype=bool)
+            last[ends - 1] = True
+            wgt = 0.5 * (np.where(last, lev, np.roll(lev, -1)) - 
+                         np.where(first, lev, np.roll(lev, 1)))
+
+            # Groups with a single level are given a weight of 1
+            wgt[np.repeat(ends - starts == 1, ends - starts)] = 1.
         else:
-            subset2 = None
-        tmp_df = compute_stats_entire_df(subset, subset2, diff_kw=diff_kw, line_type=line_type, **stats_kw)
-        dfs.append(tmp_df)
-
-    new_df = pd.concat(dfs)
-    for i, var in enumerate(['FCST_LEAD', 'FCST_VALID_BEG', 'FCST_VAR', 'OBTYPE']):
-        new_df[var] = combos[:, i]
+            wgt = np.ones(len(df))
+        if agg:
+            new_df = compute_stats(aggregate_line_type(df, line_type, starts=starts, weights=wgt),
+                                   line_type=line_type, stats=stats)
+        else:
+            cols = [c for c in df.columns if (c not in MET_HEADER_COLS + ['VCOORD_NUM']) and 
+                    pd.api.types.is_numeric_dtype(df[c])]
+            new_means = {}
+            if 'TOTAL' in df.columns:
+                new_means['TOTAL'] = reduce_groups(df['TOTAL'].values, starts)
+            wgt_sum = reduce_groups(wgt, starts)
+            for c in cols:
+                if c != 'TOTAL':
+                    new_means[c] = reduce_groups(df[c].values * wgt, starts) / wgt_sum
+            new_df = pd.DataFrame(new_means)
+        for k in out_keys:
+            new_df[k] = df[k].values[starts]
+        out.append(new_df)
+
+    # Differences of aggregated statistics
+    if len(out) == 2:
+        paired = pd.merge(out[0], out[1], how='left', on=keys, suffixes=('', '_2'))
+        new_df = pd.DataFrame({'TOTAL':paired['TOTAL'].values})
+        for v in diff_kw_local['var']:
+            new_df[v] = paired[v].values - paired[f'{v}_2'].values
+            if diff_kw_local['pct']:
+                new_df[v] = 1e2 * new_df[v] / paired[f'{v}_2'].values
+        for k in out_keys:
+            new_df[k] = paired[k].values
+    else:
+        new_df = out[0]
 
     return new_df
 
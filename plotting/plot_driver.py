@@ -4,6 +4,17 @@ METplus Plotting Driver
 If using GridStat output, use the link_GridStat_output.sh script to organize the METplus output
 files into the proper format first before running this script.
 
+Each figure is an independent plot job. Jobs for the same verification subtype and variable are
+run together (so they can share MET output held in memory), and these groups of jobs can be run
+in parallel by setting 'nprocs' in the input YAML file.
+
+A manifest (out_dir/plot_manifest.json) records a hash of the parameters and input MET output
+files for each figure. Figures that are up to date are skipped unless 'incremental' is set to
+False in the input YAML file.
+
+Timing and memory statistics for each stage and plot job are written if 'profile' is set in the
+input YAML file (see metplus_profile.py).
+
 Input Parameters
 ----------------
     argv[1] : Input YAML file
@@ -19,188 +30,490 @@ import datetime as dt
 import numpy as np
 import os
 import copy
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import yaml
 import sys
+import json
+import hashlib
+import inspect
+import concurrent.futures as cf
 
 import metplus_OSSE_scripts.plotting.metplus_plots as mp
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import metplus_OSSE_scripts.plotting.metplus_profile as mprof
 
 
 #---------------------------------------------------------------------------------------------------
-# Input Parameters
+# Functions
 #---------------------------------------------------------------------------------------------------
 
-# Input YAML file name
-if len(sys.argv) > 1:
-    yaml_name = sys.argv[1]
-else:
-    yaml_name = '/work2/noaa/wrfruc/murdzek/src/metplus_OSSE_scripts/test/cases/plots/precip_radar/plot_param.yml'
-with open(yaml_name, 'r') as fptr:
-    param = yaml.safe_load(fptr)
-
-# Read in parameters
-sim_dict = param['sim_dict']
-verif_type = param['verif_type']
-out_dir = param['out_dir']
-out_tag = param['out_tag']
-valid_time_start = param['valid_time_start']
-valid_time_step = param['valid_time_step']
-valid_time_end_hr = param['valid_time_end_hr']
-valid_time_ua_start = param['valid_time_ua_start']
-valid_time_ua_step = param['valid_time_ua_step']
-valid_time_ua_end_hr = param['valid_time_ua_end_hr']
-itime_exclude = param['itime_exclude']
-vtime_exclude = param['vtime_exclude']
-ci_kw = param['ci_kw']
-plot_dict = param['plot_dict']
-fcst_lead_dieoff = param['fcst_lead_dieoff']
-fcst_lead_other = param['fcst_lead_other']
-
-# Create lists of valid times
-valid_times = [valid_time_start + dt.timedelta(hours=i) 
-               for i in range(0, valid_time_end_hr, valid_time_step)]
-valid_times_ua = [valid_time_ua_start + dt.timedelta(hours=i) 
-                  for i in range(0, valid_time_ua_end_hr, valid_time_ua_step)]
-
-# Change initial and exclude times to empty lists
-if itime_exclude == [None]:
-    itime_exclude = []
-if vtime_exclude == [None]:
-    vtime_exclude = []
-
-# Change surface or upper-air verification to empty dictionaries if no entries
-if plot_dict['surface'] == None:
-    plot_dict['surface'] = {}
-if plot_dict['upper_air'] == None:
-    plot_dict['upper_air'] = {}
+def make_job(fcn, input_sims, vtimes, out_dir, desc, **kwargs):
+    """
+    Create a plot job. Inputs are copied so that later changes do not alter the job.
 
+    Parameters
+    ----------
+    fcn : String
+        Name of the plotting function in metplus_plots
+    input_sims : Dictionary
+        Simulations passed to the plotting function
+    vtimes : List of dt.datetime objects
+        Valid times passed to the plotting function
+    out_dir : String
+        Directory where the plot is saved
+    desc : String
+        Description of the job (used for printing)
+    **kwargs : optional
+        Other keyword arguments passed to the plotting function
 
-#---------------------------------------------------------------------------------------------------
-# Create Plots
-#---------------------------------------------------------------------------------------------------
+    Returns
+    -------
+    job : Dictionary
+        Plot job
+
+    """
+
+    job = {'fcn':fcn,
+           'args':(copy.deepcopy(input_sims), list(vtimes)),
+           'kwargs':copy.deepcopy(kwargs),
+           'out_dir':out_dir,
+           'desc':desc}
+
+    return job
+
+
+def create_jobs(param):
+    """
+    Create the list of plot jobs from the input YAML parameters
+
+    Parameters
+    ----------
+    param : Dictionary
+        Input YAML parameters
+
+    Returns
+    -------
+    jobs : List of lists
+        Plot jobs. Each inner list contains the jobs for a single verification subtype and
+        variable, which are run in the same process.
+
+    """
+
+    # Read in parameters
+    sim_dict = param['sim_dict']
+    verif_type = param['verif_type']
+    out_dir = param['out_dir']
+    out_tag = param['out_tag']
+    valid_time_start = param['valid_time_start']
+    valid_time_step = param['valid_time_step']
+    valid_time_end_hr = param['valid_time_end_hr']
+    valid_time_ua_start = param['valid_time_ua_start']
+    valid_time_ua_step = param['valid_time_ua_step']
+    valid_time_ua_end_hr = param['valid_time_ua_end_hr']
+    itime_exclude = param['itime_exclude']
+    vtime_exclude = param['vtime_exclude']
+    ci_kw = param['ci_kw']
+    plot_dict = copy.deepcopy(param['plot_dict'])
+    fcst_lead_dieoff = param['fcst_lead_dieoff']
+    fcst_lead_other = param['fcst_lead_other']
+
+    # Optional keyword arguments passed to read_ascii (e.g., to turn on the on-disk MET output cache)
+    if 'read_kw' in param:
+        read_kw = param['read_kw']
+    else:
+        read_kw = {}
+
+    # Create lists of valid times
+    valid_times = [valid_time_start + dt.timedelta(hours=i)
+                   for i in range(0, valid_time_end_hr, valid_time_step)]
+    valid_times_ua = [valid_time_ua_start + dt.timedelta(hours=i)
+                      for i in range(0, valid_time_ua_end_hr, valid_time_ua_step)]
+
+    # Change initial and exclude times to empty lists
+    if itime_exclude == [None]:
+        itime_exclude = []
+    if vtime_exclude == [None]:
+        vtime_exclude = []
 
-# Surface verification
-print()
-print('Surface Verification')
-print('--------------------')
-for subtyp in plot_dict['surface'].keys():
-    os.system(f'mkdir -p {out_dir}/{subtyp}')
-    for plot_var in plot_dict['surface'][subtyp].keys():
-        var_dict = plot_dict['surface'][subtyp][plot_var]
-        for plot_stat in var_dict['plot_stat']:
-            print(f'creating plots for {subtyp} {plot_var} {plot_stat}')
-            if plot_stat in ['BIAS_DIFF', 'MAG_BIAS_DIFF']:
-                var_dict['kwargs']['include_zero'] = False
-            ci_kw_copy = ci_kw.copy()
-            if plot_stat in ['TOTAL']:
-                ci_kw_copy['ci'] = False
-            input_sims_sfc = copy.deepcopy(sim_dict)
-            for key in input_sims_sfc:
-                input_sims_sfc[key]['dir'] = input_sims_sfc[key]['dir'].format(typ=verif_type, subtyp=subtyp)
-            vtimes = copy.deepcopy(valid_times)
-            for t in vtime_exclude:
-                if t in vtimes:
-                    vtimes.remove(t)
-            _ = mp.plot_sfc_dieoff(input_sims_sfc, vtimes, 
-                                fcst_lead=fcst_lead_dieoff, 
-                                plot_stat=plot_stat,
-                                toggle_pts=True,
-                                out_tag=out_tag,
-                                verbose=False,
-                                **var_dict['kwargs'],
-                                **ci_kw_copy)
-            plt.close()
-            for ftime in fcst_lead_other:
-                vtimes = valid_times[ftime:]
-                for t in itime_exclude:
-                    t_adjust = t + dt.timedelta(hours=ftime)
-                    if t_adjust in vtimes:
-                        vtimes.remove(t_adjust)
+    # Change surface or upper-air verification to empty dictionaries if no entries
+    if plot_dict['surface'] == None:
+        plot_dict['surface'] = {}
+    if plot_dict['upper_air'] == None:
+        plot_dict['upper_air'] = {}
+
+    jobs = []
+
+    # Surface verification
+    for subtyp in plot_dict['surface'].keys():
+        subtyp_dir = f'{out_dir}/{subtyp}'
+        input_sims_sfc = mt.format_sims(sim_dict, verif_type, subtyp)
+        for plot_var in plot_dict['surface'][subtyp].keys():
+            var_dict = plot_dict['surface'][subtyp][plot_var]
+            var_jobs = []
+            for plot_stat in var_dict['plot_stat']:
+                desc = f'{subtyp} {plot_var} {plot_stat}'
+                if plot_stat in ['BIAS_DIFF', 'MAG_BIAS_DIFF']:
+                    var_dict['kwargs']['include_zero'] = False
+                ci_kw_copy = ci_kw.copy()
+                if plot_stat in ['TOTAL']:
+                    ci_kw_copy['ci'] = False
+                vtimes = copy.deepcopy(valid_times)
                 for t in vtime_exclude:
                     if t in vtimes:
                         vtimes.remove(t)
-                _ = mp.plot_sfc_timeseries(input_sims_sfc, vtimes, 
-                                        fcst_lead=ftime, 
-                                        plot_stat=plot_stat,
-                                        toggle_pts=False,
-                                        out_tag=out_tag,
-                                        verbose=True,
-                                        **var_dict['kwargs'])
-                plt.close()
-    os.system(f'mv *.png {out_dir}/{subtyp}/')
-
-# Upper-air verification
-print()
-print('Upper-Air Verification')
-print('----------------------')
-for subtyp in plot_dict['upper_air'].keys():
-    os.system(f'mkdir -p {out_dir}/{subtyp}')
-    for plot_var in plot_dict['upper_air'][subtyp].keys():
-        var_dict = plot_dict['upper_air'][subtyp][plot_var]
-        var_dict_lvl = copy.deepcopy(plot_dict['upper_air'][subtyp][plot_var])
-        for plot_stat in var_dict['plot_stat']:
-            print(f'creating plots for {subtyp} {plot_var} {plot_stat}')
-            if plot_stat in ['BIAS_DIFF', 'MAG_BIAS_DIFF']:
-                var_dict['kwargs']['include_zero'] = False
-            ci_kw_copy = ci_kw.copy()
-            if plot_stat in ['TOTAL']:
-                ci_kw_copy['ci'] = False
-            input_sims_ua = copy.deepcopy(sim_dict)
-            for key in input_sims_ua:
-                input_sims_ua[key]['dir'] = input_sims_ua[key]['dir'].format(typ=verif_type, subtyp=subtyp)
-            vtimes = copy.deepcopy(valid_times_ua)
-            for t in vtime_exclude:
-                if t in vtimes:
-                    vtimes.remove(t)
-            for lvl in var_dict['plot_lvl']:
-                var_dict_lvl['kwargs']['plot_param']['FCST_LEV'] = lvl
-                _ = mp.plot_sfc_dieoff(input_sims_ua, vtimes, 
-                                    fcst_lead=fcst_lead_dieoff, 
-                                    plot_stat=plot_stat,
-                                    toggle_pts=True,
-                                    out_tag=out_tag,
-                                    verbose=False,
-                                    **var_dict_lvl['kwargs'],
-                                    **ci_kw_copy)
-                plt.close()
-            for ftime in fcst_lead_other:
-                _ = mp.plot_ua_vprof(input_sims_ua, vtimes, 
-                                    fcst_lead=ftime, 
-                                    plot_stat=plot_stat,
-                                    toggle_pts=True,
-                                    out_tag=out_tag,
-                                    exclude_plvl=[],
-                                    verbose=False,
-                                    ylim=var_dict['prs_limit'],
-                                    **var_dict['kwargs'],
-                                    **ci_kw_copy)
-                plt.close()
-                if valid_time_ua_step == 1:
-                    vtimes = valid_times_ua[ftime:]
-                else:
-                    vtimes = valid_times_ua
-                for t in itime_exclude:
-                    t_adjust = t + dt.timedelta(hours=ftime)
-                    if t_adjust in vtimes:
-                        vtimes.remove(t_adjust)
+                var_jobs.append(make_job('plot_sfc_dieoff', input_sims_sfc, vtimes, subtyp_dir,
+                                         desc,
+                                         fcst_lead=fcst_lead_dieoff,
+                                         plot_stat=plot_stat,
+                                         toggle_pts=True,
+                                         out_tag=out_tag,
+                                         verbose=False,
+                                         **var_dict['kwargs'],
+                                         **ci_kw_copy,
+                                         read_kw=read_kw))
+                for ftime in fcst_lead_other:
+                    vtimes = valid_times[ftime:]
+                    for t in itime_exclude:
+                        t_adjust = t + dt.timedelta(hours=ftime)
+                        if t_adjust in vtimes:
+                            vtimes.remove(t_adjust)
+                    for t in vtime_exclude:
+                        if t in vtimes:
+                            vtimes.remove(t)
+                    var_jobs.append(make_job('plot_sfc_timeseries', input_sims_sfc, vtimes,
+                                             subtyp_dir, desc,
+                                             fcst_lead=ftime,
+                                             plot_stat=plot_stat,
+                                             toggle_pts=False,
+                                             out_tag=out_tag,
+                                             verbose=True,
+                                             **var_dict['kwargs'],
+                                             read_kw=read_kw))
+            jobs.append(var_jobs)
+
+    # Upper-air verification
+    for subtyp in plot_dict['upper_air'].keys():
+        subtyp_dir = f'{out_dir}/{subtyp}'
+        input_sims_ua = mt.format_sims(sim_dict, verif_type, subtyp)
+        for plot_var in plot_dict['upper_air'][subtyp].keys():
+            var_dict = plot_dict['upper_air'][subtyp][plot_var]
+            var_dict_lvl = copy.deepcopy(plot_dict['upper_air'][subtyp][plot_var])
+            var_jobs = []
+            for plot_stat in var_dict['plot_stat']:
+                desc = f'{subtyp} {plot_var} {plot_stat}'
+                if plot_stat in ['BIAS_DIFF', 'MAG_BIAS_DIFF']:
+                    var_dict['kwargs']['include_zero'] = False
+                ci_kw_copy = ci_kw.copy()
+                if plot_stat in ['TOTAL']:
+                    ci_kw_copy['ci'] = False
+                vtimes = copy.deepcopy(valid_times_ua)
                 for t in vtime_exclude:
                     if t in vtimes:
                         vtimes.remove(t)
                 for lvl in var_dict['plot_lvl']:
                     var_dict_lvl['kwargs']['plot_param']['FCST_LEV'] = lvl
-                    _ = mp.plot_sfc_timeseries(input_sims_ua, vtimes, 
-                                            fcst_lead=ftime, 
-                                            plot_stat=plot_stat,
-                                            toggle_pts=False,
-                                            out_tag=out_tag,
-                                            verbose=True,
-                                            **var_dict_lvl['kwargs'])
-                plt.close()
-    os.system(f'mv *.png {out_dir}/{subtyp}/')
-
-# Save code version information
-#os.system(f'git log | head -n 8 >> {out_dir}/code_version.txt')
-#os.system(f'git status >> {out_dir}/code_version.txt')
+                    var_jobs.append(make_job('plot_sfc_dieoff', input_sims_ua, vtimes, subtyp_dir,
+                                             desc,
+                                             fcst_lead=fcst_lead_dieoff,
+                                             plot_stat=plot_stat,
+                                             toggle_pts=True,
+                                             out_tag=out_tag,
+                                             verbose=False,
+                                             **var_dict_lvl['kwargs'],
+                                             **ci_kw_copy,
+                                             read_kw=read_kw))
+                for ftime in fcst_lead_other:
+                    var_jobs.append(make_job('plot_ua_vprof', input_sims_ua, vtimes, subtyp_dir,
+                                             desc,
+                                             fcst_lead=ftime,
+                                             plot_stat=plot_stat,
+                                             toggle_pts=True,
+                                             out_tag=out_tag,
+                                             exclude_plvl=[],
+                                             verbose=False,
+                                             ylim=var_dict['prs_limit'],
+                                             **var_dict['kwargs'],
+                                             **ci_kw_copy,
+                                             read_kw=read_kw))
+                    if valid_time_ua_step == 1:
+                        vtimes = valid_times_ua[ftime:]
+                    else:
+                        vtimes = list(valid_times_ua)
+                    for t in itime_exclude:
+                        t_adjust = t + dt.timedelta(hours=ftime)
+                        if t_adjust in vtimes:
+                            vtimes.remove(t_adjust)
+                    for t in vtime_exclude:
+                        if t in vtimes:
+                            vtimes.remove(t)
+                    for lvl in var_dict['plot_lvl']:
+                        var_dict_lvl['kwargs']['plot_param']['FCST_LEV'] = lvl
+                        var_jobs.append(make_job('plot_sfc_timeseries', input_sims_ua, vtimes,
+                                                 subtyp_dir, desc,
+                                                 fcst_lead=ftime,
+                                                 plot_stat=plot_stat,
+                                                 toggle_pts=False,
+                                                 out_tag=out_tag,
+                                                 verbose=True,
+                                                 **var_dict_lvl['kwargs'],
+                                                 read_kw=read_kw))
+            jobs.append(var_jobs)
+
+    return jobs
+
+
+def job_kwargs(job):
+    """
+    Keyword arguments for a plot job, including the default values for the plotting function
+    """
+
+    kwargs = {k:v.default for k, v in inspect.signature(getattr(mp, job['fcn'])).parameters.items()
+              if v.default is not inspect.Parameter.empty}
+    kwargs.update(job['kwargs'])
+
+    return kwargs
+
+
+def job_output_file(job):
+    """
+    Output figure created by a plot job
+    """
+
+    kwargs = job_kwargs(job)
+    suffix = mp.PLOT_FNAME_FMT[job['fcn']].format(**kwargs)
+
+    return mp.output_fname(kwargs['plot_param'], suffix, out_dir=job['out_dir'])
+
+
+def job_input_files(job):
+    """
+    MET output files read by a plot job (this follows the file selection in each plotting
+    function)
+    """
+
+    kwargs = job_kwargs(job)
+    input_sims, vtimes = job['args']
+    fnames = []
+    for key in input_sims:
+        file_prefix = kwargs['file_prefix']
+        if ((job['fcn'] not in ['plot_sfc_timeseries', 'plot_sawtooth']) and
+            ('prefix' in input_sims[key])):
+            file_prefix = input_sims[key]['prefix']
+        if job['fcn'] == 'plot_sfc_dieoff':
+            leads = [l for t in vtimes for l in kwargs['fcst_lead']]
+            times = [t for t in vtimes for l in kwargs['fcst_lead']]
+        elif job['fcn'] == 'plot_sawtooth':
+            # vtimes are the initialization times for sawtooth plots
+            leads = [l for t in vtimes for l in kwargs['fcst_lead']]
+            times = [t + dt.timedelta(hours=l) for t in vtimes for l in kwargs['fcst_lead']]
+        else:
+            leads = [kwargs['fcst_lead']] * len(vtimes)
+            times = vtimes
+        fnames = fnames + mt.met_fnames(input_sims[key], file_prefix, leads, times,
+                                        kwargs['line_type'])
+
+    return fnames
+
+
+def job_hash(job):
+    """
+    Hash of the parameters and input files (names, sizes, and modification times) of a plot job.
+    Missing input files are included so that a figure is remade once these files are created.
+    """
+
+    info = {k:job[k] for k in ['fcn', 'args', 'kwargs', 'out_dir']}
+    info['inputs'] = []
+    for f in job_input_files(job):
+        if os.path.isfile(f):
+            stat = os.stat(f)
+            info['inputs'].append([f, stat.st_size, stat.st_mtime_ns])
+        else:
+            info['inputs'].append([f, None, None])
+
+    return hashlib.sha256(json.dumps(info, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load_manifest(fname):
+    """
+    Read the plot manifest (output figure -> job hash). An empty manifest is returned if the file
+    does not exist or cannot be read.
+    """
+
+    if os.path.isfile(fname):
+        try:
+            with open(fname, 'r') as fptr:
+                return json.load(fptr)
+        except (ValueError, OSError):
+            print(f'Warning: cannot read plot manifest {fname}. All plots will be remade.')
+    return {}
+
+
+def save_manifest(manifest, fname):
+    """
+    Write the plot manifest. The manifest is written to a temporary file first so that a partial
+    manifest is never left behind.
+    """
+
+    tmp_fname = f'{fname}.tmp{os.getpid()}'
+    with open(tmp_fname, 'w') as fptr:
+        json.dump(manifest, fptr, indent=1, sort_keys=True)
+    os.replace(tmp_fname, fname)
+
+
+def run_jobs(jobs, session_kw={}, manifest={}, profile_kw=None):
+    """
+    Run a group of plot jobs in the current process
+
+    Parameters
+    ----------
+    jobs : List of dictionaries
+        Plot jobs from create_jobs()
+    session_kw : Dictionary, optional
+        Keyword arguments passed to mt.VerifSession, which keeps MET output in memory so that it
+        can be shared by the plots in this group
+    manifest : Dictionary, optional
+        Plot manifest from a previous run. Jobs whose output figure exists and whose hash matches
+        the manifest are skipped. Set to {} to run all jobs.
+    profile_kw : Dictionary, optional
+        Keyword arguments passed to mprof.enable(). Set to None to turn off profiling.
+
+    Returns
+    -------
+    updates : Dictionary
+        Manifest entries (output figure -> job hash) for all jobs in this group
+    stats : Dictionary
+        Profiling statistics for this group of jobs (from mprof.get_stats()). Empty if
+        profile_kw is None.
+
+    """
+
+    # Profiling statistics are only returned for this group of jobs, so statistics recorded 
+    # earlier in this process are set aside until the jobs finish
+    if profile_kw is not None:
+        mprof.enable(**profile_kw)
+        prev_stats = mprof.get_stats()
+        mprof.reset()
+
+    # MET output is shared by all plots in this group that use the same files
+    session = mt.VerifSession(**session_kw)
+
+    updates = {}
+    desc = None
+    for job in jobs:
+        output_file = job_output_file(job)
+        h = job_hash(job)
+        updates[output_file] = h
+        if ((output_file in manifest) and (manifest[output_file] == h) and 
+            os.path.isfile(output_file)):
+            continue
+        if job['desc'] != desc:
+            desc = job['desc']
+            print(f'creating plots for {desc}')
+        with mprof.stage(f"job {os.path.basename(output_file)}"):
+            _ = getattr(mp, job['fcn'])(*job['args'], **job['kwargs'], session=session,
+                                        out_dir=job['out_dir'])
+            plt.close('all')
+
+    stats = {}
+    if profile_kw is not None:
+        stats = mprof.get_stats()
+        mprof.reset()
+        mprof.merge_stats(prev_stats)
+
+    return updates, stats
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    # Input YAML file name
+    if len(sys.argv) > 1:
+        yaml_name = sys.argv[1]
+    else:
+        yaml_name = '/work2/noaa/wrfruc/murdzek/src/metplus_OSSE_scripts/test/cases/plots/precip_radar/plot_param.yml'
+    with open(yaml_name, 'r') as fptr:
+        param = yaml.safe_load(fptr)
+
+    # Optional keyword arguments passed to mt.VerifSession, which keeps MET output in memory so
+    # that it can be shared by different plots
+    if 'session_kw' in param:
+        session_kw = param['session_kw']
+    else:
+        session_kw = {}
+
+    # Number of processes used to create plots
+    if 'nprocs' in param:
+        nprocs = param['nprocs']
+    else:
+        nprocs = 1
+
+    # Option to skip plots that are up to date
+    if 'incremental' in param:
+        incremental = param['incremental']
+    else:
+        incremental = True
+
+    # Optional profiling. 'report' is the output file (JSON or CSV) and 'memory' turns on
+    # tracemalloc
+    if 'profile' in param:
+        profile_kw = {'memory':False}
+        if 'memory' in param['profile']:
+            profile_kw['memory'] = param['profile']['memory']
+        report_fname = param['profile']['report']
+        mprof.enable(**profile_kw)
+    else:
+        profile_kw = None
+    start = dt.datetime.now()
+
+    # Create list of plot jobs and output directories
+    jobs = create_jobs(param)
+    for var_jobs in jobs:
+        for job in var_jobs:
+            os.makedirs(job['out_dir'], exist_ok=True)
+    print(f"Number of plots = {sum([len(var_jobs) for var_jobs in jobs])}")
+
+    # Read manifest from previous runs
+    manifest_fname = f"{param['out_dir']}/plot_manifest.json"
+    os.makedirs(param['out_dir'], exist_ok=True)
+    manifest = load_manifest(manifest_fname)
+    if incremental:
+        old_manifest = manifest
+    else:
+        old_manifest = {}
+
+    # Create plots. The manifest is updated after each group of jobs finishes
+    if nprocs > 1:
+        with cf.ProcessPoolExecutor(max_workers=nprocs) as executor:
+            futures = [executor.submit(run_jobs, var_jobs, session_kw, old_manifest, profile_kw)
+                       for var_jobs in jobs]
+            for f in cf.as_completed(futures):
+                updates, stats = f.result()
+                manifest.update(updates)
+                mprof.merge_stats(stats)
+                save_manifest(manifest, manifest_fname)
+    else:
+        for var_jobs in jobs:
+            updates, stats = run_jobs(var_jobs, session_kw=session_kw, manifest=old_manifest,
+                                      profile_kw=profile_kw)
+            manifest.update(updates)
+            mprof.merge_stats(stats)
+            save_manifest(manifest, manifest_fname)
+
+    # Write profiling report
+    if profile_kw is not None:
+        mprof.record('total', (dt.datetime.now() - start).total_seconds())
+        mprof.write_report(report_fname, meta={'yaml':yaml_name, 'nprocs':nprocs, 
+                                               'start':start})
+        print(f'Profiling report written to {report_fname}')
+
+    # Save code version information
+    #os.system(f'git log | head -n 8 >> {out_dir}/code_version.txt')
+    #os.system(f'git status >> {out_dir}/code_version.txt')
 
 
 """
@@ -0,0 +1,446 @@
+"""
+METplus Statistics Driver
+
+Computes the statistics shown in the die-off, time series, and vertical profile plots created by
+plot_driver.py and writes them as tables (Parquet or CSV) instead of creating figures. The same
+input YAML file as plot_driver.py is used. Plot-only options (e.g., include_zero, figsize) are
+ignored. matplotlib is never imported, so this script can be run on compute nodes without a
+display.
+
+One table is written for each verification subtype and type of series:
+
+    out_dir/<subtyp>/<out_tag>_<series>_stats.<fmt>
+
+where series is 'dieoff', 'timeseries', or 'vprof'. Tables are in long format, with one row for
+each simulation, variable, level, forecast lead time, group, and statistic (see compute_series()).
+
+Input Parameters
+----------------
+    yaml_name : Input YAML file
+    --fmt : Output table format ('parquet' or 'csv')
+    --out_dir : Output directory (overrides out_dir in the input YAML file)
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import datetime as dt
+import numpy as np
+import pandas as pd
+import os
+import copy
+import sys
+import argparse
+import yaml
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+
+
+#---------------------------------------------------------------------------------------------------
+# Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Column used to group the MET output for each type of series
+SERIES_GROUP = {'dieoff':'FCST_LEAD', 'timeseries':'FCST_VALID_BEG', 'vprof':'FCST_LEV'}
+
+# Keyword arguments in plot_dict that change the statistics. All other keyword arguments only
+# change the appearance of the plots.
+SERIES_KW = ['file_prefix', 'line_type', 'plot_param', 'diffs', 'include_ctrl', 'diff_kw']
+
+# Output table formats
+TABLE_FMTS = ['parquet', 'csv']
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def compute_series(series, input_sims, valid_times, fcst_lead, file_prefix='point_stat',
+                   line_type='sl1l2', diffs=False, include_ctrl=True, diff_kw={},
+                   plot_param={'FCST_VAR':'TMP', 'OBTYPE':'ADPUPA'}, plot_stat=['RMSE'],
+                   ci=False, ci_lvl=0.95, ci_opt='t_dist', ci_kw={}, read_kw={}, session=None,
+                   verbose=False):
+    """
+    Compute the statistics for a die-off curve, time series, or vertical profile
+
+    MET output is selected and statistics are computed in the same way as plot_sfc_dieoff(),
+    plot_sfc_timeseries(), and plot_ua_vprof() in metplus_plots.py, except that several
+    statistics are computed at once and time series are matched to the valid times using
+    FCST_VALID_BEG.
+
+    Parameters
+    ----------
+    series : String
+        Type of series ('dieoff', 'timeseries', or 'vprof')
+    input_sims : Dictionary
+        METplus output files. Key is simulation name. The value is another dictionary containing
+        'dir' (METplus output directory) and 'ctrl'. Dictionary can also contain 'subset', which
+        overrides "OBTYPE" in plot_param, 'prefix', which overrides the "file_prefix" keyword
+        argument for die-off curves and vertical profiles, 'scale', which multiplies the
+        statistics for vertical profiles, and 'catalog' (MET output catalog created by
+        mt.build_catalog()).
+    valid_times : List of dt.datetime objects
+        Forecast valid times
+    fcst_lead : List of integers or integer
+        Forecast lead times (hrs). A list for die-off curves, otherwise a single lead time.
+    file_prefix : String, optional
+        Prefix of METplus output files
+    line_type : String, optional
+        METplus line type
+    diffs : Boolean, optional
+        Option to compute differences between the input_sims with ctrl = True and all other
+        simulations
+    include_ctrl : Boolean, optional
+        Option to include the control simulation when computing differences
+    diff_kw : Dictionary, optional
+        Keyword arguments passed to mt.compute_stats_diff()
+    plot_param : dictionary, optional
+        Parameters used to select which rows from the MET output to use
+    plot_stat : List of strings, optional
+        Forecast statistics to compute
+    ci : Boolean, optional
+        Option to compute confidence intervals (not used for time series). Confidence intervals
+        are never computed for TOTAL.
+    ci_lvl : Float, optional
+        Confidence interval level as a fraction
+    ci_opt : String, optional
+        Method used to create confidence intervals
+    ci_kw : Dictionary, optional
+        Additional keyword arguments passed to the confidence interval function
+    read_kw : Dictionary, optional
+        Additional keyword arguments passed to mt.read_ascii()
+    session : mt.VerifSession, optional
+        Shared MET output session. Set to None to read the MET output files in this function.
+    verbose : Boolean, optional
+        Option to have verbose output from mt.read_ascii()
+
+    Returns
+    -------
+    stats_df : pd.DataFrame
+        Statistics in long format. Columns are 'sim', the plot_param keys, 'FCST_LEAD',
+        'FCST_VALID_BEG' (time series only), 'FCST_LEV', 'stat', 'value', 'ci_low', and 'ci_high'.
+        'ci_low' and 'ci_high' are NaN if confidence intervals are not computed.
+
+    """
+
+    group = SERIES_GROUP[series]
+    plot_param_local = copy.deepcopy(plot_param)
+    if series == 'dieoff':
+        leads = list(fcst_lead)
+        if 'FCST_LEAD' in plot_param_local:
+            del plot_param_local['FCST_LEAD']
+    else:
+        leads = [fcst_lead]
+    if series == 'timeseries':
+        ci = False
+    ci_var = [s for s in plot_stat if s != 'TOTAL']
+    ci = ci and (len(ci_var) > 0)
+
+    # If computing differences, determine control simulation name and add line_type to diff_kw
+    if diffs:
+        ctrl_name, diff_kw = mt.diff_plot_prep(input_sims, copy.deepcopy(diff_kw), line_type)
+
+    # Use the same bootstrap resample indices for all simulations
+    ci_kw_local = mt.ci_kw_prep(ci_opt, ci_kw)
+
+    # Read in data. Rows that are not used are removed as the MET output is read
+    read_kw_local = mt.read_kw_prep(input_sims, plot_param_local, read_kw, line_type,
+                                    session=session)
+    verif_idx = {}
+    for key in input_sims.keys():
+        prefix = file_prefix
+        if (series != 'timeseries') and ('prefix' in input_sims[key].keys()):
+            prefix = input_sims[key]['prefix']
+        fnames = mt.met_fnames(input_sims[key], prefix, [l for t in valid_times for l in leads],
+                               [t for t in valid_times for l in leads], line_type)
+        _, verif_idx[key] = mt.read_met_output(fnames, read_kw_local, verbose=verbose,
+                                               session=session, indexed=True)
+
+    # Compute statistics for all groups at once
+    out = []
+    for key in input_sims.keys():
+        if diffs and not include_ctrl and (key == ctrl_name): continue
+        sim_param = copy.deepcopy(plot_param_local)
+        if 'subset' in input_sims[key].keys():
+            sim_param['OBTYPE'] = input_sims[key]['subset']
+        scale = 1
+        if (series == 'vprof') and ('scale' in input_sims[key].keys()):
+            scale = input_sims[key]['scale']
+
+        red_df = mt.subset_verif_df(verif_idx[key], sim_param, copy=False)
+        if len(red_df) == 0:
+            print(f"Warning: compute_series: No MET output for {key} ({series}, {sim_param})")
+            continue
+        if diffs and (key != ctrl_name):
+            red_df_ctrl = mt.subset_verif_df(verif_idx[ctrl_name], sim_param, copy=False)
+            stats_df = mt.compute_stats_by_group(red_df, [group], red_df_ctrl,
+                                                 line_type=line_type, diff_kw=diff_kw, ci=ci,
+                                                 ci_lvl=ci_lvl, ci_opt=ci_opt, ci_kw=ci_kw_local,
+                                                 ci_var=ci_var, stats=list(plot_stat))
+        else:
+            stats_df = mt.compute_stats_by_group(red_df, [group], line_type=line_type, ci=ci,
+                                                 ci_lvl=ci_lvl, ci_opt=ci_opt, ci_kw=ci_kw_local,
+                                                 ci_var=ci_var, stats=list(plot_stat))
+
+        # Convert to long format
+        for s in plot_stat:
+            if s not in stats_df.columns:
+                print(f"Warning: compute_series: {s} is not computed for {key}")
+                continue
+            s_df = pd.DataFrame({'sim':key}, index=range(len(stats_df)))
+            for k in sim_param:
+                s_df[k] = sim_param[k]
+            if series != 'dieoff':
+                s_df['FCST_LEAD'] = int(fcst_lead * 1e4)
+            s_df[group] = stats_df[group].values
+            s_df['stat'] = s
+            s_df['value'] = stats_df[s].values * scale
+            for b in ['low', 'high']:
+                if f'{b}_{s}' in stats_df.columns:
+                    s_df[f'ci_{b}'] = stats_df[f'{b}_{s}'].values * scale
+                else:
+                    s_df[f'ci_{b}'] = np.nan
+            out.append(s_df)
+
+    if len(out) == 0:
+        return pd.DataFrame(columns=['sim', 'FCST_LEAD', group, 'stat', 'value', 'ci_low',
+                                     'ci_high'])
+    return pd.concat(out, ignore_index=True)
+
+
+def remove_times(vtimes, exclude):
+    """
+    Copy of a list of valid times with certain times removed
+    """
+
+    return [t for t in vtimes if t not in exclude]
+
+
+def create_tables(param, session_kw={}, verbose=False):
+    """
+    Compute the statistics for all die-off curves, time series, and vertical profiles in the input
+    YAML parameters. Valid times and forecast lead times follow plot_driver.create_jobs().
+
+    Parameters
+    ----------
+    param : Dictionary
+        Input YAML parameters
+    session_kw : Dictionary, optional
+        Keyword arguments passed to mt.VerifSession, which keeps MET output in memory so that it
+        can be shared by the series for each verification subtype and variable
+    verbose : Boolean, optional
+        Option to have verbose output
+
+    Returns
+    -------
+    tables : Dictionary
+        Statistics in long format (from compute_series()). Key is (subtyp, series). A 'plot_var'
+        column with the variable name from plot_dict is added.
+
+    """
+
+    # Read in parameters
+    sim_dict = param['sim_dict']
+    verif_type = param['verif_type']
+    itime_exclude = param['itime_exclude']
+    vtime_exclude = param['vtime_exclude']
+    ci_kw = param['ci_kw']
+    plot_dict = copy.deepcopy(param['plot_dict'])
+    fcst_lead_dieoff = param['fcst_lead_dieoff']
+    fcst_lead_other = param['fcst_lead_other']
+
+    # Optional keyword arguments passed to read_ascii (e.g., to turn on the on-disk MET output cache)
+    if 'read_kw' in param:
+        read_kw = param['read_kw']
+    else:
+        read_kw = {}
+
+    # Create lists of valid times
+    valid_times = {'surface':[param['valid_time_start'] + dt.timedelta(hours=i)
+                              for i in range(0, param['valid_time_end_hr'],
+                                             param['valid_time_step'])],
+                   'upper_air':[param['valid_time_ua_start'] + dt.timedelta(hours=i)
+                                for i in range(0, param['valid_time_ua_end_hr'],
+                                               param['valid_time_ua_step'])]}
+
+    # Change initial and exclude times to empty lists
+    if itime_exclude == [None]:
+        itime_exclude = []
+    if vtime_exclude == [None]:
+        vtime_exclude = []
+
+    tables = {}
+    for cls in ['surface', 'upper_air']:
+        if plot_dict[cls] == None:
+            continue
+        for subtyp in plot_dict[cls].keys():
+            input_sims = mt.format_sims(sim_dict, verif_type, subtyp)
+            for plot_var in plot_dict[cls][subtyp].keys():
+                if verbose: print(f'computing statistics for {subtyp} {plot_var}')
+                var_dict = plot_dict[cls][subtyp][plot_var]
+                kwargs = {k:var_dict['kwargs'][k] for k in SERIES_KW if k in var_dict['kwargs']}
+                plot_param = kwargs.pop('plot_param')
+                if cls == 'surface':
+                    lvls = [None]
+                else:
+                    lvls = var_dict['plot_lvl']
+
+                # MET output is shared by all series for this subtype and variable
+                session = mt.VerifSession(**session_kw)
+                common_kw = dict(plot_stat=var_dict['plot_stat'], read_kw=read_kw,
+                                 session=session, **kwargs)
+
+                # Die-off curves and vertical profiles use the same valid times
+                vtimes = remove_times(valid_times[cls], vtime_exclude)
+                series_dfs = []
+                for lvl in lvls:
+                    lvl_param = copy.deepcopy(plot_param)
+                    if lvl is not None:
+                        lvl_param['FCST_LEV'] = lvl
+                    series_dfs.append(('dieoff',
+                                       compute_series('dieoff', input_sims, vtimes,
+                                                      fcst_lead_dieoff, plot_param=lvl_param,
+                                                      **ci_kw, **common_kw)))
+                for ftime in fcst_lead_other:
+                    if cls == 'upper_air':
+                        series_dfs.append(('vprof',
+                                           compute_series('vprof', input_sims, vtimes, ftime,
+                                                          plot_param=plot_param, **ci_kw,
+                                                          **common_kw)))
+                    if (cls == 'surface') or (param['valid_time_ua_step'] == 1):
+                        ts_vtimes = valid_times[cls][ftime:]
+                    else:
+                        ts_vtimes = list(valid_times[cls])
+                    ts_vtimes = remove_times(ts_vtimes,
+                                             vtime_exclude + [t + dt.timedelta(hours=ftime)
+                                                              for t in itime_exclude])
+                    for lvl in lvls:
+                        lvl_param = copy.deepcopy(plot_param)
+                        if lvl is not None:
+                            lvl_param['FCST_LEV'] = lvl
+                        series_dfs.append(('timeseries',
+                                           compute_series('timeseries', input_sims, ts_vtimes,
+                                                          ftime, plot_param=lvl_param,
+                                                          **common_kw)))
+
+                for series, df in series_dfs:
+                    df.insert(1, 'plot_var', plot_var)
+                    if (subtyp, series) not in tables:
+                        tables[(subtyp, series)] = []
+                    tables[(subtyp, series)].append(df)
+
+    for k in tables:
+        tables[k] = pd.concat(tables[k], ignore_index=True)
+
+    return tables
+
+
+def write_table(df, fname, fmt='parquet'):
+    """
+    Write a table of statistics
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Statistics (from create_tables())
+    fname : String
+        Output file name
+    fmt : String, optional
+        Output format ('parquet' or 'csv')
+
+    Returns
+    -------
+    None
+
+    """
+
+    if fmt == 'parquet':
+        df.to_parquet(fname, index=False)
+    elif fmt == 'csv':
+        df.to_csv(fname, index=False)
+    else:
+        raise ValueError(f'table format {fmt} is not supported (options: {TABLE_FMTS})')
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+def parse_in_args(argv):
+    """
+    Parse input arguments
+
+    Parameters
+    ----------
+    argv : list
+        Command-line arguments from sys.argv[1:]
+
+    Returns
+    -------
+    Namespace data structure
+
+    """
+
+    parser = argparse.ArgumentParser(description='This script computes the statistics shown in \
+                                                  the die-off, time series, and vertical profile \
+                                                  plots and writes them as tables without \
+                                                  creating any figures.')
+
+    # Positional arguments
+    parser.add_argument('yaml_name',
+                        help='Input YAML file (same format as plot_driver.py).',
+                        type=str)
+
+    # Optional arguments
+    parser.add_argument('--fmt',
+                        dest='fmt',
+                        default='parquet',
+                        choices=TABLE_FMTS,
+                        help='Output table format.',
+                        type=str)
+
+    parser.add_argument('--out_dir',
+                        dest='out_dir',
+                        default=None,
+                        help='Output directory. Defaults to out_dir in the input YAML file.',
+                        type=str)
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+
+    start = dt.datetime.now()
+    print('\nStarting stats_driver.py')
+    print(f"Time = {start.strftime('%Y%m%d %H:%M:%S')}\n")
+
+    # Read in input parameters
+    in_args = parse_in_args(sys.argv[1:])
+    with open(in_args.yaml_name, 'r') as fptr:
+        param = yaml.safe_load(fptr)
+    if in_args.out_dir is not None:
+        param['out_dir'] = in_args.out_dir
+    if 'session_kw' in param:
+        session_kw = param['session_kw']
+    else:
+        session_kw = {}
+
+    # Compute and write statistics
+    tables = create_tables(param, session_kw=session_kw, verbose=True)
+    for (subtyp, series), df in tables.items():
+        out_dir = f"{param['out_dir']}/{subtyp}"
+        os.makedirs(out_dir, exist_ok=True)
+        fname = f"{out_dir}/{param['out_tag']}_{series}_stats.{in_args.fmt}"
+        write_table(df, fname, fmt=in_args.fmt)
+        print(f'{series} statistics for {subtyp} written to {fname} ({len(df)} rows)')
+
+    print('\nProgram finished!')
+    print(f"Elapsed time = {(dt.datetime.now() - start).total_seconds()} s\n")
+
+
+"""
+End stats_driver.py
+"""
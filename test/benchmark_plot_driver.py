@@ -0,0 +1,441 @@
+"""
+End-to-End Benchmark of the METplus Plotting Driver Using the Truth Test Cases
+
+Runs the plot jobs from the plotting input files in `cases/truth/plots` (using the same code path
+as plot_driver.py, including rendering and saving the figures) and sawtooth plots for the
+upper-air truth case. The plot jobs are split into stages (one per input file and plotting
+function). Each stage is run in a new process so that the peak resident set size (RSS) of each
+stage can be measured. The timings of the instrumented functions within each stage (see
+metplus_profile.py) are also recorded.
+
+Results are written to out_dir/plot_benchmark.json and compared to a baseline file (if provided).
+Stages that are slower (or use more memory) than the baseline by more than a threshold are flagged
+and the script exits with a nonzero exit status. Timings depend on the machine, so the baseline
+should be created on the same machine using --save_baseline.
+
+MET output is found using catalogs of each truth experiment directory because the symlinks in
+`cases/truth/precip_radar/output/GridStat` point to files on the machine used to create the truth
+cases.
+
+Example usage:
+    python benchmark_plot_driver.py out_dir --baseline baseline.json --save_baseline
+    python benchmark_plot_driver.py out_dir --baseline baseline.json --threshold 0.2
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import datetime as dt
+import numpy as np
+import pandas as pd
+import os
+import re
+import sys
+import json
+import time
+import socket
+import platform
+import resource
+import argparse
+import yaml
+import multiprocessing as mp_proc
+import concurrent.futures as cf
+
+import metplus_OSSE_scripts.plotting.plot_driver as pdrv
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import metplus_OSSE_scripts.plotting.metplus_profile as mprof
+
+
+#---------------------------------------------------------------------------------------------------
+# Benchmark Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Plotting input files (relative to cases/truth/plots). Key is used in the stage names
+BENCH_YAMLS = {'upper_air':'upper_air/plot_param.yml',
+               'upper_air_diff':'upper_air/plot_param_diff.yml',
+               'precip_radar':'precip_radar/plot_param.yml'}
+
+# Test cases in the plotting input files are found by matching this regex, which is replaced by
+# the local truth directory
+BENCH_CASE_DIR_RE = r'^.*/test/cases/(truth/)?'
+
+# Sawtooth plots for the upper-air truth case (plot_sawtooth is not called by plot_driver.py).
+# Key is the plotted variable, value is the keyword arguments passed to plot_sawtooth
+BENCH_SAWTOOTH_INIT = [dt.datetime(2022, 4, 29, 21) + dt.timedelta(hours=i) for i in range(12)]
+BENCH_SAWTOOTH = {'TMP':{'fcst_lead':[0, 1, 2, 3],
+                         'verif_type':'ua',
+                         'file_prefix':'grid_stat_FV3_TMP_vs_NR_TMP',
+                         'line_type':'sl1l2',
+                         'plot_param':{'OBTYPE':'NR', 'FCST_VAR':'TMP', 'VX_MASK':'FULL'},
+                         'plot_lvl1':'P100',
+                         'plot_lvl2':'P1000',
+                         'plot_stat':'RMSE',
+                         'out_tag':'benchmark'},
+                  'UGRD_VGRD':{'fcst_lead':[0, 1, 2, 3],
+                               'verif_type':'ua',
+                               'file_prefix':'grid_stat_FV3_TMP_vs_NR_TMP',
+                               'line_type':'vl1l2',
+                               'plot_param':{'OBTYPE':'NR', 'FCST_VAR':'UGRD_VGRD',
+                                             'VX_MASK':'FULL'},
+                               'plot_lvl1':'P100',
+                               'plot_lvl2':'P1000',
+                               'plot_stat':'VECT_RMSE',
+                               'out_tag':'benchmark'}}
+
+# Columns in the benchmark results
+BENCH_COLS = ['stage', 'calls', 'wall_time', 'rows', 'peak_rss']
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def load_truth_param(yaml_name, truth_dir, out_dir):
+    """
+    Read a plotting input file for a truth case and point it at the local truth directory
+
+    Parameters
+    ----------
+    yaml_name : string
+        Plotting input file
+    truth_dir : string
+        Local truth directory (test/cases/truth)
+    out_dir : string
+        Output directory for the figures and MET output catalogs
+
+    Returns
+    -------
+    param : dictionary
+        Input parameters for plot_driver.create_jobs(). A catalog is used for each simulation.
+
+    """
+
+    with open(yaml_name, 'r') as fptr:
+        param = yaml.safe_load(fptr)
+    param['out_dir'] = out_dir
+
+    subtyps = []
+    for cls in ['surface', 'upper_air']:
+        if param['plot_dict'][cls] is not None:
+            subtyps = subtyps + list(param['plot_dict'][cls].keys())
+
+    os.makedirs(f"{out_dir}/catalogs", exist_ok=True)
+    for key, sim in param['sim_dict'].items():
+        sim['dir'] = re.sub(BENCH_CASE_DIR_RE, f"{truth_dir}/", sim['dir'])
+        sim['catalog'] = f"{out_dir}/catalogs/{key}_{{subtyp}}.pkl"
+        for subtyp in subtyps:
+
+            # Catalog the entire experiment directory (i.e., the directory above output/{typ})
+            exp_dir = os.path.dirname(os.path.dirname(sim['dir'].format(typ=param['verif_type'],
+                                                                        subtyp=subtyp)))
+            catalog = mt.build_catalog(exp_dir)
+            mt.save_catalog(catalog, sim['catalog'].format(subtyp=subtyp))
+
+    return param
+
+
+def create_stages(truth_dir, out_dir, stages=None):
+    """
+    Create the plot jobs for each benchmark stage
+
+    Parameters
+    ----------
+    truth_dir : string
+        Local truth directory (test/cases/truth)
+    out_dir : string
+        Output directory
+    stages : list of strings, optional
+        Stages to include. Set to None to include all stages.
+
+    Returns
+    -------
+    stage_jobs : dictionary
+        Plot jobs for each stage. Key is the stage name ('<input file key> <plotting function>'),
+        value is a list of job groups (see plot_driver.create_jobs()).
+
+    """
+
+    stage_jobs = {}
+    for name, yaml_name in BENCH_YAMLS.items():
+        param = load_truth_param(f"{truth_dir}/plots/{yaml_name}", truth_dir, f"{out_dir}/{name}")
+        for var_jobs in pdrv.create_jobs(param):
+            for fcn in np.unique([job['fcn'] for job in var_jobs]):
+                stage = f"{name} {fcn}"
+                if stage not in stage_jobs:
+                    stage_jobs[stage] = []
+                stage_jobs[stage].append([job for job in var_jobs if job['fcn'] == fcn])
+
+        # Sawtooth plots use the simulations from the upper-air input file
+        if name == 'upper_air':
+            input_sims = mt.format_sims(param['sim_dict'], param['verif_type'], 'upper_air')
+            stage = f"{name} plot_sawtooth"
+            stage_jobs[stage] = []
+            for var, kwargs in BENCH_SAWTOOTH.items():
+                job = pdrv.make_job('plot_sawtooth', input_sims, BENCH_SAWTOOTH_INIT,
+                                    f"{out_dir}/{name}/upper_air", f"upper_air {var} sawtooth",
+                                    **kwargs)
+                stage_jobs[stage].append([job])
+
+    if stages is not None:
+        stage_jobs = {k:v for k, v in stage_jobs.items() if k in stages}
+
+    return stage_jobs
+
+
+def run_stage(groups):
+    """
+    Run the plot jobs for a single benchmark stage. Intended to be run in a new process.
+
+    Parameters
+    ----------
+    groups : list of lists
+        Groups of plot jobs. Each group is run using plot_driver.run_jobs().
+
+    Returns
+    -------
+    wall_time : float
+        Wall time (s)
+    peak_rss : integer
+        Peak resident set size of the process (bytes)
+    stats : dictionary
+        Profiling statistics for the instrumented functions (from mprof.get_stats()). Statistics
+        for individual plot jobs are not included.
+
+    """
+
+    for jobs in groups:
+        for job in jobs:
+            os.makedirs(job['out_dir'], exist_ok=True)
+
+    start = time.perf_counter()
+    for jobs in groups:
+        _, stats = pdrv.run_jobs(jobs, manifest={}, profile_kw={'memory':False})
+        mprof.merge_stats(stats)
+    wall_time = time.perf_counter() - start
+
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss = peak_rss * 1024
+
+    stats = {k:v for k, v in mprof.get_stats().items() if k[:4] != 'job '}
+
+    return wall_time, peak_rss, stats
+
+
+def run_benchmark(stage_jobs, repeat=1):
+    """
+    Run each benchmark stage in a new process
+
+    Parameters
+    ----------
+    stage_jobs : dictionary
+        Plot jobs for each stage from create_stages()
+    repeat : integer, optional
+        Number of times each stage is run. The minimum wall time and peak RSS are kept.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        Benchmark results with columns BENCH_COLS. Rows for the instrumented functions within each
+        stage are named '<stage>: <function>'.
+
+    """
+
+    # Processes are spawned (rather than forked) so that the peak RSS of one stage does not
+    # include memory from the main process
+    ctx = mp_proc.get_context('spawn')
+    rows = []
+    for stage, groups in stage_jobs.items():
+        print(f"running {stage}")
+        best = None
+        for i in range(repeat):
+            with cf.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                out = executor.submit(run_stage, groups).result()
+            if best is None:
+                best = [out[0], out[1], out[2]]
+            else:
+                best[0] = min(best[0], out[0])
+                best[1] = min(best[1], out[1])
+                for k in best[2].keys():
+                    if k in out[2]:
+                        best[2][k]['wall_time'] = min(best[2][k]['wall_time'],
+                                                      out[2][k]['wall_time'])
+        njobs = sum([len(jobs) for jobs in groups])
+        rows.append([stage, njobs, best[0], None, best[1]])
+        for k, entry in best[2].items():
+            rows.append([f"{stage}: {k}", entry['calls'], entry['wall_time'], entry['rows'], None])
+
+    results = pd.DataFrame(rows, columns=BENCH_COLS)
+
+    return results
+
+
+def write_results(results, fname, meta={}):
+    """
+    Write benchmark results (or a baseline) to a JSON file
+    """
+
+    df = results.astype(object).where(results.notna(), None)
+    out = {'meta':meta, 'stages':df.to_dict(orient='records')}
+    with open(fname, 'w') as fptr:
+        json.dump(out, fptr, indent=1, default=str)
+
+
+def read_results(fname):
+    """
+    Read benchmark results (or a baseline) written by write_results()
+    """
+
+    with open(fname, 'r') as fptr:
+        out = json.load(fptr)
+    results = pd.DataFrame(out['stages'], columns=BENCH_COLS)
+    for c in BENCH_COLS[1:]:
+        results[c] = results[c].astype(float)
+
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=0.25, min_time=0.5):
+    """
+    Compare benchmark results to a baseline
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        Benchmark results from run_benchmark()
+    baseline : pd.DataFrame
+        Baseline results
+    threshold : float, optional
+        Stages with a wall time or peak RSS that is more than (1 + threshold) times the baseline
+        value are flagged
+    min_time : float, optional
+        Wall times are only compared for stages with a baseline wall time of at least min_time (s)
+        because timing noise dominates for very short stages
+
+    Returns
+    -------
+    comparison : pd.DataFrame
+        Results for stages that are also in the baseline, with the baseline values, ratios, and
+        a 'flag' column that is True for stages that slowed down or use more memory
+
+    """
+
+    comparison = pd.merge(results, baseline[['stage', 'wall_time', 'peak_rss']], on='stage',
+                          how='inner', suffixes=('', '_base'))
+    comparison['time_ratio'] = comparison['wall_time'] / comparison['wall_time_base']
+    comparison['rss_ratio'] = comparison['peak_rss'] / comparison['peak_rss_base']
+    slow = ((comparison['wall_time_base'] >= min_time) &
+            (comparison['time_ratio'] > 1. + threshold))
+    big = comparison['rss_ratio'] > 1. + threshold
+    comparison['flag'] = (slow | big).values
+
+    return comparison
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+def parse_in_args(argv):
+    """
+    Parse input arguments
+
+    Parameters
+    ----------
+    argv : list
+        Command-line arguments from sys.argv[1:]
+
+    Returns
+    -------
+    Namespace data structure
+
+    """
+
+    parser = argparse.ArgumentParser(description='This script times the METplus plotting \
+                                                  driver (including rendering) on the truth test \
+                                                  cases and compares the timings and peak memory \
+                                                  usage to a baseline.')
+
+    # Positional arguments
+    parser.add_argument('out_dir',
+                        help='Output directory for the figures and benchmark results',
+                        type=str)
+
+    # Optional arguments
+    parser.add_argument('--baseline', dest='baseline', default=None, type=str,
+                        help='Baseline JSON file')
+    parser.add_argument('--save_baseline', dest='save_baseline', default=False,
+                        action='store_true',
+                        help='Option to save the results as the baseline instead of comparing')
+    parser.add_argument('--threshold', dest='threshold', default=0.25, type=float,
+                        help='Flag stages that are more than (1 + threshold) times the baseline')
+    parser.add_argument('--min_time', dest='min_time', default=0.5, type=float,
+                        help='Only compare wall times for stages that take at least this long in \
+                              the baseline (s)')
+    parser.add_argument('--repeat', dest='repeat', default=1, type=int,
+                        help='Number of times to run each stage (the minimum time is kept)')
+    parser.add_argument('--stages', dest='stages', default=None, type=str, nargs='+',
+                        help='Stages to run (e.g., "upper_air plot_ua_vprof"). Default is all \
+                              stages.')
+    parser.add_argument('--truth_dir', dest='truth_dir', type=str,
+                        default=f"{os.path.dirname(os.path.abspath(__file__))}/cases/truth",
+                        help='Directory with the truth test cases')
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+
+    start = dt.datetime.now()
+    print('\nStarting benchmark_plot_driver.py')
+    print(f"Time = {start.strftime('%Y%m%d %H:%M:%S')}\n")
+
+    # Read in input parameters
+    param = parse_in_args(sys.argv[1:])
+    out_dir = os.path.abspath(param.out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Run benchmark
+    stage_jobs = create_stages(param.truth_dir, out_dir, stages=param.stages)
+    results = run_benchmark(stage_jobs, repeat=param.repeat)
+    meta = {'host':socket.gethostname(), 'python':platform.python_version(), 'start':start,
+            'repeat':param.repeat}
+    write_results(results, f"{out_dir}/plot_benchmark.json", meta=meta)
+    print()
+    summary = results.loc[results['peak_rss'].notna(), ['stage', 'calls', 'wall_time']].copy()
+    summary['peak_rss_MB'] = results['peak_rss'] / 1e6
+    print(summary.to_string(index=False))
+
+    # Compare to baseline
+    exit_status = 0
+    if param.baseline is not None:
+        if param.save_baseline:
+            write_results(results, param.baseline, meta=meta)
+            print(f"\nBaseline written to {param.baseline}")
+        else:
+            comparison = compare_to_baseline(results, read_results(param.baseline),
+                                             threshold=param.threshold, min_time=param.min_time)
+            cols = ['stage', 'wall_time', 'wall_time_base', 'time_ratio', 'rss_ratio']
+            print(f"\nComparison to baseline ({param.baseline}):")
+            print(comparison[cols].to_string(index=False))
+            if comparison['flag'].any():
+                exit_status = 1
+                print(f"\nStages that are more than {100 * param.threshold:.0f}% slower or use "
+                      f"more memory than the baseline:")
+                for stage in comparison.loc[comparison['flag'], 'stage']:
+                    print(f"  {stage}")
+            else:
+                print('\nNo stages are slower than the baseline')
+
+    print('\nProgram finished!')
+    print(f"Elapsed time = {(dt.datetime.now() - start).total_seconds()} s\n")
+    sys.exit(exit_status)
+
+
+"""
+End benchmark_plot_driver.py
+"""
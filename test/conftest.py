@@ -0,0 +1,42 @@
+"""
+Shared pytest configuration for the tests
+
+Tests marked with benchmark_scaling compare wall-clock times, which can fail on a loaded machine
+for reasons unrelated to the code, so they are skipped unless --benchmark-scaling is passed.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import pytest
+
+
+#---------------------------------------------------------------------------------------------------
+# pytest Hooks
+#---------------------------------------------------------------------------------------------------
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark-scaling', action='store_true', default=False,
+                     help='Run the wall-clock scaling tests (marked with benchmark_scaling)')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark_scaling: wall-clock scaling test (only run '
+                            'with --benchmark-scaling)')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark-scaling'):
+        return
+    skip = pytest.mark.skip(reason='Use --benchmark-scaling to run the scaling tests')
+    for item in items:
+        if 'benchmark_scaling' in item.keywords:
+            item.add_marker(skip)
+
+
+"""
+End conftest.py
+"""
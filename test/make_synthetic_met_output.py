@@ -0,0 +1,402 @@
+"""
+Create Synthetic MET Output Files
+
+Writes GridStat ASCII output files (SL1L2, VL1L2, and CTC line types) with the same header and
+column layout as MET v11.0, but with made-up statistics. The number of experiments, valid times,
+forecast lead times, vertical levels, variables, and verification masks can all be set, so this
+script can be used to create datasets that are much larger than the cases in `cases/truth` (e.g.,
+for benchmarking metplus_tools.py).
+
+The statistics are internally consistent (e.g., MSE computed from the partial sums is always
+positive and CTC counts sum to TOTAL). All experiments are verified against the same synthetic
+"truth", errors grow with forecast lead time, and each successive experiment is slightly more
+skillful than the previous one.
+
+Example usage:
+    python make_synthetic_met_output.py out_dir --n_exp 2 --n_valid 48 --leads 0 1 2 3 6 12
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import datetime as dt
+import os
+import sys
+import argparse
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+
+
+#---------------------------------------------------------------------------------------------------
+# Synthetic Data Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Synthetic SL1L2 and VL1L2 variables. Key is FCST_VAR. The domain-mean observed value at pressure
+# p (hPa) is mean * (p / 1000)**pexp. sd is the standard deviation of the observed field within the
+# domain and err is the forecast error standard deviation at the initial time. sd and err are
+# multiplied by (p / 1000)**pexp if 'scale_sd' is True. For UGRD_VGRD, mean is the mean U wind.
+SYNTH_VARS = {'TMP':       {'line_type':'sl1l2', 'units':'K', 'mean':288., 'pexp':0.19,
+                            'sd':5., 'err':0.6, 'scale_sd':False},
+              'SPFH':      {'line_type':'sl1l2', 'units':'g/kg', 'mean':12., 'pexp':3.,
+                            'sd':4., 'err':1.2, 'scale_sd':True},
+              'RH':        {'line_type':'sl1l2', 'units':'%', 'mean':70., 'pexp':0.,
+                            'sd':20., 'err':8., 'scale_sd':False},
+              'UGRD_VGRD': {'line_type':'vl1l2', 'units':'m/s', 'mean':3., 'pexp':-0.8,
+                            'sd':8., 'err':1.5, 'scale_sd':False}}
+
+# Synthetic CTC thresholds for 1-hr precip. Key is the threshold, value is the observed event
+# frequency
+SYNTH_CTC_THRESH = {'>0.249':0.08, '>0.997':0.045, '>2.539':0.02, '>6.350':0.006}
+
+# Number of grid points in the FULL verification mask (same as the RRFS CONUS 3-km domain)
+SYNTH_NPTS = 1905141
+
+# Default vertical levels
+SYNTH_LEVELS = ['P1000', 'P925', 'P850', 'P700', 'P500', 'P400', 'P300', 'P250', 'P200', 'P150',
+                'P100']
+
+
+#---------------------------------------------------------------------------------------------------
+# Functions
+#---------------------------------------------------------------------------------------------------
+
+def level_pressure(levels):
+    """
+    Pressure (hPa) of each vertical level. Levels that are not pressure levels (e.g., 'Z2') are
+    assigned a pressure of 1000 hPa.
+    """
+
+    return np.array([float(l[1:]) if l[0] == 'P' else 1000. for l in levels])
+
+
+def format_met_lines(cols):
+    """
+    Format MET output as whitespace-delimited, left-justified columns
+
+    Parameters
+    ----------
+    cols : dictionary
+        MET output columns. Key is the column name, value is an array of strings. Order of the
+        keys determines the order of the columns.
+
+    Returns
+    -------
+    text : string
+        Contents of a MET ASCII output file (including the header line)
+
+    """
+
+    padded = []
+    for name, vals in cols.items():
+        vals = np.asarray(vals, dtype=str)
+        width = max(len(name), np.char.str_len(vals).max())
+        padded.append(np.concatenate([[name.ljust(width)], np.char.ljust(vals, width)]))
+    lines = [' '.join(row).rstrip() for row in zip(*padded)]
+
+    return '\n'.join(lines) + '\n'
+
+
+def header_cols(desc, lead, valid, fcst_var, units, levels, masks, line_type, thresh='NA'):
+    """
+    MET header columns for a single MET output file. Each input array must have the same length
+    (the number of lines in the file).
+    """
+
+    n = len(fcst_var)
+    lead_str = '%02d0000' % lead
+    valid_str = valid.strftime('%Y%m%d_%H%M%S')
+    cols = {'VERSION':np.full(n, 'V11.0.1'),
+            'MODEL':np.full(n, 'FV3'),
+            'DESC':np.full(n, desc),
+            'FCST_LEAD':np.full(n, lead_str),
+            'FCST_VALID_BEG':np.full(n, valid_str),
+            'FCST_VALID_END':np.full(n, valid_str),
+            'OBS_LEAD':np.full(n, '000000'),
+            'OBS_VALID_BEG':np.full(n, valid_str),
+            'OBS_VALID_END':np.full(n, valid_str),
+            'FCST_VAR':fcst_var,
+            'FCST_UNITS':units,
+            'FCST_LEV':levels,
+            'OBS_VAR':fcst_var,
+            'OBS_UNITS':units,
+            'OBS_LEV':levels,
+            'OBTYPE':np.full(n, 'NR'),
+            'VX_MASK':masks,
+            'INTERP_MTHD':np.full(n, 'NEAREST'),
+            'INTERP_PNTS':np.full(n, '1'),
+            'FCST_THRESH':np.broadcast_to(np.asarray(thresh), n),
+            'OBS_THRESH':np.broadcast_to(np.asarray(thresh), n),
+            'COV_THRESH':np.full(n, 'NA'),
+            'ALPHA':np.full(n, 'NA'),
+            'LINE_TYPE':np.full(n, line_type.upper())}
+
+    return cols
+
+
+def make_synthetic_met_output(out_dir, n_exp=2, n_valid=24, leads=[0, 1, 2, 3, 6, 12],
+                              levels=SYNTH_LEVELS, variables=['TMP', 'SPFH', 'RH', 'UGRD_VGRD'],
+                              masks=['FULL'], line_types=['sl1l2', 'vl1l2', 'ctc'],
+                              start=dt.datetime(2022, 4, 29, 21), step=1,
+                              file_prefix='grid_stat_FV3_vs_NR', seed=0):
+    """
+    Write synthetic MET GridStat output files
+
+    Parameters
+    ----------
+    out_dir : string
+        Output directory. MET output files for each experiment are written to a subdirectory of
+        out_dir with the same name as the experiment.
+    n_exp : integer, optional
+        Number of experiments. Experiments are named 'exp0', 'exp1', ...
+    n_valid : integer, optional
+        Number of valid times
+    leads : list of integers, optional
+        Forecast lead times (hrs). Output is written for every combination of valid time and lead
+        time.
+    levels : list of strings, optional
+        Vertical levels (FCST_LEV) for SL1L2 and VL1L2 output
+    variables : list of strings, optional
+        Variables for SL1L2 and VL1L2 output. Must be keys in SYNTH_VARS.
+    masks : list of strings, optional
+        Verification masks (VX_MASK)
+    line_types : list of strings, optional
+        Line types to write. Options: 'sl1l2', 'vl1l2', 'ctc'
+    start : dt.datetime, optional
+        First valid time
+    step : integer, optional
+        Time between valid times (hrs)
+    file_prefix : string, optional
+        Prefix of the MET output files. Output files are named
+        <file_prefix>_<lead>L_<valid>V_<line_type>.txt, which is the same naming convention
+        expected by metplus_tools.met_fnames().
+    seed : integer, optional
+        Random number generator seed
+
+    Returns
+    -------
+    exp_dirs : dictionary
+        Directory containing the MET output for each experiment. Key is the experiment name.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    valid_times = [start + dt.timedelta(hours=step*i) for i in range(n_valid)]
+    exps = [f"exp{i}" for i in range(n_exp)]
+
+    # Line metadata for SL1L2 and VL1L2 output (one line per variable, level, and mask)
+    pres = level_pressure(levels)
+    lines = {}
+    for lt in ['sl1l2', 'vl1l2']:
+        lt_vars = [v for v in variables if SYNTH_VARS[v]['line_type'] == lt]
+        if (lt not in line_types) or (len(lt_vars) == 0):
+            continue
+        v_idx, l_idx, m_idx = [a.ravel() for a in np.meshgrid(np.arange(len(lt_vars)),
+                                                              np.arange(len(levels)),
+                                                              np.arange(len(masks)),
+                                                              indexing='ij')]
+        info = {k:np.array([SYNTH_VARS[lt_vars[i]][k] for i in v_idx])
+                for k in ['units', 'mean', 'pexp', 'sd', 'err', 'scale_sd']}
+        pfac = (pres[l_idx] / 1000.)**info['pexp']
+        sfac = np.where(info['scale_sd'], pfac, 1.)
+        lines[lt] = {'FCST_VAR':np.array(lt_vars)[v_idx],
+                     'FCST_UNITS':info['units'],
+                     'FCST_LEV':np.array(levels)[l_idx],
+                     'VX_MASK':np.array(masks)[m_idx],
+                     'mean':info['mean'] * pfac,
+                     'sd':info['sd'] * sfac,
+                     'err':info['err'] * sfac,
+                     'n':len(v_idx)}
+
+    # Line metadata for CTC output (one line per threshold and mask)
+    if 'ctc' in line_types:
+        thresh = list(SYNTH_CTC_THRESH.keys())
+        t_idx, m_idx = [a.ravel() for a in np.meshgrid(np.arange(len(thresh)),
+                                                       np.arange(len(masks)), indexing='ij')]
+        lines['ctc'] = {'FCST_VAR':np.full(len(t_idx), 'APCP_01'),
+                        'FCST_UNITS':np.full(len(t_idx), 'kg/m^2'),
+                        'FCST_LEV':np.full(len(t_idx), 'A01'),
+                        'VX_MASK':np.array(masks)[m_idx],
+                        'FCST_THRESH':np.array(thresh)[t_idx],
+                        'base_rate':np.array([SYNTH_CTC_THRESH[t] for t in thresh])[t_idx],
+                        'n':len(t_idx)}
+
+    # Number of points in each mask. FULL always has SYNTH_NPTS points
+    mask_npts = {m:SYNTH_NPTS if m == 'FULL' else int(SYNTH_NPTS * rng.uniform(0.05, 0.5))
+                 for m in masks}
+
+    # Observed statistics do not depend on the experiment or lead time, so they are drawn first
+    obs = {}
+    for lt, meta in lines.items():
+        obs[lt] = []
+        for t in valid_times:
+            if lt == 'ctc':
+                rate = meta['base_rate'] * rng.lognormal(0, 0.3, meta['n'])
+                obs[lt].append(np.minimum(rate, 0.3))
+            else:
+                o = {'mean':meta['mean'] + 0.1 * meta['sd'] * rng.standard_normal(meta['n']),
+                     'sd':meta['sd'] * rng.uniform(0.8, 1.2, meta['n'])}
+                if lt == 'vl1l2':
+                    o['vmean'] = 0.3 * meta['sd'] * rng.standard_normal(meta['n'])
+                obs[lt].append(o)
+
+    exp_dirs = {}
+    for iexp, exp in enumerate(exps):
+        exp_dirs[exp] = f"{out_dir}/{exp}"
+        os.makedirs(exp_dirs[exp], exist_ok=True)
+        skill = 1. - 0.04 * iexp
+        for lt, meta in lines.items():
+            total = np.array([mask_npts[m] for m in meta['VX_MASK']])
+
+            # Persistent biases for each line, which grow with lead time
+            if lt != 'ctc':
+                bias = 0.3 * meta['err'] * rng.standard_normal(meta['n'])
+                if lt == 'vl1l2':
+                    vbias = 0.3 * meta['err'] * rng.standard_normal(meta['n'])
+
+            for lead in leads:
+                growth = (1. + 0.12 * lead) * skill
+                for it, t in enumerate(valid_times):
+                    cols = header_cols(exp, lead, t, meta['FCST_VAR'], meta['FCST_UNITS'],
+                                       meta['FCST_LEV'], meta['VX_MASK'], lt,
+                                       thresh=meta.get('FCST_THRESH', 'NA'))
+                    o = obs[lt][it]
+                    if lt == 'sl1l2':
+
+                        # Forecast = obs + error, where error ~ N(b, s^2) is independent of obs
+                        s = meta['err'] * growth * rng.lognormal(0, 0.1, meta['n'])
+                        b = bias * growth + 0.2 * s * rng.standard_normal(meta['n'])
+                        oobar = o['sd']**2 + o['mean']**2
+                        stats = {'FBAR':o['mean'] + b,
+                                 'OBAR':o['mean'],
+                                 'FOBAR':oobar + o['mean'] * b,
+                                 'FFBAR':oobar + 2 * o['mean'] * b + s**2 + b**2,
+                                 'OOBAR':oobar,
+                                 'MAE':np.sqrt(2. / np.pi) * np.sqrt(s**2 + b**2)}
+                    elif lt == 'vl1l2':
+                        s = meta['err'] * growth * rng.lognormal(0, 0.1, meta['n'])
+                        bu = bias * growth + 0.2 * s * rng.standard_normal(meta['n'])
+                        bv = vbias * growth + 0.2 * s * rng.standard_normal(meta['n'])
+                        uvoobar = 2 * o['sd']**2 + o['mean']**2 + o['vmean']**2
+                        cross = o['mean'] * bu + o['vmean'] * bv
+                        uvffbar = uvoobar + 2 * cross + 2 * s**2 + bu**2 + bv**2
+                        stats = {'UFBAR':o['mean'] + bu,
+                                 'VFBAR':o['vmean'] + bv,
+                                 'UOBAR':o['mean'],
+                                 'VOBAR':o['vmean'],
+                                 'UVFOBAR':uvoobar + cross,
+                                 'UVFFBAR':uvffbar,
+                                 'UVOOBAR':uvoobar,
+                                 'F_SPEED_BAR':0.9 * np.sqrt(uvffbar),
+                                 'O_SPEED_BAR':0.9 * np.sqrt(uvoobar)}
+                    else:
+                        oy = np.rint(total * o).astype(int)
+                        pod = np.clip(0.75 * skill / (1. + 0.08 * lead) +
+                                      0.05 * rng.standard_normal(meta['n']), 0.05, 0.95)
+                        far = np.clip(0.3 + 0.02 * lead / skill +
+                                      0.05 * rng.standard_normal(meta['n']), 0.05, 0.8)
+                        hits = np.rint(oy * pod).astype(int)
+                        false_alarms = np.rint(hits * far / (1. - far)).astype(int)
+                        stats = {'FY_OY':hits,
+                                 'FY_ON':false_alarms,
+                                 'FN_OY':oy - hits,
+                                 'FN_ON':total - oy - false_alarms,
+                                 'EC_VALUE':np.full(meta['n'], 0.5)}
+
+                    # MET writes 5 decimal places, which is not enough precision to compute MSE
+                    # from the partial sums for small values (e.g., SPFH near the tropopause), so
+                    # 10 significant digits are used instead
+                    cols['TOTAL'] = total.astype(str)
+                    for c in mt.MET_LINE_TYPE_COLS[lt.upper()][1:]:
+                        if lt == 'ctc' and c != 'EC_VALUE':
+                            cols[c] = stats[c].astype(str)
+                        else:
+                            cols[c] = np.char.mod('%.10g', stats[c])
+
+                    fname = '%s/%s_%02d0000L_%sV_%s.txt' % (exp_dirs[exp], file_prefix, lead,
+                                                          t.strftime('%Y%m%d_%H%M%S'), lt)
+                    with open(fname, 'w') as fptr:
+                        fptr.write(format_met_lines(cols))
+
+    return exp_dirs
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+def parse_in_args(argv):
+    """
+    Parse input arguments
+
+    Parameters
+    ----------
+    argv : list
+        Command-line arguments from sys.argv[1:]
+
+    Returns
+    -------
+    Namespace data structure
+
+    """
+
+    parser = argparse.ArgumentParser(description='This script creates synthetic MET GridStat \
+                                                  output files (SL1L2, VL1L2, and CTC) that can \
+                                                  be used to test and benchmark the plotting \
+                                                  utilities.')
+
+    # Positional arguments
+    parser.add_argument('out_dir',
+                        help='Output directory. Each experiment is written to a subdirectory.',
+                        type=str)
+
+    # Optional arguments
+    parser.add_argument('--n_exp', dest='n_exp', default=2, type=int,
+                        help='Number of experiments')
+    parser.add_argument('--n_valid', dest='n_valid', default=24, type=int,
+                        help='Number of valid times')
+    parser.add_argument('--step', dest='step', default=1, type=int,
+                        help='Time between valid times (hrs)')
+    parser.add_argument('--leads', dest='leads', default=[0, 1, 2, 3, 6, 12], type=int, nargs='+',
+                        help='Forecast lead times (hrs)')
+    parser.add_argument('--levels', dest='levels', default=SYNTH_LEVELS, type=str, nargs='+',
+                        help='Vertical levels (e.g., P500)')
+    parser.add_argument('--variables', dest='variables', default=list(SYNTH_VARS.keys()),
+                        type=str, nargs='+', help='Variables for SL1L2 and VL1L2 output')
+    parser.add_argument('--masks', dest='masks', default=['FULL'], type=str, nargs='+',
+                        help='Verification masks')
+    parser.add_argument('--line_types', dest='line_types', default=['sl1l2', 'vl1l2', 'ctc'],
+                        type=str, nargs='+', help='Line types to write')
+    parser.add_argument('--seed', dest='seed', default=0, type=int,
+                        help='Random number generator seed')
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+
+    start = dt.datetime.now()
+    print('\nStarting make_synthetic_met_output.py')
+    print(f"Time = {start.strftime('%Y%m%d %H:%M:%S')}\n")
+
+    # Read in input parameters
+    param = parse_in_args(sys.argv[1:])
+
+    exp_dirs = make_synthetic_met_output(param.out_dir, n_exp=param.n_exp, n_valid=param.n_valid,
+                                         leads=param.leads, levels=param.levels,
+                                         variables=param.variables, masks=param.masks,
+                                         line_types=param.line_types, step=param.step,
+                                         seed=param.seed)
+    for exp, d in exp_dirs.items():
+        print(f"{exp}: {d}")
+
+    print('\nProgram finished!')
+    print(f"Elapsed time = {(dt.datetime.now() - start).total_seconds()} s\n")
+
+
+"""
+End make_synthetic_met_output.py
+"""
@@ -0,0 +1,193 @@
+"""
+Benchmarks for metplus_tools.py
+
+Uses synthetic MET output from make_synthetic_met_output.py, which is much larger than the cases in
+`cases/truth`. Requires the pytest-benchmark plugin (this file is skipped otherwise). To only run
+the benchmarks:
+    pytest test_benchmark_metplus_tools.py --benchmark-only
+
+In addition to the benchmarks, the scaling tests check that runtime grows roughly linearly with
+the number of valid times (e.g., to catch an accidental O(N^2) pairing of rows). The scaling tests
+compare wall-clock times, so they are skipped unless requested:
+    pytest test_benchmark_metplus_tools.py --benchmark-scaling
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+import glob
+import time
+
+pytest.importorskip('pytest_benchmark')
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import metplus_OSSE_scripts.test.make_synthetic_met_output as synth
+
+
+#---------------------------------------------------------------------------------------------------
+# Benchmark Parameters
+#---------------------------------------------------------------------------------------------------
+
+# Number of valid times in each synthetic dataset. The large dataset is 4x the small dataset
+BENCH_N_VALID = {'small':12, 'large':48}
+
+# Other synthetic dataset options
+BENCH_SYNTH_KW = {'n_exp':2, 'leads':[0, 1, 2, 3, 6, 12], 'masks':['FULL', 'EAST', 'WEST'],
+                  'variables':['TMP', 'SPFH', 'RH'], 'line_types':['sl1l2']}
+
+# Maximum ratio of the large-dataset runtime to the small-dataset runtime. Linear scaling gives a
+# ratio of 4 and quadratic scaling gives a ratio of 16, so this threshold is loose enough to avoid
+# failures caused by timing noise while still catching quadratic behavior
+BENCH_MAX_RATIO = 10.
+
+
+#---------------------------------------------------------------------------------------------------
+# Helper Functions
+#---------------------------------------------------------------------------------------------------
+
+def bench_case(name, exp_dirs, verif_dfs):
+    """
+    Function and arguments for each benchmark case
+
+    Parameters
+    ----------
+    name : string
+        Benchmark case
+    exp_dirs : dictionary
+        Synthetic MET output directory for each experiment
+    verif_dfs : dictionary
+        Synthetic MET output for each experiment (from read_ascii())
+
+    Returns
+    -------
+    fcn : function
+        Function to benchmark
+    args : list
+        Positional arguments passed to fcn
+    kwargs : dictionary
+        Keyword arguments passed to fcn
+
+    """
+
+    df1 = verif_dfs['exp0']
+    df2 = verif_dfs['exp1']
+    if name == 'read_ascii':
+        fnames = sorted(glob.glob(f"{exp_dirs['exp0']}/*_sl1l2.txt"))
+        return mt.read_ascii, [fnames], {'verbose':False}
+    elif name == 'subset_verif_df':
+        param = {'FCST_VAR':'TMP', 'VX_MASK':'FULL', 'FCST_LEAD':60000}
+        return mt.subset_verif_df, [df1, param], {}
+    elif name == 'compute_stats_diff':
+        return mt.compute_stats_diff, [df1, df2], {'var':['RMSE', 'ME']}
+    elif name == 'compute_stats_entire_df':
+        return mt.compute_stats_entire_df, [df1], {'verif_df2':df2, 'ci':True,
+                                                   'diff_kw':{'var':['RMSE'], 'pct':False}}
+    elif name == 'compute_stats_vert_avg':
+        return mt.compute_stats_vert_avg, [df1], {'verif_df2':df2, 'diff_kw':{'var':['RMSE']}}
+
+
+def min_time(fcn, args, kwargs, repeat=3):
+    """
+    Minimum runtime (s) over several calls to fcn
+    """
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fcn(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+#---------------------------------------------------------------------------------------------------
+# Fixtures
+#---------------------------------------------------------------------------------------------------
+
+@pytest.fixture(scope='module')
+def synthetic_dirs(tmp_path_factory):
+    exp_dirs = {}
+    for size, n_valid in BENCH_N_VALID.items():
+        out_dir = str(tmp_path_factory.mktemp(f"synthetic_{size}"))
+        exp_dirs[size] = synth.make_synthetic_met_output(out_dir, n_valid=n_valid,
+                                                         **BENCH_SYNTH_KW)
+    return exp_dirs
+
+
+@pytest.fixture(scope='module')
+def synthetic_dfs(synthetic_dirs):
+    verif_dfs = {}
+    for size, exp_dirs in synthetic_dirs.items():
+        verif_dfs[size] = {}
+        for exp, d in exp_dirs.items():
+            fnames = sorted(glob.glob(f"{d}/*_sl1l2.txt"))
+            verif_dfs[size][exp] = mt.read_ascii(fnames, verbose=False)
+    return verif_dfs
+
+
+#---------------------------------------------------------------------------------------------------
+# Tests
+#---------------------------------------------------------------------------------------------------
+
+class TestBenchmarkMETtools():
+
+    def test_read_ascii(self, benchmark, synthetic_dirs, synthetic_dfs):
+        fcn, args, kwargs = bench_case('read_ascii', synthetic_dirs['large'],
+                                       synthetic_dfs['large'])
+        df = benchmark(fcn, *args, **kwargs)
+        nlines = (len(BENCH_SYNTH_KW['variables']) * len(synth.SYNTH_LEVELS) *
+                  len(BENCH_SYNTH_KW['masks']))
+        assert len(df) == BENCH_N_VALID['large'] * len(BENCH_SYNTH_KW['leads']) * nlines
+
+    def test_subset_verif_df(self, benchmark, synthetic_dirs, synthetic_dfs):
+        fcn, args, kwargs = bench_case('subset_verif_df', synthetic_dirs['large'],
+                                       synthetic_dfs['large'])
+        df = benchmark(fcn, *args, **kwargs)
+        assert len(df) == BENCH_N_VALID['large'] * len(synth.SYNTH_LEVELS)
+
+    def test_compute_stats_diff(self, benchmark, synthetic_dirs, synthetic_dfs):
+        fcn, args, kwargs = bench_case('compute_stats_diff', synthetic_dirs['large'],
+                                       synthetic_dfs['large'])
+        diff_df = benchmark(fcn, *args, **kwargs)
+
+        # Every line should have a match in the other experiment
+        assert len(diff_df) == len(synthetic_dfs['large']['exp0'])
+        assert np.all(np.isfinite(diff_df['RMSE']))
+
+    def test_compute_stats_entire_df(self, benchmark, synthetic_dirs, synthetic_dfs):
+        fcn, args, kwargs = bench_case('compute_stats_entire_df', synthetic_dirs['large'],
+                                       synthetic_dfs['large'])
+        red_df = benchmark(fcn, *args, **kwargs)
+        assert len(red_df) == 1
+        assert red_df['low_RMSE'].values[0] < red_df['RMSE'].values[0]
+        assert red_df['RMSE'].values[0] < red_df['high_RMSE'].values[0]
+
+    def test_compute_stats_vert_avg(self, benchmark, synthetic_dirs, synthetic_dfs):
+        fcn, args, kwargs = bench_case('compute_stats_vert_avg', synthetic_dirs['large'],
+                                       synthetic_dfs['large'])
+        vert_df = benchmark(fcn, *args, **kwargs)
+        assert len(vert_df) == (BENCH_N_VALID['large'] * len(BENCH_SYNTH_KW['leads']) *
+                                len(BENCH_SYNTH_KW['variables']))
+
+    @pytest.mark.benchmark_scaling
+    @pytest.mark.parametrize('name', ['read_ascii', 'subset_verif_df', 'compute_stats_diff',
+                                      'compute_stats_entire_df', 'compute_stats_vert_avg'])
+    def test_scaling(self, name, synthetic_dirs, synthetic_dfs):
+        times = {}
+        for size in BENCH_N_VALID.keys():
+            fcn, args, kwargs = bench_case(name, synthetic_dirs[size], synthetic_dfs[size])
+            times[size] = min_time(fcn, args, kwargs)
+        ratio = times['large'] / times['small']
+        print(f"{name}: small = {times['small']:.4f} s, large = {times['large']:.4f} s, "
+              f"ratio = {ratio:.2f}")
+        assert ratio < BENCH_MAX_RATIO
+
+
+"""
+End test_benchmark_metplus_tools.py
+"""
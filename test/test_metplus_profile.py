@@ -0,0 +1,80 @@
+"""
+Tests for metplus_profile.py
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+import json
+import pytest
+
+import metplus_OSSE_scripts.plotting.metplus_profile as mprof
+
+
+#---------------------------------------------------------------------------------------------------
+# Tests
+#---------------------------------------------------------------------------------------------------
+
+class TestMETprofile():
+
+    @pytest.fixture(autouse=True)
+    def clean_profile(self):
+        mprof.reset()
+        yield
+        mprof.disable()
+        mprof.reset()
+
+    def test_disabled(self):
+
+        @mprof.timed()
+        def make_df(n):
+            return pd.DataFrame({'a':np.arange(n)})
+
+        make_df(5)
+        with mprof.stage('outer'):
+            pass
+        assert mprof.get_stats() == {}
+
+    def test_stages(self, tmp_path):
+        mprof.enable(memory=True)
+
+        @mprof.timed()
+        def make_df(n):
+            return pd.DataFrame({'a':np.arange(n)})
+
+        with mprof.stage('outer'):
+            make_df(1000)
+            make_df(10)
+            big = np.ones(200000)
+        stats = mprof.get_stats()
+        assert stats['make_df']['calls'] == 2
+        assert stats['make_df']['rows'] == 1010
+        assert stats['outer']['calls'] == 1
+        assert stats['outer']['wall_time'] >= stats['make_df']['wall_time']
+
+        # The peak for the outer stage includes the allocation in the outer stage
+        assert stats['outer']['peak_mem'] >= big.nbytes
+
+        # Merging statistics (e.g., from a worker process)
+        mprof.merge_stats(stats)
+        assert mprof.get_stats()['make_df']['calls'] == 4
+
+        # Reports
+        mprof.write_report(f"{tmp_path}/report.csv")
+        df = pd.read_csv(f"{tmp_path}/report.csv")
+        assert sorted(df['stage']) == ['make_df', 'outer']
+        mprof.write_report(f"{tmp_path}/report.json", meta={'run':'test'})
+        with open(f"{tmp_path}/report.json", 'r') as fptr:
+            report = json.load(fptr)
+        assert report['meta']['run'] == 'test'
+        assert len(report['stages']) == 2
+
+
+"""
+End test_metplus_profile.py
+"""
@@ -14,6 +14,8 @@ import yaml
 import pandas as pd
 import os
 import glob
+import datetime as dt
+import scipy.stats as ss
 
 import metplus_OSSE_scripts.plotting.metplus_tools as mt
 
@@ -49,6 +51,245 @@ class TestMETtools():
         return mt.read_ascii(glob.glob(f"{ua_uas_output_dir}/*sl1l2.txt"))
 
 
+    def test_confidence_interval_t_mean_groups(self):
+
+        # Ragged layout with several groups and variables
+        rng = np.random.default_rng(42)
+        data = np.cumsum(rng.normal(size=(60, 2)), axis=0)
+        starts = np.array([0, 5, 25])
+        ends = np.array([5, 25, 60])
+        for ci_kw in [{}, {'acct_lag_corr':True}, {'acct_lag_corr':True, 'mats_ste':True}]:
+            low, high = mt.confidence_interval_t_mean_groups(data, starts=starts, level=0.9, 
+                                                             **ci_kw)
+            for i, (i1, i2) in enumerate(zip(starts, ends)):
+                for j in range(data.shape[1]):
+                    ci = mt.confidence_interval_t_mean(data[i1:i2, j], level=0.9, **ci_kw)
+                    assert np.isclose(low[i, j], ci[0])
+                    assert np.isclose(high[i, j], ci[1])
+
+
+    def test_confidence_interval_bootstrap_mean_groups(self):
+        rng = np.random.default_rng(42)
+        data = rng.gamma(2, size=(5, 40))
+        bootstrap_kw = {'n_resamples':5000, 'random_state':0}
+
+        # Results should be reproducible and independent of the number of processes
+        ci1 = mt.confidence_interval_bootstrap_mean_groups(data, bootstrap_kw=bootstrap_kw)
+        ci2 = mt.confidence_interval_bootstrap_mean_groups(data, bootstrap_kw=bootstrap_kw, 
+                                                           nprocs=2)
+        assert np.array_equal(ci1[0], ci2[0])
+        assert np.array_equal(ci1[1], ci2[1])
+
+        # Bounds should be close to scipy.stats.bootstrap() (differences arise from sampling)
+        for method in ['BCa', 'percentile']:
+            bootstrap_kw['method'] = method
+            low, high = mt.confidence_interval_bootstrap_mean_groups(data, bootstrap_kw=bootstrap_kw)
+            for i in range(data.shape[0]):
+                truth = ss.bootstrap((data[i],), np.mean, **bootstrap_kw).confidence_interval
+                width = truth.high - truth.low
+                assert np.abs(low[i] - truth.low) < 0.1 * width
+                assert np.abs(high[i] - truth.high) < 0.1 * width
+
+
+    def test_block_bootstrap(self):
+
+        # AR(1) data should have longer blocks than uncorrelated data
+        rng = np.random.default_rng(42)
+        noise = rng.normal(size=(200, 2))
+        ar1 = np.zeros(noise.shape)
+        for i in range(1, 200):
+            ar1[i] = 0.8 * ar1[i-1] + noise[i]
+        assert mt.block_length_auto(ar1, 200) > mt.block_length_auto(noise, 200)
+
+        # Moving blocks should be made up of consecutive indices
+        idx = mt.resample_indices(20, 10, rng, block='moving', block_length=5)
+        assert idx.shape == (10, 20)
+        assert np.all(np.diff(idx.reshape(10, 4, 5), axis=2) == 1)
+
+        # Simulations with the same random_state and block_lengths share resample indices, so 
+        # shifting the data shifts the confidence interval by the same amount
+        for block in ['moving', 'stationary']:
+            bootstrap_kw = {'n_resamples':2000, 'method':'percentile', 'random_state':3, 
+                            'block':block, 'block_lengths':{}}
+            ci1 = mt.confidence_interval_bootstrap_mean_groups(ar1.T, bootstrap_kw=bootstrap_kw)
+            ci2 = mt.confidence_interval_bootstrap_mean_groups(noise.T + 2, 
+                                                               bootstrap_kw=bootstrap_kw)
+            ci3 = mt.confidence_interval_bootstrap_mean_groups(ar1.T + 2, bootstrap_kw=bootstrap_kw)
+            assert list(bootstrap_kw['block_lengths'].keys()) == [200]
+            assert np.allclose(ci3[0], ci1[0] + 2)
+            assert np.allclose(ci3[1], ci1[1] + 2)
+
+            # Autocorrelated data should give wider confidence intervals than uncorrelated data
+            assert np.all((ci1[1] - ci1[0]) > (ci2[1] - ci2[0]))
+
+
+    def test_read_ascii_cache(self, tmp_path):
+        pwd = os.getcwd()
+        ua_output_dir = f'{pwd}/cases/truth/upper_air/output/GridStat/'
+        fnames = []
+        for f in sorted(glob.glob(f"{ua_output_dir}/*000000L*sl1l2.txt"))[:3]:
+            fnames.append(f"{tmp_path}/{os.path.basename(f)}")
+            with open(f, 'r') as fin, open(fnames[-1], 'w') as fout:
+                fout.write(fin.read())
+        cache_kw = {'cache_dir':f"{tmp_path}/cache", 'fmt':'pickle'}
+
+        # First read populates the cache, second read uses the cache
+        truth = mt.read_ascii(fnames)
+        df1 = mt.read_ascii(fnames, cache=True, cache_kw=cache_kw)
+        assert len(os.listdir(f"{tmp_path}/cache")) == 3
+        df2 = mt.read_ascii(fnames, cache=True, cache_kw=cache_kw)
+        pd.testing.assert_frame_equal(truth, df1)
+        pd.testing.assert_frame_equal(truth, df2)
+
+        # Changing a MET file invalidates the cache entry for that file only
+        with open(fnames[0], 'r') as fptr:
+            lines = fptr.readlines()
+        with open(fnames[0], 'w') as fptr:
+            fptr.write(''.join(lines[:2]))
+        df3 = mt.read_ascii(fnames, cache=True, cache_kw=cache_kw)
+        assert len(df3) == len(truth) - len(lines) + 2
+        assert len(os.listdir(f"{tmp_path}/cache")) == 3
+
+        # Requesting a column that is not in the MET file raises an error without rewriting the 
+        # cache file
+        cache_name = mt.cache_fname(fnames[1], cache_dir=f"{tmp_path}/cache", fmt='pickle')
+        inode = os.stat(cache_name).st_ino
+        with pytest.raises(KeyError, match='NOPE'):
+            mt.read_ascii(fnames[1:2], cache=True, cache_kw=cache_kw, usecols=['TOTAL', 'NOPE'])
+        assert os.stat(cache_name).st_ino == inode
+
+        # Size cap removes the least recently used files
+        mt.evict_cache(f"{tmp_path}/cache", 1)
+        assert len(os.listdir(f"{tmp_path}/cache")) == 0
+
+        # Files with the same name in different directories (e.g., control and experiment) do not
+        # remove each other's cache entries
+        fnames2 = []
+        for sim in ['ctrl', 'exp']:
+            os.makedirs(f"{tmp_path}/{sim}")
+            fnames2.append(f"{tmp_path}/{sim}/{os.path.basename(fnames[1])}")
+            with open(fnames[1], 'r') as fin, open(fnames2[-1], 'w') as fout:
+                fout.write(fin.read())
+        for f in fnames2:
+            mt.read_ascii([f], cache=True, cache_kw=cache_kw)
+        assert len(os.listdir(f"{tmp_path}/cache")) == 2
+        for f in fnames2:
+            assert os.path.isfile(mt.cache_fname(f, cache_dir=f"{tmp_path}/cache", fmt='pickle'))
+
+
+    def test_read_ascii_parallel(self):
+        pwd = os.getcwd()
+        ua_output_dir = f'{pwd}/cases/truth/upper_air/output/GridStat/'
+        fnames = sorted(glob.glob(f"{ua_output_dir}/*sl1l2.txt"))
+        fnames.insert(5, f"{ua_output_dir}/missing_sl1l2.txt")
+
+        serial_df = mt.read_ascii(fnames)
+        for chunksize in [None, 1, 7]:
+            parallel_df = mt.read_ascii(fnames, nprocs=3, chunksize=chunksize)
+            pd.testing.assert_frame_equal(serial_df, parallel_df)
+
+
+    def test_read_stat(self):
+        pwd = os.getcwd()
+        precip_dir = f'{pwd}/cases/truth/precip_radar/2022042921/output/GridStat/2022042921'
+        stat_fnames = sorted(glob.glob(f"{precip_dir}/*.stat"))
+        stat_dfs = mt.read_stat(stat_fnames)
+        assert sorted(stat_dfs.keys()) == ['ctc', 'cts']
+
+        # Output from .stat files should match the output from the line-type-specific files
+        for lt in ['ctc', 'cts']:
+            truth = mt.read_ascii([f"{f[:-5]}_{lt}.txt" for f in stat_fnames])
+            pd.testing.assert_frame_equal(truth.reset_index(drop=True),
+                                          stat_dfs[lt].reset_index(drop=True))
+            stat_df = mt.read_ascii(stat_fnames, line_type=lt)
+            pd.testing.assert_frame_equal(truth, stat_df)
+
+
+    def test_read_ascii_compact(self, sample_ua_met_sl1l2):
+        pwd = os.getcwd()
+        ua_output_dir = f'{pwd}/cases/truth/upper_air/output/GridStat/'
+        compact_df = mt.read_ascii(glob.glob(f"{ua_output_dir}/*sl1l2.txt"), compact=True)
+
+        assert isinstance(compact_df['FCST_VAR'].dtype, pd.CategoricalDtype)
+        assert (compact_df.memory_usage(deep=True).sum() <
+                sample_ua_met_sl1l2.memory_usage(deep=True).sum())
+        pd.testing.assert_frame_equal(sample_ua_met_sl1l2, compact_df, check_dtype=False,
+                                      check_categorical=False)
+
+        # Statistics should not change
+        param = {'FCST_VAR':'TMP', 'FCST_LEAD':0}
+        stat_df = mt.compute_stats_entire_df(mt.subset_verif_df(sample_ua_met_sl1l2, param))
+        compact_stat_df = mt.compute_stats_entire_df(mt.subset_verif_df(compact_df, param))
+        assert np.isclose(stat_df['RMSE'], compact_stat_df['RMSE'])
+
+
+    def test_read_ascii_filters(self, sample_ua_met_sl1l2):
+        pwd = os.getcwd()
+        ua_output_dir = f'{pwd}/cases/truth/upper_air/output/GridStat/'
+        fnames = glob.glob(f"{ua_output_dir}/*sl1l2.txt")
+        param = {'FCST_VAR':'TMP', 'FCST_LEV':'P500', 'FCST_LEAD':1e4, 'not_VX_MASK':'NONE'}
+        cols = ['FCST_VALID_BEG', 'TOTAL', 'FFBAR', 'FOBAR', 'OOBAR']
+
+        truth = mt.subset_verif_df(sample_ua_met_sl1l2, param)
+        filter_df = mt.read_ascii(fnames, usecols=cols, filters=param)
+        assert len(filter_df) == len(truth)
+        assert list(filter_df.columns) == cols + ['FCST_VAR', 'FCST_LEV', 'FCST_LEAD', 'VX_MASK']
+        for c in filter_df.columns:
+            assert np.all(filter_df[c].values == truth[c].values)
+
+        # Filters on columns that are not in the file raise a KeyError naming the column
+        with pytest.raises(KeyError, match='FOO'):
+            mt.read_ascii(fnames[:1], filters={'FCST_VAR':'TMP', 'FOO':'BAR'})
+
+
+    def test_met_fnames_catalog(self, tmp_path):
+        pwd = os.getcwd()
+        precip_dir = f'{pwd}/cases/truth/precip_radar'
+        catalog = mt.build_catalog(precip_dir)
+        assert len(catalog) == len(glob.glob(f"{precip_dir}/*/output/GridStat/*/grid_stat*"))
+        cat_fname = str(tmp_path / 'catalog.pkl')
+        mt.save_catalog(catalog, cat_fname)
+
+        # Files in nested directories are found using the catalog. If the line-type-specific file 
+        # is missing, the .stat file is used instead
+        sim = {'dir':precip_dir, 'catalog':cat_fname}
+        valid = [dt.datetime(2022, 4, 29, 22), dt.datetime(2022, 4, 30, 9)]
+        lead = [1, 12]
+        ctc_fnames = mt.met_fnames(sim, 'grid_stat_FV3_vs_NR', lead, valid, 'ctc')
+        assert ctc_fnames == [f"{precip_dir}/2022042921/output/GridStat/2022042921/grid_stat_FV3_vs_NR_010000L_20220429_220000V_ctc.txt",
+                              f"{precip_dir}/2022042921/output/GridStat/2022042921/grid_stat_FV3_vs_NR_120000L_20220430_090000V_ctc.txt"]
+        nbr_fnames = mt.met_fnames(sim, 'grid_stat_FV3_vs_NR', lead, valid, 'nbrcnt')
+        assert [f[-5:] for f in nbr_fnames] == ['.stat', '.stat']
+
+        # Without a catalog, the default file names are used
+        assert (mt.met_fnames({'dir':precip_dir}, 'grid_stat_FV3_vs_NR', lead, valid, 'ctc')[0] ==
+                f"{precip_dir}/grid_stat_FV3_vs_NR_010000L_20220429_220000V_ctc.txt")
+
+
+    def test_verif_session(self):
+        pwd = os.getcwd()
+        ua_output_dir = f'{pwd}/cases/truth/upper_air/output/GridStat/'
+        fnames = sorted(glob.glob(f"{ua_output_dir}/*sl1l2.txt"))
+        session = mt.VerifSession(max_entries=2)
+
+        # Repeated reads return the same DataFrame
+        df1 = session.read(fnames[:2], filters={'FCST_VAR':'TMP'})
+        df2 = session.read(fnames[:2], filters={'FCST_VAR':'TMP'}, verbose=True)
+        assert df1 is df2
+        assert session.hits == 1
+        assert session.misses == 1
+        pd.testing.assert_frame_equal(df1, mt.read_ascii(fnames[:2], filters={'FCST_VAR':'TMP'}))
+        assert session.indexed(fnames[:2], filters={'FCST_VAR':'TMP'}).df is df1
+
+        # Least recently used DataFrames are evicted
+        session.read(fnames[2:4])
+        session.read(fnames[:2], filters={'FCST_VAR':'TMP'})
+        session.read(fnames[4:6])
+        assert len(session) == 2
+        assert session.key(fnames[2:4], {}) not in session.entries
+        assert session.key(fnames[:2], {'filters':{'FCST_VAR':'TMP'}}) in session.entries
+
+
     def test_subset_verif_df(self, sample_ua_met_sl1l2):
         cond = [{'FCST_LEAD': 0},
                 {'FCST_VAR': 'TMP'},
@@ -59,6 +300,20 @@ class TestMETtools():
                 assert np.all(subset[key] == d[key])
 
 
+    def test_indexed_verif_df(self, sample_ua_met_sl1l2):
+        indexed_df = mt.IndexedVerifDF(sample_ua_met_sl1l2)
+        cond = [{'FCST_LEAD':0, 'FCST_VAR':'TMP', 'FCST_LEV':'P500', 'OBTYPE':'NR', 
+                 'VX_MASK':'FULL'},
+                {'FCST_LEAD':1e4, 'FCST_VAR':'TMP'},
+                {'FCST_VAR':'TMP', 'not_FCST_LEV':'P500'},
+                {'FCST_VAR':'FOO'},
+                {'FCST_UNITS':'K'}]
+        for d in cond:
+            truth = mt.subset_verif_df(sample_ua_met_sl1l2, d)
+            subset = mt.subset_verif_df(indexed_df, d, copy=False)
+            assert truth.equals(subset)
+
+
     def test_compute_stats_sl1l2(self, sample_ua_met_sl1l2):
         ua_met_stats = mt.compute_stats(sample_ua_met_sl1l2)
 
@@ -68,6 +323,25 @@ class TestMETtools():
             assert stat not in sample_ua_met_sl1l2
 
 
+    def test_compute_stats_lazy(self, sample_ua_met_sl1l2):
+        all_stats = mt.compute_stats(sample_ua_met_sl1l2)
+
+        # Only the requested statistics should be added (dependencies like MSE are not)
+        rmse_df = mt.compute_stats(sample_ua_met_sl1l2, stats=['RMSE'])
+        assert 'RMSE' in rmse_df.columns
+        assert 'MSE' not in rmse_df.columns
+        assert np.allclose(rmse_df['RMSE'].values, all_stats['RMSE'].values, equal_nan=True)
+
+        # Check ME and ESTDEV
+        err_df = mt.compute_stats(sample_ua_met_sl1l2, stats=['ME', 'ESTDEV'])
+        n = sample_ua_met_sl1l2['TOTAL'].values
+        me = sample_ua_met_sl1l2['FBAR'].values - sample_ua_met_sl1l2['OBAR'].values
+        var = (all_stats['MSE'].values - me**2) * n / (n - 1)
+        assert np.allclose(err_df['ME'].values, me)
+        assert np.allclose(err_df['ESTDEV'].values[n > 1], np.sqrt(var[n > 1]), equal_nan=True)
+        assert 'ESTDEV' not in sample_ua_met_sl1l2
+
+
     def test_compute_stats_diff(self, sample_ua_met_sl1l2, sample_ua_uas_met_sl1l2):
         diff_df = mt.compute_stats_diff(sample_ua_met_sl1l2, sample_ua_uas_met_sl1l2)
         diff_df2 = mt.compute_stats_diff(sample_ua_uas_met_sl1l2, sample_ua_met_sl1l2)
@@ -82,6 +356,47 @@ class TestMETtools():
         assert np.all(np.abs(diff_df['RMSE'].values - RMSE_diff) < 1e-6)
         assert np.all(np.abs(diff_df2['RMSE'].values - RMSE_diff2) < 1e-6)
 
+        # Rows without exactly one match are dropped and percent differences use the second DF
+        dup_df = pd.concat([ua_uas_subset, ua_uas_subset.iloc[:10]])
+        diff_dup = mt.compute_stats_diff(sample_ua_met_sl1l2, dup_df, pct=True)
+        assert len(diff_dup) == (len(diff_df) - 10)
+        assert list(diff_dup.columns) == ['DESC', 'RMSE', 'FCST_LEAD', 'FCST_VAR', 
+                                          'FCST_VALID_BEG', 'FCST_LEV', 'FCST_UNITS', 'VX_MASK']
+        pct_diff = 1e2 * RMSE_diff[10:] / ua_uas_met_stats['RMSE'].values[10:]
+        assert np.all(np.abs(diff_dup['RMSE'].values - pct_diff) < 1e-6)
+
+
+
+    def test_control_stats_cache(self, sample_ua_met_sl1l2, sample_ua_uas_met_sl1l2, monkeypatch):
+        calls = []
+        compute_stats = mt.compute_stats
+        def counting_compute_stats(df, **kw):
+            calls.append(id(df))
+            return compute_stats(df, **kw)
+        monkeypatch.setattr(mt, 'compute_stats', counting_compute_stats)
+
+        # Control statistics are only computed once for several experiments
+        indexed_ctrl = mt.IndexedVerifDF(sample_ua_uas_met_sl1l2)
+        param = {'FCST_VAR':'TMP', 'VX_MASK':'FULL'}
+        ctrl = mt.subset_verif_df(indexed_ctrl, param, copy=False)
+        assert mt.subset_verif_df(indexed_ctrl, param, copy=False) is ctrl
+        assert mt.subset_verif_df(indexed_ctrl, param, copy=True) is not ctrl
+        exps = [sample_ua_met_sl1l2, sample_ua_met_sl1l2.copy()]
+        diffs = [mt.compute_stats_diff(e, ctrl) for e in exps]
+        assert calls.count(id(ctrl)) == 1
+        assert diffs[0].equals(diffs[1])
+
+        # Different statistics are cached separately
+        diff_pct = mt.compute_stats_diff(exps[0], ctrl, var=['RMSE', 'BIAS_DIFF'], pct=True)
+        assert calls.count(id(ctrl)) == 2
+        assert np.allclose(diff_pct['RMSE'].values, 1e2 * diffs[0]['RMSE'].values / 
+                           mt.compute_stats(ctrl)['RMSE'].values)
+
+        # The cache is bounded
+        for _ in range(mt.CTRL_STATS_CACHE_MAX + 1):
+            mt.compute_stats_diff(exps[0], ctrl.copy())
+        assert len(mt.CTRL_STATS_CACHE) == mt.CTRL_STATS_CACHE_MAX
+
     
     def test_compute_stats_entire_df(self, sample_ua_met_sl1l2):
 
@@ -177,6 +492,89 @@ class TestMETtools():
 
         assert np.isclose(agg_RMSE, stat_df['RMSE']) 
 
+        # Empty DataFrames (e.g., a missing lead time) give a single line of NaNs
+        empty_df = ua_subset.iloc[:0]
+        for kw in [{'agg':True}, {'agg':True, 'verif_df2':empty_df}, {'ci':True}]:
+            stat_df = mt.compute_stats_entire_df(empty_df, line_type='sl1l2', **kw)
+            assert len(stat_df) == 1
+            assert stat_df['TOTAL'].values[0] == 0
+            assert np.isnan(stat_df['RMSE'].values[0])
+        assert np.isnan(stat_df['low_RMSE'].values[0])
+
+
+    def test_compute_stats_ctc(self):
+        pwd = os.getcwd()
+        precip_dir = f'{pwd}/cases/truth/precip_radar/2022042921/output/GridStat/2022042921'
+        ctc_df = mt.read_ascii(sorted(glob.glob(f"{precip_dir}/*_ctc.txt")))
+        cts_df = mt.read_ascii(sorted(glob.glob(f"{precip_dir}/*_cts.txt")))
+
+        # Statistics computed from the counts should match those output by MET
+        stat_df = mt.compute_stats(ctc_df, line_type='ctc')
+        for s1, s2 in zip(['CSI', 'PODY', 'FAR', 'FBIAS', 'ETS'], 
+                          ['CSI', 'PODY', 'FAR', 'FBIAS', 'GSS']):
+            assert np.allclose(stat_df[s1].values, cts_df[s2].values, atol=1e-4, equal_nan=True)
+
+        # Aggregated statistics should be computed from the summed counts
+        agg_df = mt.compute_stats_by_group(ctc_df, ['FCST_THRESH'], line_type='ctc', agg=True)
+        for i, thresh in enumerate(agg_df['FCST_THRESH']):
+            subset = ctc_df.loc[ctc_df['FCST_THRESH'] == thresh]
+            hits = subset['FY_OY'].sum()
+            assert agg_df['TOTAL'].values[i] == subset['TOTAL'].sum()
+            assert np.isclose(agg_df['CSI'].values[i], 
+                              hits / (hits + subset['FY_ON'].sum() + subset['FN_OY'].sum()))
+
+
+    def test_compute_stats_nbrcnt_agg(self):
+        nbr_df = pd.DataFrame({'TOTAL':[100, 300, 200], 
+                               'FBS':[0., 0.1, 0.05], 
+                               'FSS':[1., 0.5, 0.75],
+                               'F_RATE':[0.2, 0.3, 0.1],
+                               'O_RATE':[0.2, 0.25, 0.15]})
+
+        # A perfect score (FSS = 1) should not make the aggregated FSS undefined
+        agg_df = mt.compute_stats_entire_df(nbr_df, line_type='nbrcnt', agg=True)
+        den = np.array([0.2**2 + 0.2**2, 0.1 / 0.5, 0.05 / 0.25])
+        wgt = nbr_df['TOTAL'].values
+        truth = 1. - np.sum(nbr_df['FBS'].values * wgt) / np.sum(den * wgt)
+        assert np.isclose(agg_df['FSS'].values[0], truth)
+
+        # Aggregating a single line recovers the FSS output by MET
+        agg_df = mt.compute_stats_entire_df(nbr_df.iloc[1:2], line_type='nbrcnt', agg=True)
+        assert np.isclose(agg_df['FSS'].values[0], 0.5)
+
+
+    def test_compute_stats_by_group(self, sample_ua_met_sl1l2, sample_ua_uas_met_sl1l2):
+
+        # Only retain TMP forecasts
+        ua_subset = mt.subset_verif_df(sample_ua_met_sl1l2, {'FCST_VAR':'TMP'})
+        ua_uas_subset = mt.subset_verif_df(sample_ua_uas_met_sl1l2, 
+                                           {'FCST_VAR':'TMP', 'VX_MASK':'FULL'})
+
+        # Results for each group should match compute_stats_entire_df()
+        for kw in [{'agg':False}, {'agg':True}, {'agg':False, 'verif_df2':ua_uas_subset}, 
+                   {'agg':True, 'verif_df2':ua_uas_subset}, {'ci':True, 'ci_opt':'t_dist'}]:
+            group_df = mt.compute_stats_by_group(ua_subset, ['FCST_LEV'], ci_var=['RMSE'], **kw)
+            assert len(group_df) == len(ua_subset['FCST_LEV'].unique())
+            for lev in group_df['FCST_LEV']:
+                kw_1lev = kw.copy()
+                if 'verif_df2' in kw:
+                    kw_1lev['verif_df2'] = mt.subset_verif_df(kw['verif_df2'], {'FCST_LEV':lev})
+                stat_df = mt.compute_stats_entire_df(mt.subset_verif_df(ua_subset, {'FCST_LEV':lev}), 
+                                                     **kw_1lev)
+                cols = ['RMSE']
+                if 'ci' in kw:
+                    cols = cols + ['low_RMSE', 'high_RMSE']
+                for c in cols:
+                    assert np.isclose(group_df.loc[group_df['FCST_LEV'] == lev, c].values[0], 
+                                      stat_df[c].values[0])
+
+        # Statistics that are differenced are computed even if they are not in stats
+        for agg in [False, True]:
+            group_df = mt.compute_stats_by_group(ua_subset, ['FCST_LEV'], verif_df2=ua_uas_subset,
+                                                 agg=agg, diff_kw={'var':['RMSE', 'BIAS_DIFF']},
+                                                 stats=['RMSE'])
+            assert np.all(np.isfinite(group_df['BIAS_DIFF']))
+
 
     def test_compute_stats_vert_avg(self, sample_ua_met_sl1l2):
 
@@ -208,6 +606,31 @@ class TestMETtools():
         assert np.all(np.isclose(mean_RMSE, stat_df['RMSE']))
 
 
+    def test_compute_stats_vert_avg_weighted(self, sample_ua_met_sl1l2):
+
+        # Use all forecast variables and lead times. Only combinations in the input DataFrame 
+        # should be included in the output
+        stat_df = mt.compute_stats_vert_avg(sample_ua_met_sl1l2, vmin=850, vmax=1000, 
+                                            thickness_weight=True)
+        combos = sample_ua_met_sl1l2[['FCST_LEAD', 'FCST_VALID_BEG', 'FCST_VAR', 
+                                      'OBTYPE']].drop_duplicates()
+        assert len(stat_df) == len(combos)
+
+        # Compute thickness-weighted RMSE offline (P850 and P1000 represent half the layer that 
+        # P925 represents)
+        t = stat_df['FCST_VALID_BEG'].values[0]
+        ua_met_stats = mt.compute_stats(mt.subset_verif_df(sample_ua_met_sl1l2, 
+                                                           {'FCST_VALID_BEG':t, 
+                                                            'FCST_LEAD':stat_df['FCST_LEAD'].values[0],
+                                                            'FCST_VAR':stat_df['FCST_VAR'].values[0]}))
+        wgt = {'P850':0.25, 'P925':0.5, 'P1000':0.25}
+        wgt_RMSE = 0
+        for lev in wgt:
+            wgt_RMSE = wgt_RMSE + wgt[lev] * ua_met_stats.loc[ua_met_stats['FCST_LEV'] == lev, 'RMSE'].values[0]
+
+        assert np.isclose(wgt_RMSE, stat_df['RMSE'].values[0])
+
+
     def test_compute_stats_vert_avg_diff(self, sample_ua_met_sl1l2, sample_ua_uas_met_sl1l2):
 
         # Only retain 0-hr TMP forecasts
@@ -245,6 +668,104 @@ class TestMETtools():
         assert np.all(np.isclose(mean_RMSE_diff, stat_df['RMSE']))
 
 
+    def test_build_cube(self, sample_ua_met_sl1l2, sample_ua_uas_met_sl1l2):
+        dfs = {'ctrl':mt.subset_verif_df(sample_ua_met_sl1l2, {'VX_MASK':'FULL'}),
+               'uas':mt.subset_verif_df(sample_ua_uas_met_sl1l2, {'VX_MASK':'FULL'})}
+        cube = mt.build_cube(dfs, line_type='sl1l2')
+        assert cube.dims == ['sim'] + mt.CUBE_DIMS
+        assert cube.shape == tuple(len(cube.coords[d]) for d in cube.dims)
+        stats = cube.stats(['RMSE'])
+        assert 'MSE' not in stats.fields
+
+        # Time series are aligned with the valid times. Missing valid times are NaN
+        param = {'FCST_LEAD':10000, 'FCST_LEV':'P500', 'FCST_VAR':'TMP'}
+        ts = stats.sel(sim='ctrl', **param)
+        assert ts.dims == ['FCST_VALID_BEG']
+        truth = mt.compute_stats(mt.subset_verif_df(dfs['ctrl'], param), stats=['RMSE'])
+        truth = truth.set_index('FCST_VALID_BEG')['RMSE']
+        for t, val in zip(ts.coords['FCST_VALID_BEG'], ts.fields['RMSE']):
+            if t in truth.index:
+                assert np.isclose(val, truth[t])
+            else:
+                assert np.isnan(val)
+
+        # Die-off curves (averaged statistics or aggregated partial sums)
+        red_df = mt.subset_verif_df(dfs['ctrl'], {'FCST_LEV':'P500', 'FCST_VAR':'TMP'})
+        for agg in [False, True]:
+            if agg:
+                dieoff = cube.aggregate('FCST_VALID_BEG').stats(['RMSE'])
+            else:
+                dieoff = stats.mean('FCST_VALID_BEG')
+            dieoff = dieoff.sel(sim='ctrl', FCST_LEV='P500', FCST_VAR='TMP')
+            truth = mt.compute_stats_by_group(red_df, ['FCST_LEAD'], agg=agg, stats=['RMSE'])
+            assert np.allclose(dieoff.fields['RMSE'], truth['RMSE'].values)
+            assert np.allclose(dieoff.fields['TOTAL'], truth['TOTAL'].values)
+
+        # Points along a single forecast (sawtooth diagrams)
+        pts = stats.sel_points(FCST_LEAD=[0, 10000, 10000], 
+                               FCST_VALID_BEG=['20220429_210000', '20220429_220000', 
+                                               '20990101_000000'])
+        pts = pts.sel(sim='uas', FCST_LEV='P500', FCST_VAR='TMP')
+        assert pts.dims == ['point']
+        assert np.isclose(pts.fields['RMSE'][1], 
+                          stats.sel(sim='uas', FCST_LEAD=10000, FCST_VALID_BEG='20220429_220000', 
+                                    FCST_LEV='P500', FCST_VAR='TMP').fields['RMSE'])
+        assert np.isnan(pts.fields['RMSE'][2])
+
+        # Only non-missing entries are included in the DataFrame
+        df = stats.sel(sim='ctrl').to_dataframe()
+        assert len(df) == len(dfs['ctrl'])
+
+
+    @pytest.mark.parametrize('ext', ['npz', 'nc'])
+    def test_save_cube(self, sample_ua_met_sl1l2, tmp_path, ext):
+
+        # NetCDF files are written using xarray, which is optional
+        if ext == 'nc':
+            pytest.importorskip('xarray')
+
+        cube = mt.build_cube(mt.subset_verif_df(sample_ua_met_sl1l2, {'VX_MASK':'FULL'}))
+        fname = str(tmp_path / f'cube.{ext}')
+        mt.save_cube(cube, fname)
+        new_cube = mt.load_cube(fname)
+        assert new_cube.dims == cube.dims
+        assert new_cube.line_type == 'sl1l2'
+        for d in cube.dims:
+            assert np.all(new_cube.coords[d] == cube.coords[d])
+        for f in cube.fields:
+            assert np.array_equal(new_cube.fields[f], cube.fields[f], equal_nan=True)
+
+
+    def test_compute_scorecard(self, sample_ua_met_sl1l2, sample_ua_uas_met_sl1l2):
+        verif_df = {'ctrl':sample_ua_met_sl1l2, 'uas':sample_ua_uas_met_sl1l2, 
+                    'same':sample_ua_met_sl1l2}
+        scorecard = mt.compute_scorecard(verif_df, 'ctrl', stats=['RMSE', 'BIAS_DIFF'])
+        assert sorted(np.unique(scorecard['sim'])) == ['same', 'uas']
+
+        # Check one cell against compute_stats_entire_df()
+        param = {'FCST_VAR':'TMP', 'FCST_LEV':'P500', 'FCST_LEAD':10000, 'VX_MASK':'FULL'}
+        truth = mt.compute_stats_entire_df(mt.subset_verif_df(sample_ua_uas_met_sl1l2, param), 
+                                           verif_df2=mt.subset_verif_df(sample_ua_met_sl1l2, 
+                                                                        param),
+                                           diff_kw={'var':['RMSE']}, ci=True)
+        cell = scorecard.loc[(scorecard['sim'] == 'uas') & (scorecard['stat'] == 'RMSE')]
+        for k in param:
+            cell = cell.loc[cell[k] == param[k]]
+        assert len(cell) == 1
+        assert np.isclose(cell['diff'].values[0], truth['RMSE'].values[0])
+        assert np.isclose(cell['ci_low'].values[0], truth['low_RMSE'].values[0])
+        assert np.isclose(cell['ci_high'].values[0], truth['high_RMSE'].values[0])
+
+        # Lower RMSE is better
+        sig = scorecard.loc[(scorecard['stat'] == 'RMSE') & (scorecard['score'] != 0)]
+        assert np.all(np.sign(sig['diff']) == -sig['score'])
+
+        # An experiment that is identical to the control is never significantly different
+        same = scorecard.loc[scorecard['sim'] == 'same']
+        assert np.allclose(same['diff'], 0)
+        assert np.all(same['score'] == 0)
+
+
 """
 End test_metplus_tools.py
 """
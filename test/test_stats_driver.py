@@ -0,0 +1,133 @@
+"""
+Tests for stats_driver.py
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+import pandas as pd
+import os
+import sys
+import glob
+import subprocess
+import datetime as dt
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+import metplus_OSSE_scripts.plotting.stats_driver as sdrv
+
+
+#---------------------------------------------------------------------------------------------------
+# Fixtures
+#---------------------------------------------------------------------------------------------------
+
+@pytest.fixture(scope='module')
+def ua_param():
+
+    pwd = os.getcwd()
+    tmp_dict = {'plot_lvl':['P500'],
+                'prs_limit':[1050, 80],
+                'plot_stat':['RMSE', 'TOTAL'],
+                'kwargs':{'file_prefix':'grid_stat_FV3_TMP_vs_NR_TMP',
+                          'line_type':'sl1l2',
+                          'diffs':True,
+                          'diff_kw':{'var':['RMSE', 'TOTAL']},
+                          'include_zero':True,
+                          'plot_param':{'OBTYPE':'NR', 'FCST_VAR':'TMP', 'VX_MASK':'FULL'}}}
+    param = {'verif_type':'GridStat',
+             'sim_dict':{'ctrl':{'dir':f'{pwd}/cases/truth/{{subtyp}}/output/{{typ}}',
+                                 'ctrl':True},
+                         'uas':{'dir':f'{pwd}/cases/truth/{{subtyp}}_uas/output/{{typ}}',
+                                'ctrl':False}},
+             'out_dir':pwd,
+             'out_tag':'test',
+             'valid_time_start':dt.datetime(2022, 4, 29, 21),
+             'valid_time_step':1,
+             'valid_time_end_hr':12,
+             'valid_time_ua_start':dt.datetime(2022, 4, 29, 21),
+             'valid_time_ua_step':1,
+             'valid_time_ua_end_hr':12,
+             'itime_exclude':[None],
+             'vtime_exclude':[dt.datetime(2022, 4, 30, 8)],
+             'ci_kw':{'ci':True, 'ci_lvl':0.95, 'ci_opt':'t_dist', 'ci_kw':{}},
+             'fcst_lead_dieoff':[0, 1],
+             'fcst_lead_other':[1],
+             'plot_dict':{'surface':None, 'upper_air':{'upper_air':{'TMP':tmp_dict}}}}
+
+    return param
+
+
+#---------------------------------------------------------------------------------------------------
+# Tests
+#---------------------------------------------------------------------------------------------------
+
+class TestStatsDriver():
+
+    def test_no_matplotlib(self):
+
+        # Run in a new process so that modules imported by other tests are not included
+        code = ('import sys; import metplus_OSSE_scripts.plotting.stats_driver; '
+                'print([m for m in sys.modules if m.split(".")[0] == "matplotlib" or '
+                'm == "scipy.stats"])')
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                             check=True)
+        assert out.stdout.strip() == '[]'
+
+
+    def test_create_tables(self, ua_param, tmp_path):
+
+        tables = sdrv.create_tables(ua_param)
+        assert sorted(tables.keys()) == [('upper_air', 'dieoff'), ('upper_air', 'timeseries'),
+                                         ('upper_air', 'vprof')]
+
+        # Check die-off statistics against compute_stats_entire_df()
+        pwd = os.getcwd()
+        vtimes = [(dt.datetime(2022, 4, 29, 21) + dt.timedelta(hours=i)).strftime('%Y%m%d_%H%M%S')
+                  for i in range(12) if i != 11]
+        verif_df = {}
+        for sim, subdir in zip(['ctrl', 'uas'], ['upper_air', 'upper_air_uas']):
+            fnames = sorted(glob.glob(f'{pwd}/cases/truth/{subdir}/output/GridStat/*sl1l2.txt'))
+            df = mt.read_ascii(fnames, verbose=False)
+            verif_df[sim] = df.loc[(df['FCST_VAR'] == 'TMP') & (df['FCST_LEV'] == 'P500') &
+                                   (df['FCST_LEAD'] == 10000) &
+                                   df['FCST_VALID_BEG'].isin(vtimes)].copy()
+        dieoff = tables[('upper_air', 'dieoff')]
+        dieoff = dieoff.loc[(dieoff['FCST_LEAD'] == 10000) & (dieoff['stat'] == 'RMSE')]
+        assert np.all(dieoff['plot_var'] == 'TMP')
+        ctrl = mt.compute_stats_entire_df(verif_df['ctrl'], ci=True, ci_opt='t_dist')
+        row = dieoff.loc[dieoff['sim'] == 'ctrl']
+        assert np.isclose(row['value'].values[0], ctrl['RMSE'].values[0])
+        assert np.isclose(row['ci_low'].values[0], ctrl['low_RMSE'].values[0])
+        diff = mt.compute_stats_entire_df(verif_df['uas'], verif_df2=verif_df['ctrl'],
+                                          diff_kw={'var':['RMSE']})
+        row = dieoff.loc[dieoff['sim'] == 'uas']
+        assert np.isclose(row['value'].values[0], diff['RMSE'].values[0])
+
+        # Confidence intervals are not computed for TOTAL or time series
+        totals = tables[('upper_air', 'dieoff')]
+        assert np.all(np.isnan(totals.loc[totals['stat'] == 'TOTAL', 'ci_low']))
+        assert np.all(np.isnan(tables[('upper_air', 'timeseries')]['ci_low']))
+
+        # Time series at 1-hr lead time skip the first valid time and the excluded valid time
+        ts = tables[('upper_air', 'timeseries')]
+        ts = ts.loc[(ts['sim'] == 'ctrl') & (ts['stat'] == 'RMSE')]
+        assert len(ts) == 10
+        assert '20220430_080000' not in ts['FCST_VALID_BEG'].astype(str).values
+
+        # Vertical profiles include all pressure levels
+        vprof = tables[('upper_air', 'vprof')]
+        assert len(vprof.loc[(vprof['sim'] == 'ctrl') & (vprof['stat'] == 'RMSE')]) == 11
+
+        # Tables can be written as CSV
+        fname = str(tmp_path / 'dieoff.csv')
+        sdrv.write_table(tables[('upper_air', 'dieoff')], fname, fmt='csv')
+        assert len(pd.read_csv(fname)) == len(tables[('upper_air', 'dieoff')])
+
+
+"""
+End test_stats_driver.py
+"""
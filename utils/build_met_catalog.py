@@ -0,0 +1,78 @@
+"""
+Create a Catalog of MET Output Files
+
+The catalog can be used by the plotting utility (via the 'catalog' key in input_sims) to find MET
+output files in nested directories (e.g., <init>/output/GridStat/<valid>/), which removes the need
+to symlink all MET output files into a single directory using link_GridStat_output.sh.
+
+shawn.s.murdzek@noaa.gov
+"""
+
+#---------------------------------------------------------------------------------------------------
+# Import Modules
+#---------------------------------------------------------------------------------------------------
+
+import datetime as dt
+import sys
+import argparse
+
+import metplus_OSSE_scripts.plotting.metplus_tools as mt
+
+
+#---------------------------------------------------------------------------------------------------
+# Main Program
+#---------------------------------------------------------------------------------------------------
+
+def parse_in_args(argv):
+    """
+    Parse input arguments
+
+    Parameters
+    ----------
+    argv : list
+        Command-line arguments from sys.argv[1:]
+
+    Returns
+    -------
+    Namespace data structure
+
+    """
+
+    parser = argparse.ArgumentParser(description='This script creates a catalog of all the MET \
+                                                  output files within an experiment directory. \
+                                                  Symlinks are not included in the catalog.')
+
+    # Positional arguments
+    parser.add_argument('exp_dir',
+                        help='Experiment directory containing MET output (subdirectories are \
+                              searched).',
+                        type=str)
+
+    parser.add_argument('out_fname',
+                        help='Output catalog file. A Parquet file is written if out_fname ends in \
+                              .parquet, otherwise the catalog is pickled.',
+                        type=str)
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+
+    start = dt.datetime.now()
+    print('\nStarting build_met_catalog.py')
+    print(f"Time = {start.strftime('%Y%m%d %H:%M:%S')}\n")
+
+    # Read in input parameters
+    param = parse_in_args(sys.argv[1:])
+
+    # Create and save catalog
+    catalog = mt.build_catalog(param.exp_dir, verbose=True)
+    mt.save_catalog(catalog, param.out_fname)
+
+    print('\nProgram finished!')
+    print(f"Elapsed time = {(dt.datetime.now() - start).total_seconds()} s\n")
+
+
+"""
+End build_met_catalog.py
+"""